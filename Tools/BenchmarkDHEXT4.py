@@ -67,17 +67,19 @@ def benchmark(search_string: bool, TechniqueTreePath, ImageTreePath):
     runs = 0
     count = 0
     old_percentage = 0
-    total_runs = 4096 * 18
     hiding_method_missed, hiding_method_wrong_positive, \
         hiding_method_parameters_missed, hiding_method_parameters_wrong_positive, total, success = init_dicts()
     # 4095 hiding techniques, 10 for testing
     correct_found = 0
     TechniqueTree = ET.parse(TechniqueTreePath)
     ImageTree = ET.parse(ImageTreePath)
+    # 18 images, and the bigalloc image
+    image_count = len(ImageTree.getroot().findall('./image'))
+    total_runs = 4096 * image_count
     # Loop through all techniques
     for i in range(0, 4095):
         # Loop through all images
-        for j in range(0, 18):
+        for j in range(0, image_count):
             count += 1
             # Status updates
             percentage_done = int((count / total_runs) * 100)
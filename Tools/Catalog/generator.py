@@ -13,19 +13,22 @@ def add_technique(name: str, data: str, inode: str, group: str, techniques: ET.E
 
 
 def generate_info(block_size: str, inode_size: str,
-                   size: str, image: ET.Element):
+                   size: str, image: ET.Element, cluster_size: str = None):
     # Generates all the information about an image
     info = ET.SubElement(image, "info")
     ET.SubElement(info, "block_size").text = block_size
     ET.SubElement(info, "inode_size").text = inode_size
     ET.SubElement(info, "size").text = size
+    # Only bigalloc images have a cluster size
+    if cluster_size is not None:
+        ET.SubElement(info, "cluster_size").text = cluster_size
 
 
 def create_image(image_id: str, root: ET.Element, block_size: str,
-                 inode_size: str, size: str) -> Element:
+                 inode_size: str, size: str, cluster_size: str = None) -> Element:
     # Creates a new image entry in the catalog
     image = ET.SubElement(root, "image", id=image_id)
-    generate_info(block_size, inode_size, size, image)
+    generate_info(block_size, inode_size, size, image, cluster_size)
     return image
 
 
@@ -52,6 +55,10 @@ def generate_image_catalog():
                      str(size))
         check += 1
 
+    # Bigalloc image with 1 KiB blocks and 64 KiB clusters, on which the
+    # first data block is 0 although the superblock is stored in block 1
+    create_image(str(check), root, "1024", "256", "2048", "65536")
+
     tree = ET.ElementTree(root)
     tree.write("ImageCatalog.xml")
 
@@ -32,6 +32,10 @@ def create_image(id, tree, name="output.dd"):
         dd_cmd = "dd status=none if=/dev/zero of=" + name + " bs=" + str(block_size) + " count=" + str(count)
         # Create the image
         mkfs_cmd = "mkfs.ext4 -q -g 1248 -b " + block_size + " -I " + inode_size + " -F " + name
+        # Bigalloc images, -g is then the number of clusters per group
+        cluster_size = info.find('./cluster_size')
+        if cluster_size is not None:
+            mkfs_cmd += " -O bigalloc -C " + cluster_size.text
         # Copy a test-file to the image
         mount_cmd = "sudo mount " + name + " Catalog/MountDir/"
         cpy_cmd = "sudo cp Catalog/test.txt Catalog/MountDir/"
@@ -1,24 +1,21 @@
-import math
 import os
+import struct
 from typing import Final
 from message import Message
 import ext4
 import argparse
-
-
-def check_powers(n):
-    if n == 0 or n == 1:
-        return True
-    nums = [3, 5, 7]
-    for num in nums:
-        if math.log10(n) / math.log10(num) % 1 == 0:
-            return True
-    return False
+import bisect
+import concurrent.futures
+import errno
+import functools
 
 
 class Detect:
-    def __init__(self, file_name=None, string=None, log=False):
+    def __init__(self, file_name=None, string=None, log=False, jobs=1, offset=0):
         self.log = log
+        self.jobs = jobs
+        # Byte offset of the filesystem within the image, all other offsets are relative to the filesystem
+        self.offset = offset
         if file_name is None:
             raise FileNotFoundError
 
@@ -36,12 +33,21 @@ class Detect:
 
         self.file_name = file_name
         self.messages = []
-        self.file_name = file_name
-        self.file = open(self.file_name, "rb")
-        self.fd = os.open(self.file_name, os.O_RDONLY)
-        self.volume = ext4.Volume(self.file, offset=0)
+        # file_name is the name of the image (split raw images are opened as one stream) or an opened
+        # image stream, e.g. an ext4.SegmentedStream, which is left open
+        self.own_file = isinstance(file_name, str)
+        self.file = ext4.open_image(file_name) if self.own_file else file_name
+        # Images backed by a file are read with os.pread, other streams with their own positional reads
+        try:
+            self.fd = os.dup(self.file.fileno())
+        except (AttributeError, OSError):
+            self.fd = None
+        self.volume = ext4.Volume(self.file, offset=self.offset, lazy=True)
+        self.read_ahead = ext4.ReadAhead(self.fd)
         self.found = False
         self.techniques = []
+        # Tuples (inode number, technique) of all incidents
+        self.incidents = set()
 
         # Info
         self.superblock = self.volume.superblock
@@ -51,8 +57,10 @@ class Detect:
 
     def __del__(self):
         if hasattr(self, "file"):
-            self.file.close()
-            os.close(self.fd)
+            if self.own_file:
+                self.file.close()
+            if self.fd is not None:
+                os.close(self.fd)
 
         if not self.log:
             return
@@ -64,6 +72,28 @@ class Detect:
 
         print("No problems found.")
 
+    def pread(self, size: int, offset: int):
+        """
+        Reads size bytes at offset of the filesystem. Sequential sweeps are prefetched by the read-ahead.
+        Returns:
+            The data read
+        """
+        if self.fd is None:
+            return self.file.pread(size, self.offset + offset)
+        self.read_ahead.access(self.offset + offset, size)
+        return os.pread(self.fd, size, self.offset + offset)
+
+    def preadv(self, buffer: memoryview, offset: int):
+        """
+        Reads into buffer at offset of the filesystem. Sequential sweeps are prefetched by the read-ahead.
+        Returns:
+            Number of bytes read
+        """
+        if self.fd is None:
+            return self.file.preadv([buffer], self.offset + offset)
+        self.read_ahead.access(self.offset + offset, len(buffer))
+        return os.preadv(self.fd, [buffer], self.offset + offset)
+
     def create_incident(self, inode, msg, technique, found=False):
         """
         Creates a message object and store them in the self.messages
@@ -78,6 +108,7 @@ class Detect:
             incident = Message(inode=inode, msg=msg)
         self.found = False
         self.messages.append(incident)
+        self.incidents.add((inode, technique))
         if technique not in self.techniques:
             self.techniques.append(technique)
 
@@ -113,27 +144,25 @@ class Detect:
         """
         Checks if there is any data in the file slack of files
         """
-        n_inodes = getattr(self.superblock, "s_inodes_count")
-        for inode_n in range(n_inodes):
-            inode = self.volume.get_inode(inode_n)
-            # Check if the inode entry is a file
-            if not inode.is_file:
+        for inode_n, offset, raw in self.initialized_inodes():
+            inode = ext4.Inode(self.volume, offset, inode_n, raw=raw)
+            # Check if the inode entry is a file, inline data lives in the inode and has no block to hold slack
+            if not inode.is_file or inode.has_inline_data:
                 continue
             size = inode.__len__()
-            # Try to obtain the bitmap
+            # Try to obtain the block holding the last byte, which may lie in any extent
             try:
-                start_block = inode.open_read().block_map[0].disk_block_idx
+                end_block = inode.open_read().get_block_mapping((size - 1) // self.block_size) * self.block_size
             except:
                 continue
-            n_blocks = inode.open_read().block_map[0].block_count
-            end_block = (start_block + n_blocks - 1) * self.block_size
-            # Calculate space
+            # Calculate space, with bigalloc the slack extends to the end of the cluster
             block_used = size % self.block_size
-            if block_used == 0:
+            cluster_end = end_block + self.block_size + (-(end_block + self.block_size) % self.volume.cluster_size)
+            if block_used == 0 and cluster_end == end_block + self.block_size:
                 continue
-            location = end_block + block_used
-            size_to_read = self.block_size - block_used
-            data = os.pread(self.fd, size_to_read, location)
+            location = end_block + (block_used or self.block_size)
+            size_to_read = cluster_end - location
+            data = self.pread(size_to_read, location)
             if data != b"\x00" * size_to_read:
                 self.handle_found_data(inode_n, data, "File slack is not empty.", "file_slack")
                 return 1
@@ -147,14 +176,10 @@ class Detect:
         """
         count = 0
         osd2_offset: Final = 0x7E
-        n_inodes = getattr(self.superblock, "s_inodes_count")
-        # Loop through all the inodes
-        for n_inode in range(n_inodes):
-            # Obtain the inode
-            inode = self.volume.get_inode(n_inode)
-            offset = inode.offset + osd2_offset
+        # Loop through all the initialized inodes
+        for n_inode, offset, raw in self.initialized_inodes():
             # Obtain the data and make sure it is all 0's
-            data = os.pread(self.fd, 2, offset)
+            data = raw[osd2_offset:osd2_offset + 2]
             if data != b"\x00\x00":
                 count += 1
                 self.handle_found_data(n_inode, data, "OSD2 is not empty.", "osd2")
@@ -167,32 +192,29 @@ class Detect:
         Returns:
             Number of occurrences where the backup is not identical
         """
-        l_offset = 0
-        if self.block_size == 1024:
-            l_offset = 1
         count = 0
         size_first_half: Final = 90
         second_half_block_nr: Final = 94
         size_second_half: Final = 926
 
+        # Skip group 0, is checked by e2fsck.
+        backups = [gd for gd in range(1, len(self.group_descriptors)) if self.volume.group_has_superblock(gd)]
+        if not backups:
+            return count
+
         # Obtain first backup-block, to check if it is the same
         # as the other backup blocks
-        first_half_offset = (self.blocks_per_group + l_offset) * self.block_size
-        first_half = os.pread(self.fd, size_first_half, first_half_offset)
+        first_half_offset = self.volume.group_range(backups[0])[0] * self.block_size
+        first_half = self.pread(size_first_half, first_half_offset)
         # Skip the block number, which is stored in (90,94)
         second_half_offset = first_half_offset + second_half_block_nr
-        second_half = os.pread(self.fd, size_second_half, second_half_offset)
-        for gd in range(len(self.group_descriptors)):
-            # Skip block 0, is checked by e2fsck.
-            if not check_powers(gd) or gd == 0:
-                continue
-
+        second_half = self.pread(size_second_half, second_half_offset)
+        for gd in backups:
             # Obtain data
-            block_nr = (gd * self.blocks_per_group) + l_offset
-            offset = block_nr * self.block_size
-            backup_first_half = os.pread(self.fd, size_first_half, offset)
+            offset = self.volume.group_range(gd)[0] * self.block_size
+            backup_first_half = self.pread(size_first_half, offset)
             second_location = offset + second_half_block_nr
-            backup_second_half = os.pread(self.fd, size_second_half, second_location)
+            backup_second_half = self.pread(size_second_half, second_location)
 
             # Check if the backup is the same as the first backup
             if first_half != backup_first_half or second_half != backup_second_half:
@@ -210,7 +232,7 @@ class Detect:
             1 if there is data in the PBS, 0 otherwise
         """
         length_pbs: Final = 0x400
-        pbs = os.pread(self.fd, length_pbs, 0)
+        pbs = self.pread(length_pbs, 0)
         if pbs != (b"\x00" * length_pbs):
             self.handle_found_data(-1, pbs, "The Partition Boot Sector is not empty.", "partition_boot_sector")
             return 1
@@ -225,59 +247,64 @@ class Detect:
         count = 0
         reserved_space_offset: Final = 0x7A
         len_reserved_space: Final = 2
-        n_inodes = getattr(self.superblock, "s_inodes_count")
-        for n_inode in range(n_inodes):
-            # Obtain inode and calculate offset
-            inode = self.volume.get_inode(n_inode)
-            offset = inode.offset + reserved_space_offset
+        for n_inode, offset, raw in self.initialized_inodes():
             # Obtain data and check if it is all zeros
-            data = os.pread(self.fd, len_reserved_space, offset)
+            data = raw[reserved_space_offset:reserved_space_offset + len_reserved_space]
             if data != b"\x00\x00":
                 count += 1
                 self.handle_found_data(n_inode, data, "Reserved space is not empty.", "reserved_space_inode")
 
         return count
 
+    def bitmap_slack(self, field: str, skip_bytes: int):
+        """
+        Generator: Reads the bitmaps referenced by the group descriptor field in runs of consecutive
+        blocks (one read per flex group with flex_bg). The slack after skip_bytes of all bitmaps in a
+        run is tested at once, only if it is mixed the bitmaps of the run are tested one by one.
+        Yields:
+            Tuples (group, slack) of bitmaps whose slack is neither all 0's nor all 1's
+        """
+        size_slack_space = self.block_size - skip_bytes
+        if size_slack_space <= 0:
+            return
+        for groups, data in self.volume.group_block_runs(field):
+            view = memoryview(data)
+            slack = b"".join(view[i * self.block_size + skip_bytes:(i + 1) * self.block_size] for i in range(len(groups)))
+            # Can be 0's if the group is uninitialized
+            if slack.count(0xFF) == len(slack) or slack.count(0) == len(slack):
+                continue
+            for i, group in enumerate(groups):
+                data = slack[i * size_slack_space:(i + 1) * size_slack_space]
+                if data != b"\xff" * size_slack_space and data != b"\x00" * size_slack_space:
+                    yield group, data
+
     def check_inode_bitmap_slack_space(self):
         """
         Checks the slack space in the inode bitmap. E2FSCK also checks this.
         Returns:
-            1 if the slack space is not empty, 0 otherwise
+            Number of inode bitmaps where the slack space is not empty
         """
         inodes_per_group = getattr(self.superblock, "s_inodes_per_group")
         # Calculate number of bytes to skip
         skip_bytes = int(inodes_per_group / 8)
         count = 0
-        for gd in self.group_descriptors:
-            # Obtain block of inode bitmap
-            bitmap = getattr(gd, "bg_inode_bitmap")
-            offset = (bitmap * self.block_size) + skip_bytes
-            size_slack_space = int(self.block_size - skip_bytes)
-            data = os.pread(self.fd, size_slack_space, offset)
-            # Can be 0's if INODE_UNINIT is enabled
-            if data != b"\xff" * size_slack_space and data != b"\x00" * size_slack_space:
-                self.handle_found_data(-1, data, "Slack space in the inode bitmap is not empty.", "inode_bitmap")
-                count += 1
+        for group, data in self.bitmap_slack("bg_inode_bitmap", skip_bytes):
+            self.handle_found_data(-1, data, "Slack space in the inode bitmap is not empty.", "inode_bitmap")
+            count += 1
         return count
 
     def check_block_bitmap_slack_space(self):
-        blocks_per_group = getattr(self.superblock, "s_blocks_per_group")
+        # The block bitmap has one bit per cluster
+        clusters_per_group = getattr(self.superblock, "s_clusters_per_group")
         # There is no padding left if this is true.
-        if blocks_per_group == (self.block_size * 8):
+        if clusters_per_group == (self.block_size * 8):
             return 0
 
-        skip_bytes = int(blocks_per_group / 8)
+        skip_bytes = int(clusters_per_group / 8)
         count = 0
-        size_slack_space = int(self.block_size - skip_bytes)
-        for gd in self.group_descriptors:
-            # Obtain block of block bitmap
-            bitmap = getattr(gd, "bg_block_bitmap")
-            offset = (bitmap * self.block_size) + skip_bytes
-            data = os.pread(self.fd, size_slack_space, offset)
-            # Can be 0's if BLOCK_UNINIT is enabled
-            if data != b"\xff" * size_slack_space and data != b"\x00" * size_slack_space:
-                self.handle_found_data(-1, data, "Slack space in the block bitmap is not empty.", "block_bitmap")
-                count += 1
+        for group, data in self.bitmap_slack("bg_block_bitmap", skip_bytes):
+            self.handle_found_data(-1, data, "Slack space in the block bitmap is not empty.", "block_bitmap")
+            count += 1
 
         return count
 
@@ -302,14 +329,73 @@ class Detect:
             # Calculate offset of the second half, without the checksum
             o_second_half = offset_inode + 126
             # Obtain first and csecond half
-            first_half = os.pread(self.fd, start_checksum, offset_inode)
-            second_half = os.pread(self.fd, (inode_size - end_checksum), o_second_half)
+            first_half = self.pread(start_checksum, offset_inode)
+            second_half = self.pread((inode_size - end_checksum), o_second_half)
             if first_half != (b"\x00" * start_checksum) or second_half != (b"\x00" * (inode_size - end_checksum)):
                 self.handle_found_multiple_data(i, first_half, second_half, "Reserved inode is not empty; check flags.", "reserved_inode")
                 count += 1
 
         return count
 
+    def initialized_inodes(self):
+        """
+        Generator: Reads the inode table of every group at once. The entries at the end of the inode
+        tables which were never initialized (bg_itable_unused) are skipped, check_inode_table_tail
+        checks them as a whole.
+        Yields:
+            Tuples (inode number, offset of the inode, raw inode)
+        """
+        inode_size = getattr(self.superblock, "s_inode_size")
+        inodes_per_group = getattr(self.superblock, "s_inodes_per_group")
+        for group, gd in enumerate(self.group_descriptors):
+            n_inodes = inodes_per_group - self.volume.inode_table_unused(group)
+            table_offset = getattr(gd, "bg_inode_table") * self.block_size
+            table = self.pread(n_inodes * inode_size, table_offset)
+            for i in range(len(table) // inode_size):
+                yield (group * inodes_per_group + i + 1, table_offset + i * inode_size,
+                       table[i * inode_size:(i + 1) * inode_size])
+
+    def check_inode_table_tail(self):
+        """
+        Checks the entries at the end of the inode tables which were never initialized (bg_itable_unused),
+        these are expected to be empty. Each tail is read as one span in large reads, skipping holes of
+        sparse images, and tested for non-zero inodes with a regular expression over the whole buffer.
+        Returns:
+            Number of runs of unused inodes which are not empty
+        """
+        count = 0
+        chunk_size: Final = 4 * 1024 * 1024
+        inode_size = getattr(self.superblock, "s_inode_size")
+        inodes_per_group = getattr(self.superblock, "s_inodes_per_group")
+        chunk_inodes = chunk_size // inode_size
+        buffer = memoryview(bytearray(chunk_inodes * inode_size))
+        for group, gd in enumerate(self.group_descriptors):
+            unused = self.volume.inode_table_unused(group)
+            if unused == 0:
+                continue
+            table_offset = getattr(gd, "bg_inode_table") * self.block_size
+            position = table_offset + (inodes_per_group - unused) * inode_size
+            end = table_offset + inodes_per_group * inode_size
+            while position < end:
+                # Holes of sparse images are skipped, the regions stay aligned to inodes
+                position, data_end = self.next_data_region(position, end)
+                while position < data_end:
+                    size = min(len(buffer), data_end - position)
+                    size = self.preadv(buffer[:size], position)
+                    if size == 0:
+                        # End of the image
+                        return count
+                    chunk_slot = (position - table_offset) // inode_size
+                    for slot, n_slots in ext4.nonzero_block_runs(buffer[:size], inode_size):
+                        first_inode = group * inodes_per_group + chunk_slot + slot + 1
+                        data = bytes(buffer[slot * inode_size:(slot + n_slots) * inode_size])
+                        self.handle_found_data(first_inode, data, "Unused inodes " + str(first_inode) + "-"
+                                               + str(first_inode + n_slots - 1) + " at the end of the inode table of group "
+                                               + str(group) + " are not empty.", "inode_table_tail")
+                        count += 1
+                    position += size
+        return count
+
     def check_extended_attributes(self):
         """
         Check if there is data after the size of the extended attributes.
@@ -318,21 +404,21 @@ class Detect:
         """
         count = 0
         inode_size = getattr(self.superblock, "s_inode_size")
-        n_inodes = getattr(self.superblock, "s_inodes_count")
         offset_isize_size: Final = 0x80
         length_standard_inode: Final = 0x80
-        for n_inode in range(n_inodes):
-            # Obtain inode
-            inode = self.volume.get_inode(n_inode)
-            # Calculate offset
-            offset = inode.offset + offset_isize_size
+        offset_flags: Final = 0x20
+        for n_inode, offset, raw in self.initialized_inodes():
             # Obtain length of extra isize
-            extra_isize = int.from_bytes(os.pread(self.fd, 2, offset), "little")
+            extra_isize = int.from_bytes(raw[offset_isize_size:offset_isize_size + 2], "little")
             # Obtain isize offset
             i_offset = length_standard_inode + extra_isize
             length = inode_size - i_offset
-            start_read = inode.offset + i_offset
-            data = os.pread(self.fd, length, start_read)
+            data = raw[i_offset:]
+            flags = int.from_bytes(raw[offset_flags:offset_flags + 4], "little")
+            if flags & ext4.ext4_inode.EXT4_INLINE_DATA_FL:
+                # Inline data continues in the system.data attribute, so only the unused space is suspicious
+                data = b"".join(self.xattr_block_slack(data, 4, 4))
+                length = len(data)
             if data != (b"\x00" * length):
                 self.handle_found_data(n_inode, data, "There is more data in the extended attributes than the size"
                                                       "specified in extra_isize.", "extended_attributes")
@@ -356,86 +442,703 @@ class Detect:
         group_descriptors = self.volume.group_descriptors
         standard_length = self.block_size - length_backup_copy
         for gd in range(len(group_descriptors)):
-            if not check_powers(gd):
+            if not self.volume.group_has_superblock(gd):
                 continue
             # First SB is a 'special case' - first 1024 are padded for the PBS
             if gd == 0:
                 length = self.block_size - minimum_block_size
                 if length > 0:
-                    data = os.pread(self.fd, length, minimum_block_size)
+                    data = self.pread(length, minimum_block_size)
                     if data != (b"\x00" * length):
                         self.handle_found_data(-1, data, "There is data in the slack of superblock 0", "superblock_slack")
                         count += 1
                 continue
 
-            location = ((gd * self.blocks_per_group) * self.block_size) + length_backup_copy
-            data = os.pread(self.fd, standard_length, location)
+            location = self.volume.group_range(gd)[0] * self.block_size + length_backup_copy
+            data = self.pread(standard_length, location)
             if data != (b"\x00" * standard_length):
                 self.handle_found_data(-1, data, "There is data in the slack of superblock " + str(gd), "superblock_slack")
                 count += 1
         return count
 
     def check_group_descriptor_reserved(self):
-        # Calculate right offset based at the block size
-        offset = 1
-        if self.block_size == 1024:
-            offset = 2
+        """
+        Checks the reserved field at the end of every group descriptor, in all copies of the group
+        descriptor table (after the superblock backups, or in the meta block groups with meta_bg).
+        Returns:
+            Number of group descriptors where the reserved field is not empty
+        """
         count = 0
+        reserved_offset: Final = 0x3C
         size: Final = 4
-        blocks_per_group: Final = getattr(self.superblock, "s_blocks_per_group")
-        # Check every GD (backup)
-        for gdt in range(len(self.group_descriptors)):
-            if not check_powers(gdt):
-                continue
-            base_location = (gdt * blocks_per_group + offset) * self.block_size
-            # Loop through all the GDTs and check if the reserved space is empty.
-            for igdt in range(len(self.group_descriptors)):
-                location = base_location + 0x3C
-                data = os.pread(self.fd, size, location)
-                if data != (size * b"\x00"):
-                    self.handle_found_data(-1, data, "Reserved data in group descriptor " + str(gdt) + " is not empty.", "gd_reserved")
-                    count += 1
-                base_location += 64
+        desc_size = getattr(self.superblock, "s_desc_size")
+        n_groups = len(self.group_descriptors)
+        # Only 64 byte group descriptors have the reserved field
+        if desc_size < reserved_offset + size:
+            return count
+        descriptors_per_block = self.block_size // desc_size
+        for gdt in range(n_groups):
+            for block, gdt_block in self.volume.group_gdt_blocks(gdt):
+                data = self.pread(self.block_size, block * self.block_size)
+                # Loop through all the GDs in the block and check if the reserved space is empty.
+                for i in range(descriptors_per_block):
+                    group = gdt_block * descriptors_per_block + i
+                    if group >= n_groups:
+                        break
+                    reserved = data[i * desc_size + reserved_offset:i * desc_size + reserved_offset + size]
+                    if reserved != (size * b"\x00"):
+                        self.handle_found_data(-1, reserved, "Reserved data in group descriptor " + str(group)
+                                               + " (copy in group " + str(gdt) + ") is not empty.", "gd_reserved")
+                        count += 1
         return count
 
     def check_gdt_growth_blocks(self):
         """
-        Checks the GDT growth blocks.
+        Checks the GDT growth blocks (reserved GDT blocks) after every copy of the group descriptor table.
         Returns:
             Number of growth blocks where data is hidden
         """
-        skip_start = 1
-        if self.block_size == 1024:
-            skip_start = 2
-        # Calculate the number of blocks to skip. +1 to round to 'above'.
-        skip_blocks = int((len(self.volume.group_descriptors) * 64) / self.block_size) + 1
         count = 0
-        reserved_gdt_blocks = getattr(self.superblock, "s_reserved_gdt_blocks")
-        one_too_many = False
-        start_bitmap = getattr(self.group_descriptors[0], "bg_block_bitmap") + 1
+        # The primary growth blocks list the block numbers of their backups. Skip these.
+        n_backups = sum(1 for group in range(1, len(self.group_descriptors)) if self.volume.group_has_superblock(group))
+        for group in range(len(self.group_descriptors)):
+            start, n_blocks = self.volume.group_reserved_gdt_blocks(group)
+            if n_blocks == 0:
+                continue
+            skip = min(4 * n_backups, self.block_size) if group == 0 else 0
+            blocks = self.pread(n_blocks * self.block_size, start * self.block_size)
+            for i in range(n_blocks):
+                location = (start + i) * self.block_size + skip
+                data = blocks[i * self.block_size + skip:(i + 1) * self.block_size]
+                if data != (b"\x00" * (self.block_size - skip)):
+                    self.handle_found_data(-1, data, "Growth blocks in location " + str(location) + " are not empty.", "growth_blocks")
+                    count += 1
+
+        return count
+
+    def check_orphaned_blocks(self):
+        """
+        Checks blocks which are marked as allocated in the block bitmaps, but are neither filesystem
+        metadata nor owned by any inode. Data in these blocks is hidden from the filesystem.
+        Returns:
+            Number of chunks of orphaned blocks which are not empty
+        """
+        count = 0
+        chunk_blocks: Final = 256
+        index = ext4.BlockOwnershipIndex(self.volume)
+        # With bigalloc, the clusters holding metadata are allocated as a whole
+        metadata = ext4.merge_runs(self.volume.cluster_runs(self.volume.metadata_runs()))
+        orphaned = ext4.subtract_runs(index.unowned_runs(self.volume.allocated_block_runs()), metadata)
 
-        # First number is the number of the growth block. Skip these.
-        offset_gdt_number: Final = int((reserved_gdt_blocks / 8))
+        for start, length in orphaned:
+            # Read the run in chunks, to keep the memory usage bounded
+            for chunk_start in range(start, start + length, chunk_blocks):
+                n_blocks = min(chunk_blocks, start + length - chunk_start)
+                data = self.pread(n_blocks * self.block_size, chunk_start * self.block_size)
+                if data.count(0) != len(data):
+                    self.handle_found_data(-1, data, "Allocated blocks " + str(chunk_start) + "-" + str(chunk_start + n_blocks - 1)
+                                           + " are not owned by any inode.", "orphaned_blocks")
+                    count += 1
+        return count
 
-        # Loop through all GDT (backups)
-        for group in range(len(self.volume.group_descriptors)):
-            if not check_powers(group):
+    def next_data_region(self, position: int, end: int):
+        """
+        Skips holes of sparse image files, which can only contain zeros.
+        Returns:
+            Start and end of the next region in [position, end) which is stored in the image,
+            or (end, end) if there is none
+        """
+        if self.fd is None or not hasattr(os, "SEEK_DATA"):
+            return position, end
+        try:
+            data_start = os.lseek(self.fd, self.offset + position, os.SEEK_DATA) - self.offset
+        except OSError as error:
+            # ENXIO: no data after position, other errors: not supported
+            return (end, end) if error.errno == errno.ENXIO else (position, end)
+        if data_start >= end:
+            return end, end
+        data_end = os.lseek(self.fd, self.offset + data_start, os.SEEK_HOLE) - self.offset
+        # Holes are aligned to pages, align the region to blocks anyway
+        data_start = max(position, data_start - data_start % self.block_size)
+        data_end = min(end, data_end + (-data_end) % self.block_size)
+        return data_start, data_end
+
+    def scan_free_group(self, group: int, metadata: list):
+        """
+        Scans the free blocks of a group with large sequential reads into a bounded buffer.
+        Returns:
+            List of runs (first block, number of blocks) of free blocks which are not empty
+        """
+        chunk_size: Final = 4 * 1024 * 1024 - (4 * 1024 * 1024) % self.block_size
+        buffer = memoryview(bytearray(chunk_size))
+        runs = []
+        for start, length in self.volume.free_block_runs(group, metadata):
+            position = start * self.block_size
+            end = (start + length) * self.block_size
+            while position < end:
+                position, data_end = self.next_data_region(position, end)
+                while position < data_end:
+                    size = min(chunk_size, data_end - position)
+                    size = self.preadv(buffer[:size], position)
+                    if size == 0:
+                        # End of the image
+                        return runs
+                    first_block = position // self.block_size
+                    for block, n_blocks in ext4.nonzero_block_runs(buffer[:size], self.block_size):
+                        runs.append((first_block + block, n_blocks))
+                    position += size
+        return runs
+
+    def check_free_blocks(self):
+        """
+        Checks if the blocks which are not allocated in the block bitmaps are empty. The groups are scanned
+        in parallel if jobs > 1.
+        Returns:
+            Number of runs of free blocks which are not empty
+        """
+        count = 0
+        chunk_blocks: Final = 256
+        metadata = ext4.merge_runs(self.volume.metadata_runs())
+        groups = range(len(self.group_descriptors))
+        if self.jobs > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                group_runs = list(executor.map(lambda group: self.scan_free_group(group, metadata), groups))
+        else:
+            group_runs = [self.scan_free_group(group, metadata) for group in groups]
+
+        # Runs may continue in the next group
+        for start, length in ext4.merge_runs(run for runs in group_runs for run in runs):
+            message = "Free blocks " + str(start) + "-" + str(start + length - 1) + " are not empty."
+            # Search the run in chunks, until an incident is created
+            for chunk_start in range(start, start + length, chunk_blocks):
+                n_blocks = min(chunk_blocks, start + length - chunk_start)
+                data = self.pread(n_blocks * self.block_size, chunk_start * self.block_size)
+                n_messages = len(self.messages)
+                self.handle_found_data(-1, data, message, "free_blocks")
+                if len(self.messages) != n_messages:
+                    count += 1
+                    break
+        return count
+
+    def directory_block_slack(self, data: bytes, offset: int):
+        """
+        Obtains the slack of all directory entries in one directory block: the bytes between the end
+        of an entry's name and its rec_len. The last entry spans to the end of the block. The padding
+        of the name up to a multiple of 4 bytes must be empty, or hold the rest of a longer name the
+        entry was written over. The rest of the gap is checked with directory_gap_slack, as deleting
+        entries and splitting hash tree leaves leave stale data.
+        Returns:
+            The slack which is not empty concatenated, b"" if all slack is empty
+        """
+        found = []
+        position = offset
+        end = offset + self.block_size
+        while position + 8 <= end:
+            inode, rec_len, name_len, file_type = struct.unpack_from("<IHBB", data, position)
+            # Blocks of 64 KiB store a rec_len of 65536 as 0 or 65535
+            if self.block_size >= 65536 and rec_len in (0, 65535):
+                rec_len = 65536
+            if rec_len < 8 or position + rec_len > end:
+                break
+            # Skip the checksum entry at the end of the block
+            if not (inode == 0 and file_type == ext4.InodeType.CHECKSUM and rec_len == 12):
+                used = 8 + name_len
+                if used < rec_len and data.count(0, position + used, position + rec_len) != rec_len - used:
+                    padded = min(rec_len, (used + 3) & ~3)
+                    padding = data[position + used:position + padded]
+                    if not self.stale_name_padding(padding):
+                        found.append(padding)
+                    found.extend(self.directory_gap_slack(data, position + padded, position + rec_len, offset))
+            position += rec_len
+        return b"".join(found)
+
+    def directory_gap_slack(self, data: bytes, start: int, end: int, block_offset: int):
+        """
+        Obtains the bytes in the gap after a directory entry (start and end are aligned to 4 bytes)
+        which are neither empty nor stale directory data:
+            - Deleted entries, which e2fsprogs and kernels before 5.13 merge into the rec_len of the
+              previous entry without clearing them.
+            - The entries a hash tree leaf held before it was split. The kernel packs the remaining
+              entries to the start of the block and leaves the old ones behind, so the gap may start
+              with the tail of an overwritten entry, which is skipped if an entry follows it.
+            - The map of (hash, offset / 4, rec_len) tuples that the kernel builds at the end of the
+              new leaf block of a split, 8-byte aligned to the end of the block.
+        Returns:
+            List of the unexplained parts of the gap
+        """
+        max_entry_len: Final = 8 + 256
+        map_entry_len: Final = 8
+        found = []
+        position = start
+        while position < end:
+            stale_len = self.stale_dirent_len(data, position, end)
+            if stale_len:
+                position += stale_len
                 continue
-            start = skip_start + skip_blocks + (group * self.blocks_per_group)
-            end = start + reserved_gdt_blocks
-            if end == start_bitmap or one_too_many:
-                end -= 1
-                one_too_many = True
-
-            for i in range(start, end):
-                size = self.block_size
-                location = (i * size) + offset_gdt_number
-
-                data = os.pread(self.fd, size - offset_gdt_number, location)
-                if data != (b"\x00" * (size - offset_gdt_number)):
-                    self.handle_found_data(-1, data, "Growth blocks in location " + str(location) + " are not empty.", "growth_blocks")
+            if data.count(0, position, position + 4) == 4:
+                position += 4
+                continue
+            if self.split_map_entry(data, position, end, block_offset):
+                position += map_entry_len - (position - block_offset) % map_entry_len
+                continue
+            # Tail of an entry overwritten when the leaf was packed, up to the next stale entry
+            resync = position + 4
+            while resync < min(end, position + max_entry_len) and not self.stale_dirent_len(data, resync, end):
+                resync += 4
+            if resync < end and self.stale_dirent_len(data, resync, end):
+                position = resync
+                continue
+            found.append(data[position:position + 4])
+            position += 4
+        return found
+
+    def stale_name_padding(self, padding: bytes):
+        """
+        Checks if the padding after a name is empty or holds the rest of a longer name: name bytes
+        followed by zeros. Entries reuse the space of deleted entries without clearing it.
+        Returns:
+            True if the padding is empty or a stale name
+        """
+        name = padding.rstrip(b"\x00")
+        return b"\x00" not in name and b"/" not in name
+
+    def stale_dirent_len(self, data: bytes, position: int, end: int):
+        """
+        Checks if a deleted or stale directory entry starts at position of a gap ending at end: its
+        rec_len holds its name, is aligned to 4 bytes and stays within the gap, and its name is valid.
+        Entries moved by a hash tree split (and deleted by newer kernels) are wiped except for their
+        rec_len.
+        Returns:
+            Length of the entry's header and name padded to 4 bytes (of the whole entry, if it is
+            wiped), or 0 if there is no entry
+        """
+        if position + 8 > end:
+            return 0
+        inode, rec_len, name_len, file_type = struct.unpack_from("<IHBB", data, position)
+        if rec_len % 4 != 0 or rec_len < 12 or rec_len < 8 + name_len or position + rec_len > end:
+            return 0
+        if name_len == 0:
+            wiped = inode == 0 and data.count(0, position + 6, position + rec_len) == rec_len - 6
+            return rec_len if wiped else 0
+        if file_type > 7:
+            return 0
+        name = data[position + 8:position + 8 + name_len]
+        if b"\x00" in name or b"/" in name:
+            return 0
+        return (8 + name_len + 3) & ~3
+
+    def split_map_entry(self, data: bytes, position: int, end: int, block_offset: int):
+        """
+        Checks if the 8-byte aligned entry of a hash tree split map (hash, offset / 4, rec_len) at or
+        around position is valid: the hash has its lowest bit cleared and the offset and rec_len lie
+        within the block. Entries cut off by an entry written over the map's start or by the
+        checksum entry at the end of the block are checked by their remaining half.
+        Returns:
+            True if the bytes at position belong to a valid map entry
+        """
+        first = position - (position - block_offset) % 8
+        if first < position:
+            # Second half of an entry whose hash is overwritten, the next entry must be valid as well
+            offs, size = struct.unpack_from("<HH", data, position)
+            return offs * 4 < self.block_size and size % 4 == 0 and 12 <= size <= self.block_size \
+                and (position + 4 >= end or self.split_map_entry(data, position + 4, end, block_offset))
+        hash_value = struct.unpack_from("<I", data, position)[0]
+        if hash_value & 1:
+            return False
+        if position + 8 > end:
+            # The checksum entry at the end of the block overwrote offset and rec_len
+            return end == block_offset + self.block_size - 12
+        offs, size = struct.unpack_from("<HH", data, position + 4)
+        return offs * 4 < self.block_size and size % 4 == 0 and 12 <= size <= self.block_size
+
+    def check_directory_slack(self):
+        """
+        Checks the slack after every directory entry. All directory blocks of the filesystem are read
+        in physical order, consecutive blocks with one read.
+        Returns:
+            Number of directory blocks where the slack is not empty
+        """
+        count = 0
+        chunk_blocks: Final = 256
+        # Tuples (block number, inode number), without the nodes of hash trees
+        blocks = []
+        for inode in self.volume.iter_inodes():
+            if (inode.inode.i_mode & 0xF000) != ext4.ext4_inode.S_IFDIR:
+                continue
+            try:
+                block_map = inode.block_map
+                nodes = inode.htree_node_blocks()
+            except ext4.Ext4Error:
+                continue
+            for entry in block_map:
+                for i in range(entry.block_count):
+                    if entry.file_block_idx + i not in nodes:
+                        blocks.append((entry.disk_block_idx + i, inode.inode_idx))
+        blocks.sort()
+
+        i = 0
+        while i < len(blocks):
+            j = i + 1
+            while j < len(blocks) and j - i < chunk_blocks and blocks[j][0] == blocks[j - 1][0] + 1:
+                j += 1
+            data = self.pread((j - i) * self.block_size, blocks[i][0] * self.block_size)
+            for k in range(i, j):
+                if (k - i + 1) * self.block_size > len(data):
+                    break
+                slack = self.directory_block_slack(data, (k - i) * self.block_size)
+                if slack:
+                    self.handle_found_data(blocks[k][1], slack, "Slack of directory entries in block " + str(blocks[k][0])
+                                           + " is not empty.", "directory_slack")
                     count += 1
+            i = j
+        return count
+
+    def xattr_block_slack(self, data: bytes, header_size: int = 32, value_base: int = 0):
+        """
+        Obtains the unused space of one external extended attribute block: the bytes which are neither
+        part of the header, an entry, the terminator nor an attribute value. The extended attributes in
+        the inode body are parsed with header_size 4 and value_base 4, as their value offsets are
+        relative to the first entry.
+        Returns:
+            Tuple (slack after the last entry, unreferenced value bytes), with only the non-empty parts
+            concatenated, (b"", b"") if all unused space is empty or the block is not an xattr block
+        """
+        entry_size: Final = 16
+        if len(data) < header_size or struct.unpack_from("<I", data)[0] != 0xEA020000:
+            return b"", b""
 
+        # Tuples (offset, length) of the referenced bytes
+        used = [(0, header_size)]
+        values_start = len(data)
+        position = header_size
+        while position + 4 <= len(data):
+            if data[position:position + 4] == b"\x00\x00\x00\x00":
+                used.append((position, 4))
+                break
+            if position + entry_size > len(data):
+                break
+            name_len, _, value_offs, value_inum, value_size = struct.unpack_from("<BBHII", data, position)
+            length = (entry_size + name_len + 3) & ~3
+            used.append((position, length))
+            if value_inum == 0 and value_size > 0:
+                used.append((value_base + value_offs, (value_size + 3) & ~3))
+                values_start = min(values_start, value_base + value_offs)
+            position += length
+
+        slack = []
+        unreferenced = []
+        for start, length in ext4.subtract_runs([(0, len(data))], ext4.merge_runs(used)):
+            if data.count(0, start, start + length) != length:
+                (slack if start < values_start else unreferenced).append(data[start:start + length])
+        return b"".join(slack), b"".join(unreferenced)
+
+    def check_xattr_blocks(self):
+        """
+        Checks the unused space of all external extended attribute blocks. The blocks referenced by
+        i_file_acl are collected in one pass over the inodes, so blocks shared by several inodes are
+        read and parsed only once, in physical order.
+        Returns:
+            Number of extended attribute blocks where the unused space is not empty
+        """
+        count = 0
+        n_blocks = getattr(self.superblock, "s_blocks_count")
+        # Maps block number to the first inode referencing it
+        blocks = {}
+        for inode in self.volume.iter_inodes():
+            block = inode.inode.i_file_acl
+            if 0 < block < n_blocks and block not in blocks:
+                blocks[block] = inode.inode_idx
+
+        for block in sorted(blocks):
+            data = self.pread(self.block_size, block * self.block_size)
+            slack, unreferenced = self.xattr_block_slack(data)
+            if slack:
+                self.handle_found_data(blocks[block], slack, "Slack after the last entry of extended attribute block "
+                                       + str(block) + " is not empty.", "xattr_block_slack")
+            if unreferenced:
+                self.handle_found_data(blocks[block], unreferenced, "Extended attribute block " + str(block)
+                                       + " contains value bytes no entry references.", "xattr_block_value")
+            if slack or unreferenced:
+                count += 1
+        return count
+
+    def journal_chunks(self, block_map: list, first: int, last: int):
+        """
+        Generator: Streams the journal blocks first to last - 1 in logical order with large sequential
+        reads into a bounded buffer. The buffer is reused, the chunks are only valid until the next one.
+        Yields:
+            Tuples (journal block number of the chunk start, data of the chunk)
+        """
+        chunk_size: Final = 4 * 1024 * 1024 - (4 * 1024 * 1024) % self.block_size
+        chunk_blocks = chunk_size // self.block_size
+        buffer = memoryview(bytearray(chunk_size))
+        for entry in block_map:
+            start = max(first, entry.file_block_idx)
+            end = min(last, entry.file_block_idx + entry.block_count)
+            while start < end:
+                n_blocks = min(chunk_blocks, end - start)
+                position = (entry.disk_block_idx + start - entry.file_block_idx) * self.block_size
+                size = self.preadv(buffer[:n_blocks * self.block_size], position)
+                if size < self.block_size:
+                    # End of the image
+                    return
+                yield start, buffer[:size - size % self.block_size]
+                start += n_blocks
+
+    def journal_block(self, data, offset: int, incompat: int):
+        """
+        Parses a jbd2 descriptor, commit or revoke block at offset of data. These blocks are zeroed
+        before they are written, so the bytes after the used part of the block must be empty.
+        Returns:
+            Tuple (sequence, number of data blocks following the block, slack which is not empty or b""),
+            None if the block is no descriptor, commit or revoke block
+        """
+        journal_magic: Final = 0xC03B3998
+        header_size: Final = 12
+        commit_size: Final = 60
+        magic, block_type, sequence = struct.unpack_from(">III", data, offset)
+        if magic != journal_magic or block_type not in (1, 2, 5):
+            return None
+
+        end = offset + self.block_size
+        # Checksummed journals (csum v2 and v3) end descriptor and revoke blocks with a 4 byte checksum
+        tail = 4 if incompat & 0x18 else 0
+        n_tags = 0
+        if block_type == 1:
+            # Descriptor block: one tag per data block, each but the first followed by the UUID
+            # unless JBD2_FLAG_SAME_UUID is set, the last tag has JBD2_FLAG_LAST_TAG set
+            if incompat & 0x10:
+                tag_size = 16
+            else:
+                tag_size = 8 + (2 if incompat & 0x8 else 0) + (4 if incompat & 0x2 else 0)
+            position = offset + header_size
+            while position + tag_size <= end - tail:
+                if incompat & 0x10:
+                    flags = struct.unpack_from(">I", data, position + 4)[0]
+                else:
+                    flags = struct.unpack_from(">H", data, position + 6)[0]
+                n_tags += 1
+                position += tag_size
+                if not flags & 0x2:
+                    position += 16
+                if flags & 0x8:
+                    break
+            used = min(position, end - tail)
+        elif block_type == 2:
+            # Commit block, its checksum is part of the header
+            used = offset + commit_size
+            tail = 0
+        else:
+            # Revoke block, r_count is the number of bytes used including the header
+            r_count = struct.unpack_from(">I", data, offset + header_size)[0]
+            used = offset + min(max(r_count, header_size + 4), self.block_size - tail)
+
+        slack = bytes(data[used:end - tail])
+        if slack.count(0) == len(slack):
+            slack = b""
+        return sequence, n_tags, slack
+
+    def check_journal(self):
+        """
+        Checks the internal journal. The journal is streamed once in log order with large sequential
+        reads and its descriptor, commit and revoke blocks are parsed. Outside the live transaction
+        window, the following is reported:
+        - Slack of descriptor, commit and revoke blocks which is not empty
+        - Non-empty blocks which are not claimed by a descriptor block, unless they are the remains of an
+          older transaction which was partly overwritten when the log wrapped around
+        Returns:
+            Number of journal blocks or runs of journal blocks with data
+        """
+        count = 0
+        journal_magic: Final = 0xC03B3998
+        chunk_blocks: Final = 256
+        journal_inode = getattr(self.superblock, "s_journal_inum")
+        if not self.superblock.s_feature_compat & ext4.ext4_superblock.COMPAT_HAS_JOURNAL or journal_inode == 0:
+            return 0
+        journal = self.volume.get_inode(journal_inode)
+        try:
+            block_map = sorted(journal.block_map, key=lambda entry: entry.file_block_idx)
+            reader = journal.open_read()
+        except ext4.Ext4Error:
+            return 0
+
+        # jbd2 superblock, all fields are big-endian
+        header = reader.read(1024)
+        if len(header) < 1024:
+            return 0
+        magic, block_type, _, block_size, max_len, first, sequence, start = struct.unpack_from(">8I", header)
+        if magic != journal_magic or block_type not in (3, 4) or block_size != self.block_size:
+            return 0
+        incompat = struct.unpack_from(">I", header, 0x28)[0] if block_type == 4 else 0
+        last = max_len
+        if incompat & 0x20:
+            # The fast commit area at the end of the journal is not part of the log
+            last -= struct.unpack_from(">I", header, 0x54)[0] or 256
+
+        # Tuples (journal block, sequence, number of data blocks) of the parsed blocks, runs [first journal block, number of
+        # blocks, previous sequence, next sequence] of unclaimed data and tuples (journal block, slack)
+        headers = []
+        runs = []
+        slacks = []
+        open_runs = 0
+        claimed = 0
+        expected = first
+        for chunk_start, data in self.journal_chunks(block_map, first, last):
+            for run_start, n_blocks in ext4.nonzero_block_runs(data, self.block_size):
+                for block in range(chunk_start + run_start, chunk_start + run_start + n_blocks):
+                    # Empty data blocks are claimed as well
+                    claimed = max(0, claimed - (block - expected))
+                    expected = block + 1
+                    if claimed:
+                        claimed -= 1
+                        continue
+                    parsed = self.journal_block(data, (block - chunk_start) * self.block_size, incompat)
+                    if parsed is None:
+                        if len(runs) > open_runs and runs[-1][0] + runs[-1][1] == block:
+                            runs[-1][1] += 1
+                        else:
+                            runs.append([block, 1, headers[-1][1] if headers else None, None])
+                        continue
+                    block_sequence, claimed, slack = parsed
+                    for run in runs[open_runs:]:
+                        run[3] = block_sequence
+                    open_runs = len(runs)
+                    headers.append((block, block_sequence, claimed))
+                    if slack:
+                        slacks.append((block, slack))
+
+        # Sequence numbers only decrease along the log if it wrapped around, the runs at its end then
+        # continue at its start
+        wrapped = any((headers[i][1] - headers[i - 1][1]) & 0x80000000 for i in range(1, len(headers)))
+        for run in runs:
+            if run[2] is None and wrapped:
+                run[2] = headers[-1][1]
+            if run[3] is None and wrapped:
+                run[3] = headers[0][1]
+
+        # The live transactions start at s_start with s_sequence and continue while the sequence numbers
+        # are consecutive, s_start is 0 if the journal is clean
+        window_start = window_end = 0
+        if start != 0:
+            window_start = window_end = start
+            ordered = [header for header in headers if header[0] >= start] + [header for header in headers if header[0] < start]
+            for block, block_sequence, n_data in ordered:
+                if block_sequence not in (sequence, sequence + 1):
+                    break
+                sequence = block_sequence
+                window_end = first + (block + 1 + n_data - first) % (last - first)
+
+        def in_window(block: int):
+            if window_start <= window_end:
+                return window_start <= block < window_end
+            return block >= window_start or block < window_end
+
+        for block, slack in slacks:
+            if in_window(block):
+                continue
+            self.handle_found_data(journal_inode, slack, "Slack of journal block " + str(block) + " is not empty.",
+                                   "journal_slack")
+            count += 1
+
+        for run_start, n_blocks, previous, following in runs:
+            if in_window(run_start):
+                continue
+            # Remains of an older transaction: the next parsed block belongs to an older transaction
+            if previous is not None and following is not None and (following - previous) & 0x80000000:
+                continue
+            reader.seek(run_start * self.block_size)
+            data = reader.read(min(n_blocks, chunk_blocks) * self.block_size)
+            self.handle_found_data(journal_inode, data, "Journal blocks " + str(run_start) + "-" + str(run_start + n_blocks - 1)
+                                   + " are not claimed by any descriptor block.", "journal")
+            count += 1
+        return count
+
+    def check_checksums(self):
+        """
+        Verifies the metadata checksums of the superblock, the group descriptors, the bitmaps and the
+        inodes. Most hiding techniques change bytes covered by these checksums without updating them,
+        so a mismatch is a cheap sign of tampering. A mismatching inode checksum is not reported if one
+        of the checks of the inode fields already found data in that inode.
+        Returns:
+            Number of structures whose checksum does not match
+        """
+        count = 0
+        names: Final = {"group_descriptor": "group descriptor", "block_bitmap": "block bitmap",
+                        "inode_bitmap": "inode bitmap", "inode": "inode"}
+        inode_techniques: Final = ("osd2", "reserved_space_inode", "reserved_inode", "extended_attributes")
+        computed = self.volume.superblock_checksum()
+        if computed is not None and computed != getattr(self.superblock, "s_checksum"):
+            self.handle_found_data(-1, self.pread(1024, 1024), "Checksum of the superblock does not match.",
+                                   "checksum")
+            count += 1
+
+        for group in range(len(self.group_descriptors)):
+            for structure, index, raw, stored, computed in self.volume.checksum_errors(group):
+                n_inode = index if structure == "inode" else -1
+                # The checksum only changed because of data found in the inode fields
+                if any((n_inode, technique) in self.incidents for technique in inode_techniques):
+                    continue
+                name = names[structure] + " " + str(index) if structure == "inode" else names[structure] + " of group " + str(index)
+                self.handle_found_data(n_inode, raw, "Checksum of " + name + " does not match (stored " + hex(stored)
+                                       + ", computed " + hex(computed) + ").", "checksum")
+                count += 1
+        return count
+
+    def check_bitmap_counts(self):
+        """
+        Compares the number of free blocks and inodes in every group's bitmaps with the counts in its
+        group descriptor, and the counts of all group descriptors with the totals in the superblock. A
+        mismatch shows bitmaps manipulated to reserve space for hidden data. The bitmaps are read in
+        runs of consecutive blocks and their bits are counted as whole integers. With bigalloc, the block
+        bitmaps and group descriptors count clusters, the superblock blocks.
+        Returns:
+            Number of counts which do not match
+        """
+        count = 0
+        inodes_per_group = getattr(self.superblock, "s_inodes_per_group")
+        ratio = self.volume.cluster_ratio
+        metadata = ext4.merge_runs(self.volume.cluster_runs(self.volume.metadata_runs()))
+        metadata_starts = [start for start, _ in metadata]
+
+        for group, bitmap in self.volume.iter_group_blocks("bg_block_bitmap"):
+            gd = self.group_descriptors[group]
+            start, length = self.volume.group_range(group)
+            clusters = self.volume.group_cluster_count(group)
+            if getattr(gd, "bg_flags") & ext4.ext4_group_descriptor.EXT4_BG_BLOCK_UNINIT:
+                # No initialized bitmap, only the metadata in the group is allocated
+                used = 0
+                i = max(0, bisect.bisect_right(metadata_starts, start) - 1)
+                while i < len(metadata) and metadata[i][0] < start + length:
+                    used += max(0, min(start + length, metadata[i][0] + metadata[i][1]) - max(start, metadata[i][0]))
+                    i += 1
+                free = clusters - (used + ratio - 1) // ratio
+            else:
+                free = clusters - ext4.popcount(bitmap, clusters)
+            if free != getattr(gd, "bg_free_blocks_count"):
+                self.handle_found_data(-1, bitmap, "Block bitmap of group " + str(group) + " has " + str(free)
+                                       + " free blocks, the group descriptor records "
+                                       + str(getattr(gd, "bg_free_blocks_count")) + ".", "bitmap_count")
+                count += 1
+
+        for group, bitmap in self.volume.iter_group_blocks("bg_inode_bitmap"):
+            gd = self.group_descriptors[group]
+            if getattr(gd, "bg_flags") & ext4.ext4_group_descriptor.EXT4_BG_INODE_UNINIT:
+                free = inodes_per_group
+            else:
+                free = inodes_per_group - ext4.popcount(bitmap, inodes_per_group)
+            if free != getattr(gd, "bg_free_inodes_count"):
+                self.handle_found_data(-1, bitmap, "Inode bitmap of group " + str(group) + " has " + str(free)
+                                       + " free inodes, the group descriptor records "
+                                       + str(getattr(gd, "bg_free_inodes_count")) + ".", "bitmap_count")
+                count += 1
+
+        for field, name, unit in (("free_blocks_count", "free blocks", ratio), ("free_inodes_count", "free inodes", 1)):
+            total = sum(getattr(gd, "bg_" + field) for gd in self.group_descriptors) * unit
+            recorded = getattr(self.superblock, "s_" + field)
+            if total != recorded:
+                self.handle_found_data(-1, b"", "The group descriptors record " + str(total) + " " + name
+                                       + ", the superblock records " + str(recorded) + ".", "bitmap_count")
+                count += 1
         return count
 
     def check_all(self):
@@ -448,13 +1151,71 @@ class Detect:
         self.check_inode_bitmap_slack_space()
         self.check_block_bitmap_slack_space()
         self.check_osd2()
+        self.check_inode_table_tail()
         self.check_group_descriptor_reserved()
         self.check_gdt_growth_blocks()
         self.check_file_slack()
+        self.check_orphaned_blocks()
+        self.check_free_blocks()
+        self.check_directory_slack()
+        self.check_xattr_blocks()
+        self.check_journal()
+        self.check_checksums()
+        self.check_bitmap_counts()
 
         return self.techniques
 
 
+def detect_partition(file_name: str, string, jobs: int, offset: int):
+    """
+    Runs all the detection methods on the filesystem at offset of the image. Used as worker by
+    detect_image, so the messages are returned instead of logged.
+    Returns:
+        Tuple (offset, list of found data hiding techniques, list of messages)
+    """
+    # Detect encodes the strings in place, every instance needs its own list
+    detect = Detect(file_name, list(string) if type(string) == list else string, False, jobs, offset)
+    techniques = detect.check_all()
+    return offset, techniques, [str(message) for message in detect.messages]
+
+
+def detect_image(file_name: str, string=None, log: bool = False, jobs: int = 1):
+    """
+    Runs all the detection methods on every EXT4 filesystem of the image: the image itself if it is
+    a filesystem image, otherwise every EXT4 partition of its MBR or GPT partition table, in place.
+    If jobs > 1, the partitions are scanned in parallel processes and the remaining jobs are used to
+    scan the groups of each partition in parallel.
+    Returns:
+        Dictionary with the offset of every filesystem as key and the list of found data hiding
+        techniques as value
+    """
+    with ext4.open_image(file_name) as file:
+        offsets = ext4.PartitionTable(file).ext4_offsets()
+    if not offsets:
+        # No filesystem found, let the volume report the invalid superblock
+        offsets = [0]
+
+    if jobs > 1 and len(offsets) > 1:
+        worker = functools.partial(detect_partition, file_name, string, max(1, jobs // len(offsets)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(offsets))) as executor:
+            results = list(executor.map(worker, offsets))
+    else:
+        results = [detect_partition(file_name, string, jobs, offset) for offset in offsets]
+
+    techniques = {}
+    for offset, found, messages in results:
+        techniques[offset] = found
+        if not log:
+            continue
+        if offsets != [0]:
+            print("[INFO] Filesystem at offset " + str(offset) + ":")
+        for message in messages:
+            print(message)
+        if not messages:
+            print("No problems found.")
+    return techniques
+
+
 def init_argparser() -> argparse.ArgumentParser:
     desc = '''\
             A tool to detect hidden data in an EXT4 filesystem image.
@@ -463,11 +1224,11 @@ def init_argparser() -> argparse.ArgumentParser:
     parser.add_argument("-f", "--filename", help="The name of the EXT4 image.", required=True)
     parser.add_argument("--log", help="Enable or disable logging", action=argparse.BooleanOptionalAction, required=True)
     parser.add_argument("-s", "--string", help="Specify a string to search for.", nargs="?", const=None)
+    parser.add_argument("-j", "--jobs", help="Number of partitions and groups to scan in parallel.", type=int, default=1)
     return parser
 
 
 if __name__ == "__main__":
     parser = init_argparser()
     args = parser.parse_args()
-    detect = Detect(args.filename, args.string, args.log)
-    detect.check_all()
+    detect_image(args.filename, args.string, args.log, args.jobs)
@@ -0,0 +1,21 @@
+import argparse
+import ext4
+
+
+def init_argparser() -> argparse.ArgumentParser:
+    desc = '''\
+            A tool to hash every regular file in an EXT4 filesystem image.
+            Outputs one JSON object per file (NDJSON).'''
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=desc)
+    parser.add_argument("-f", "--filename", help="The name of the EXT4 image.", required=True)
+    parser.add_argument("-a", "--algorithm", help="Hash algorithm to use, can be given multiple times.", action="append")
+    parser.add_argument("-j", "--jobs", help="Number of worker processes.", type=int, default=None)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = init_argparser()
+    args = parser.parse_args()
+    with ext4.open_image(args.filename) as file:
+        volume = ext4.Volume(file, offset=0, lazy=True)
+        ext4.Tools.hash_files(volume, algorithms=args.algorithm or ["sha256"], jobs=args.jobs)
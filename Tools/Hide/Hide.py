@@ -6,7 +6,7 @@ import argparse
 
 
 class Hide:
-    def __init__(self, file_name=None, type=None, data=None, inode=None, group=None, log=False):
+    def __init__(self, file_name=None, type=None, data=None, inode=None, group=None, log=False, offset=0):
         if file_name is None or type is None or data is None:
             raise MissingData
 
@@ -14,10 +14,19 @@ class Hide:
         self.type = type
         self.data = data
         self.log = log
-
-        self.file = open(self.file_name, "rb")
-        self.fd = os.open(self.file_name, os.O_RDWR)
-        self.volume = ext4.Volume(self.file, offset=0)
+        # Byte offset of the filesystem within the image, all other offsets are relative to the filesystem
+        self.offset = offset
+
+        # file_name is the name of the image (split raw images are opened as one stream) or an opened
+        # writable image stream, e.g. an ext4.SegmentedStream, which is left open
+        self.own_file = isinstance(file_name, str)
+        self.file = ext4.open_image(file_name, writable=True) if self.own_file else file_name
+        # Images backed by a file are written with os.pwrite, other streams with their own positional writes
+        try:
+            self.fd = os.dup(self.file.fileno())
+        except (AttributeError, OSError):
+            self.fd = None
+        self.volume = ext4.Volume(self.file, offset=self.offset, lazy=True)
         self.superblock = self.volume.superblock
         self.blocks_per_group = getattr(self.superblock, "s_blocks_per_group")
         self.inode = inode
@@ -40,8 +49,20 @@ class Hide:
 
     def __del__(self):
         if hasattr(self, "file"):
-            self.file.close()
-            os.close(self.fd)
+            if self.own_file:
+                self.file.close()
+            if self.fd is not None:
+                os.close(self.fd)
+
+    def pwrite(self, data: bytes, offset: int):
+        """
+        Writes data at offset of the filesystem.
+        Returns:
+            Number of bytes written
+        """
+        if self.fd is None:
+            return self.file.pwrite(data, self.offset + offset)
+        return os.pwrite(self.fd, data, self.offset + offset)
 
     def check_all(self, size: int, data: str):
         """
@@ -68,7 +89,7 @@ class Hide:
         """
         inode_location = self.volume.get_inode(inode)
         location = inode_location.offset + offset
-        written = os.pwrite(self.fd, data, location)
+        written = self.pwrite(data, location)
         return written, location
 
     def superblock_slack(self, data: str):
@@ -83,12 +104,11 @@ class Hide:
         if self.volume.block_size <= 1024:
             raise BlockSizeTooSmall
 
-        blocks_per_group = getattr(self.superblock, "s_blocks_per_group")
         # Superblock is always 1024 bytes long
         length_backup_copy: Final = 1024
-        location = (self.group * blocks_per_group) * self.volume.block_size + length_backup_copy
+        location = self.volume.group_range(self.group)[0] * self.volume.block_size + length_backup_copy
         size, data_bytes = self.check_all(self.volume.block_size - length_backup_copy, data)
-        written = os.pwrite(self.fd, data_bytes, location)
+        written = self.pwrite(data_bytes, location)
         return written, location
 
     def file_slack(self, data: str):
@@ -103,18 +123,15 @@ class Hide:
         inode = self.volume.get_inode(self.inode)
         size = inode.__len__()
         try:
-            # Get block index of the startblock
-            start_block = inode.open_read().block_map[0].disk_block_idx
-            # Obtain number of blocks used by the file
-            n_blocks = inode.open_read().block_map[0].block_count
-            # Calculate end block and how much of the end block is used
-            end_block = (start_block + n_blocks - 1) * self.volume.block_size
+            # Calculate the block holding the last byte and how much of the end block is used
+            end_block = inode.open_read().get_block_mapping((size - 1) // self.volume.block_size) * self.volume.block_size
             block_used = size % self.volume.block_size
-            location = end_block + block_used
-            # Calculate the size of slack space
-            size_to_write = self.volume.block_size - block_used
+            location = end_block + (block_used or self.volume.block_size)
+            # Calculate the size of slack space, with bigalloc it extends to the end of the cluster
+            cluster_end = end_block + self.volume.block_size + (-(end_block + self.volume.block_size) % self.volume.cluster_size)
+            size_to_write = cluster_end - location
             size, data_bytes = self.check_all(size_to_write, data)
-            written = os.pwrite(self.fd, data_bytes, location)
+            written = self.pwrite(data_bytes, location)
             return written, location
         except:
             return 0, 0
@@ -135,7 +152,7 @@ class Hide:
         offset = int((bitmap * block_size) + (inodes_per_group / 8))
         size_slack_space = int(self.volume.block_size - (inodes_per_group / 8))
         size, data_bytes = self.check_all(size_slack_space, data)
-        written = os.pwrite(self.fd, data_bytes, offset)
+        written = self.pwrite(data_bytes, offset)
         return written, offset
 
     def block_bitmap(self, data: str):
@@ -146,17 +163,18 @@ class Hide:
             Location where the data is written to
         """
         block_size = self.volume.block_size
-        blocks_per_group = getattr(self.superblock, "s_blocks_per_group")
+        # The block bitmap has one bit per cluster
+        clusters_per_group = getattr(self.superblock, "s_clusters_per_group")
         # Check if there is a slack space
-        if blocks_per_group == (block_size * 8):
+        if clusters_per_group == (block_size * 8):
             return 0, 0
-        offset = (blocks_per_group / 8)
-        size = blocks_per_group - offset
+        offset = (clusters_per_group / 8)
+        size = block_size - offset
         size, data_bytes = self.check_all(size, data)
         gd = self.volume.group_descriptors
         bitmap = getattr(gd[0], "bg_block_bitmap")
         location = int((bitmap * block_size) + offset)
-        written = os.pwrite(self.fd, data_bytes, location)
+        written = self.pwrite(data_bytes, location)
         return written, location
 
     def gd_reserved(self, data: str):
@@ -166,18 +184,12 @@ class Hide:
             Number of bytes written
             Location where the data is written to
         """
-        # Add the padding if the block size is 1024
-        offset = 1
-        if self.volume.block_size == 1024:
-            offset = 2
         reserved_offset: Final = 0x3C
         size, data_bytes = self.check_all(2, data)
-        group: Final = self.group
-        size = self.volume.block_size
-        sb = self.volume.superblock
-        blocks_per_group = getattr(sb, "s_blocks_per_group")
-        location = (((group * blocks_per_group) + offset) * size) + reserved_offset
-        written = os.pwrite(self.fd, data_bytes, location)
+        # First block of the group descriptor table copy in the group
+        block = self.volume.group_gdt_blocks(self.group)[0][0]
+        location = (block * self.volume.block_size) + reserved_offset
+        written = self.pwrite(data_bytes, location)
         return written, location
 
     def reserved_space_inode(self, data: str):
@@ -222,7 +234,7 @@ class Hide:
         """
         offset: Final = 0
         size, data_bytes = self.check_all(1024, data)
-        written = os.pwrite(self.fd, data_bytes, offset)
+        written = self.pwrite(data_bytes, offset)
         return written, offset
 
     def backup_superblock(self, data: str):
@@ -232,21 +244,15 @@ class Hide:
             Number of bytes written
             Location where the data is written to
         """
-        # Padding if the block size is 1024
-        offset = 0
-        if self.volume.block_size == 1024:
-            offset = 1
-        sb = self.volume.superblock
         block_size = self.volume.block_size
-        blocks_per_group = getattr(sb, "s_blocks_per_group")
         gd = self.volume.group_descriptors
         # Check if there are minimal 2 group descriptors
         if len(gd) < 3:
             raise TooFewBlockGroups
 
         size, data_bytes = self.check_all(1024, data)
-        location = ((blocks_per_group * self.group) + offset) * block_size
-        written = os.pwrite(self.fd, data_bytes, location)
+        location = self.volume.group_range(self.group)[0] * block_size
+        written = self.pwrite(data_bytes, location)
         return written, location
 
     def extended_attributes(self, data: str):
@@ -269,18 +275,12 @@ class Hide:
             Number of bytes written
             Location where the data is written to
         """
-        # Calculate number of blocks occupied by the group descriptor table entries
-        skip_blocks = int((len(self.volume.group_descriptors) * 64) / self.volume.block_size) + 1
-        reserved_gdt_blocks = getattr(self.superblock, "s_reserved_gdt_blocks")
-        # Padding if the block size is 1024
-        skip_start = 1
-        if self.volume.block_size == 1024:
-            skip_start = 2
-        start = skip_start + skip_blocks + (self.group * self.blocks_per_group)
+        # The growth blocks follow the group descriptor table copy in the group
+        start, reserved_gdt_blocks = self.volume.group_reserved_gdt_blocks(self.group)
         size = int(reserved_gdt_blocks * self.volume.block_size - (reserved_gdt_blocks / 8))
         size, data_bytes = self.check_all(size, data)
         location = start * self.volume.block_size + int(reserved_gdt_blocks / 8)
-        written = os.pwrite(self.fd, data_bytes, location)
+        written = self.pwrite(data_bytes, location)
         return written, location
 
     def check_if_possible(self):
@@ -291,20 +291,27 @@ class Hide:
         """
         match self.type:
             case "block_bitmap":
-                if self.blocks_per_group == (self.volume.block_size * 8):
+                if getattr(self.superblock, "s_clusters_per_group") == (self.volume.block_size * 8):
                     return False
                 return True
             case "backup_superblock":
                 if len(self.volume.group_descriptors) < 3:
                     return False
-                return True
+                return self.volume.group_has_superblock(self.group)
             case "superblock_slack":
                 if self.volume.block_size <= 1024:
                     return False
-                return True
+                return self.volume.group_has_superblock(self.group)
+            case "gd_reserved":
+                # Only 64 byte group descriptors have the reserved field
+                if getattr(self.superblock, "s_desc_size") < 64:
+                    return False
+                return len(self.volume.group_gdt_blocks(self.group)) > 0
+            case "growth_blocks":
+                return self.volume.group_reserved_gdt_blocks(self.group)[1] > 0
             case "file_slack":
                 inode = self.volume.get_inode(self.inode)
-                if not inode.is_file:
+                if not inode.is_file or inode.has_inline_data:
                     return False
                 try:
                     inode.open_read().block_map[0].disk_block_idx
@@ -361,13 +368,14 @@ def init_argparser() -> argparse.ArgumentParser:
     parser.add_argument("--log", help="Enable or disable logging", action=argparse.BooleanOptionalAction, required=True)
     parser.add_argument("-i", "--inode", help="Specify a inode to hide the data.", nargs="?", const=None)
     parser.add_argument("-g", "--group", help="Specify a group to hide the data.", nargs="?", const=None)
+    parser.add_argument("-o", "--offset", help="Byte offset of the EXT4 filesystem within the image (e.g. of a partition).", type=int, default=0)
     return parser
 
 
 if __name__ == "__main__":
     parser = init_argparser()
     args = parser.parse_args()
-    HideInstance = Hide(args.filename, args.technique, args.data, args.inode, args.group)
+    HideInstance = Hide(args.filename, args.technique, args.data, args.inode, args.group, offset=args.offset)
     bytes, location_hidden = HideInstance.get_hiding_technique()
     if args.log:
         HideInstance.logger(written_bytes=bytes, location=location_hidden)
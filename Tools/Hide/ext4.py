@@ -1,8 +1,22 @@
+import array
+import bisect
+import collections
+import concurrent.futures
 import ctypes
 import functools
+import hashlib
+import heapq
 import io
+import json
+import lzma
 import math
-import queue
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
 
 
 
@@ -21,6 +35,296 @@ def wcscmp (str_a, str_b):
     tmp = len(str_a) - len(str_b)
     return -1 if tmp < 0 else 1 if tmp > 0 else 0
 
+_NONZERO_BYTES = re.compile(rb"[^\x00]+")
+_FULL_BYTES = re.compile(rb"\xFF+")
+
+def bitmap_runs (bitmap, bit_count = None):
+    """
+    Generator: Yields the runs of set bits in bitmap (bytes, least significant bit first as in ext4 bitmaps) as tuples
+    (bit_idx, bit_count). Only the first bit_count bits are considered (default: all). Runs of 0x00 and 0xFF bytes are
+    located with regular expressions, so only bytes with mixed bits are examined bit by bit.
+    """
+    if bit_count is None:
+        bit_count = len(bitmap) * 8
+
+    bitmap = bitmap[:(bit_count + 7) // 8]
+    pieces = [] # Runs of the current non-zero span, in order
+
+    def mixed_bits (byte_idx):
+        byte = bitmap[byte_idx]
+        for bit in range(8):
+            if (byte >> bit) & 1:
+                pieces.append((byte_idx * 8 + bit, byte_idx * 8 + bit + 1))
+
+    run_start, run_end = None, None
+
+    for span in _NONZERO_BYTES.finditer(bitmap):
+        span_start, span_end = span.span()
+        position = span_start
+
+        for full in _FULL_BYTES.finditer(bitmap, span_start, span_end):
+            for byte_idx in range(position, full.start()):
+                mixed_bits(byte_idx)
+            pieces.append((full.start() * 8, full.end() * 8))
+            position = full.end()
+
+        for byte_idx in range(position, span_end):
+            mixed_bits(byte_idx)
+
+        # Merge adjacent pieces and clip them to bit_count
+        for start, end in pieces:
+            end = min(end, bit_count)
+            if start >= end:
+                continue
+
+            if start == run_end:
+                run_end = end
+                continue
+
+            if run_start is not None:
+                yield (run_start, run_end - run_start)
+            run_start, run_end = start, end
+
+        pieces.clear()
+
+    if run_start is not None:
+        yield (run_start, run_end - run_start)
+
+def nonzero_block_runs (data, block_size):
+    """
+    Generator: Yields the runs of blocks of block_size bytes in data (a bytes-like object) which contain non-zero bytes
+    as tuples (block_idx, block_count). Non-zero bytes are located with a regular expression.
+    """
+    run_start, run_end = None, None
+
+    for span in _NONZERO_BYTES.finditer(data):
+        start = span.start() // block_size
+        end = (span.end() - 1) // block_size + 1
+
+        if run_end is not None and start <= run_end:
+            run_end = max(run_end, end)
+            continue
+
+        if run_start is not None:
+            yield (run_start, run_end - run_start)
+        run_start, run_end = start, end
+
+    if run_start is not None:
+        yield (run_start, run_end - run_start)
+
+def popcount (data, bit_count = None):
+    """
+    Returns the number of set bits in data (a bytes-like object, e.g. a bitmap), counting only its first bit_count bits
+    if bit_count is not None. The bits are counted on data converted to a single integer, not byte by byte.
+    """
+    if bit_count is None:
+        return int.from_bytes(data, "little").bit_count()
+
+    value = int.from_bytes(data[:(bit_count + 7) // 8], "little")
+    return (value & ((1 << bit_count) - 1)).bit_count()
+
+def merge_runs (runs):
+    """
+    Returns the tuples (start, count) of runs sorted, with overlapping and adjacent runs merged.
+    """
+    result = []
+
+    for start, count in sorted(runs):
+        if result and start <= result[-1][0] + result[-1][1]:
+            last_start, last_count = result[-1]
+            result[-1] = (last_start, max(last_count, start + count - last_start))
+        else:
+            result.append((start, count))
+
+    return result
+
+def subtract_runs (runs, removed):
+    """
+    Generator: Takes two iterables of sorted, non-overlapping tuples (start, count) and yields the parts of runs not
+    covered by removed as tuples (start, count).
+    """
+    removed = iter(removed)
+    cover = next(removed, None)
+
+    for start, count in runs:
+        end = start + count
+
+        while start < end:
+            # Skip removed runs ending before the current position
+            while cover is not None and cover[0] + cover[1] <= start:
+                cover = next(removed, None)
+
+            if cover is None or cover[0] >= end:
+                yield (start, end - start)
+                break
+
+            if cover[0] > start:
+                yield (start, cover[0] - start)
+
+            start = cover[0] + cover[1]
+
+def _rol32 (value, shift):
+    return ((value << shift) | (value >> (32 - shift))) & 0xFFFFFFFF
+
+def _dx_hack_hash (name, signed):
+    """
+    Legacy directory hash (fs/ext4/hash.c, dx_hack_hash_*)
+    """
+    hash0, hash1 = 0x12A3FE2D, 0x37ABE8F9
+
+    for c in name:
+        if signed and c >= 0x80: c -= 0x100
+
+        tmp = (hash1 + (hash0 ^ ((c * 7152373) & 0xFFFFFFFF))) & 0xFFFFFFFF
+        if tmp & 0x80000000: tmp = (tmp - 0x7FFFFFFF) & 0xFFFFFFFF
+
+        hash1, hash0 = hash0, tmp
+
+    return (hash0 << 1) & 0xFFFFFFFF
+
+def _str2hashbuf (name, num, signed):
+    """
+    Packs (the start of) name into num 32-bit words padded with its length (fs/ext4/hash.c, str2hashbuf_*)
+    """
+    pad = len(name) | (len(name) << 8)
+    pad = (pad | (pad << 16)) & 0xFFFFFFFF
+
+    buf = []
+    val = pad
+    for i, c in enumerate(name[:num * 4]):
+        if signed and c >= 0x80: c -= 0x100
+
+        val = (c + (val << 8)) & 0xFFFFFFFF
+        if i % 4 == 3:
+            buf.append(val)
+            val = pad
+
+    if len(buf) < num: buf.append(val)
+    buf.extend([pad] * (num - len(buf)))
+    return buf
+
+# Tuples (function, input word order, shifts, constant) for the three rounds of half_md4_transform
+_HALF_MD4_ROUNDS = (
+    (lambda x, y, z: z ^ (x & (y ^ z)), (0, 1, 2, 3, 4, 5, 6, 7), (3, 7, 11, 19), 0),
+    (lambda x, y, z: (x & y) + ((x ^ y) & z), (1, 3, 5, 7, 0, 2, 4, 6), (3, 5, 9, 13), 0o13240474631),
+    (lambda x, y, z: x ^ y ^ z, (3, 7, 2, 6, 1, 5, 0, 4), (3, 9, 11, 15), 0o15666365641)
+)
+
+def _half_md4_transform (buf, data):
+    """
+    Cut-down MD4 transformation used by the half_md4 directory hash, updates buf (4 words) in place
+    """
+    state = list(buf)
+
+    for function, order, shifts, constant in _HALF_MD4_ROUNDS:
+        for i, word_idx in enumerate(order):
+            # The updated word rotates a, d, c, b
+            target = (4 - i) % 4
+            x, y, z = state[(target + 1) % 4], state[(target + 2) % 4], state[(target + 3) % 4]
+            state[target] = _rol32((state[target] + function(x, y, z) + data[word_idx] + constant) & 0xFFFFFFFF, shifts[i % 4])
+
+    for i in range(4):
+        buf[i] = (buf[i] + state[i]) & 0xFFFFFFFF
+
+def _tea_transform (buf, data):
+    """
+    TEA transformation used by the tea directory hash, updates buf (4 words) in place
+    """
+    total = 0
+    b0, b1 = buf[0], buf[1]
+    a, b, c, d = data
+
+    for _ in range(16):
+        total = (total + 0x9E3779B9) & 0xFFFFFFFF
+        b0 = (b0 + ((((b1 << 4) + a) ^ (b1 + total) ^ ((b1 >> 5) + b)) & 0xFFFFFFFF)) & 0xFFFFFFFF
+        b1 = (b1 + ((((b0 << 4) + c) ^ (b0 + total) ^ ((b0 >> 5) + d)) & 0xFFFFFFFF)) & 0xFFFFFFFF
+
+    buf[0] = (buf[0] + b0) & 0xFFFFFFFF
+    buf[1] = (buf[1] + b1) & 0xFFFFFFFF
+
+def dx_hash (name, hash_version, seed = None):
+    """
+    Returns the 32-bit hash of the raw directory entry name (bytes) as used by hash tree directories. hash_version is
+    one of the ext4_dx_root_info.DX_HASH_* constants and seed the superblock's s_hash_seed (4 words). The minor hash is
+    not computed, as it is not needed for lookups.
+    """
+    if seed is not None and any(seed):
+        buf = list(seed)
+    else:
+        buf = [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476]
+
+    if hash_version in (ext4_dx_root_info.DX_HASH_LEGACY, ext4_dx_root_info.DX_HASH_LEGACY_UNSIGNED):
+        hash = _dx_hack_hash(name, hash_version == ext4_dx_root_info.DX_HASH_LEGACY)
+    elif hash_version in (ext4_dx_root_info.DX_HASH_HALF_MD4, ext4_dx_root_info.DX_HASH_HALF_MD4_UNSIGNED):
+        for i in range(0, len(name), 32):
+            _half_md4_transform(buf, _str2hashbuf(name[i:], 8, hash_version == ext4_dx_root_info.DX_HASH_HALF_MD4))
+        hash = buf[1]
+    elif hash_version in (ext4_dx_root_info.DX_HASH_TEA, ext4_dx_root_info.DX_HASH_TEA_UNSIGNED):
+        for i in range(0, len(name), 16):
+            _tea_transform(buf, _str2hashbuf(name[i:], 4, hash_version == ext4_dx_root_info.DX_HASH_TEA))
+        hash = buf[0]
+    else:
+        raise NotImplementedError(f"Directory hash version {hash_version:d} is not implemented.")
+
+    hash &= ~1
+    if hash == 0x7FFFFFFF << 1: # EXT4_HTREE_EOF_32BIT is reserved
+        hash = 0x7FFFFFFE << 1
+
+    return hash
+
+def _crc_tables (polynomial):
+    """
+    Returns the eight lookup tables for computing the reflected CRC with the (reversed) polynomial eight bytes at a time
+    ("slicing-by-8"). Table k maps a byte to its contribution k bytes before the end of an 8-byte word.
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ (polynomial if crc & 1 else 0)
+        table.append(crc)
+
+    tables = [table]
+    for _ in range(7):
+        tables.append([(crc >> 8) ^ table[crc & 0xFF] for crc in tables[-1]])
+
+    return tables
+
+_CRC32C_TABLES = _crc_tables(0x82F63B78)
+_CRC16_TABLES = _crc_tables(0xA001)
+
+def _crc_slice8 (tables, data, crc):
+    """
+    Returns the reflected CRC of data (a bytes-like object) continuing from crc, using the tables of _crc_tables. The
+    bulk of data is processed as little-endian 64-bit words, only the remaining tail byte by byte.
+    """
+    t0, t1, t2, t3, t4, t5, t6, t7 = tables
+    word_len = len(data) & ~7
+
+    for (word,) in struct.iter_unpack("<Q", data[:word_len]):
+        word ^= crc
+        crc = (t7[word & 0xFF] ^ t6[(word >> 8) & 0xFF] ^ t5[(word >> 16) & 0xFF] ^ t4[(word >> 24) & 0xFF] ^
+               t3[(word >> 32) & 0xFF] ^ t2[(word >> 40) & 0xFF] ^ t1[(word >> 48) & 0xFF] ^ t0[word >> 56])
+
+    for byte in data[word_len:]:
+        crc = t0[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+
+    return crc
+
+def crc32c (data, crc = 0xFFFFFFFF):
+    """
+    Returns the CRC-32C (Castagnoli) of data (a bytes-like object) continuing from crc. Like ext4's checksums, the
+    result is not inverted, so it can be passed as crc to continue the computation.
+    """
+    return _crc_slice8(_CRC32C_TABLES, data, crc)
+
+def crc16 (data, crc = 0xFFFF):
+    """
+    Returns the CRC-16 (polynomial 0x8005, reflected) of data (a bytes-like object) continuing from crc, as used for
+    group descriptor checksums without metadata_csum.
+    """
+    return _crc_slice8(_CRC16_TABLES, data, crc)
+
 
 
 ########################################################################################################################
@@ -109,6 +413,43 @@ class ext4_dir_entry_2 (ext4_struct):
 
 
 
+class ext4_dx_countlimit (ext4_struct):
+    _fields_ = [
+        ("limit", ctypes.c_ushort), # 0x0
+        ("count", ctypes.c_ushort), # 0x2
+        ("block", ctypes.c_uint)    # 0x4, Block of the first entry, whose hash is implicitly 0
+    ]
+
+
+
+class ext4_dx_entry (ext4_struct):
+    _fields_ = [
+        ("hash", ctypes.c_uint), # 0x0
+        ("block", ctypes.c_uint) # 0x4
+    ]
+
+
+
+class ext4_dx_root_info (ext4_struct):
+    # hash_version
+    DX_HASH_LEGACY            = 0x0
+    DX_HASH_HALF_MD4          = 0x1
+    DX_HASH_TEA               = 0x2
+    DX_HASH_LEGACY_UNSIGNED   = 0x3
+    DX_HASH_HALF_MD4_UNSIGNED = 0x4
+    DX_HASH_TEA_UNSIGNED      = 0x5
+    DX_HASH_SIPHASH           = 0x6
+
+    _fields_ = [
+        ("reserved_zero", ctypes.c_uint),    # 0x0
+        ("hash_version", ctypes.c_ubyte),    # 0x4
+        ("info_length", ctypes.c_ubyte),     # 0x5, Must be 0x8
+        ("indirect_levels", ctypes.c_ubyte), # 0x6
+        ("unused_flags", ctypes.c_ubyte)     # 0x7
+    ]
+
+
+
 class ext4_extent (ext4_struct):
     _fields_ = [
         ("ee_block", ctypes.c_uint),      # 0x0000
@@ -141,6 +482,11 @@ class ext4_extent_idx (ext4_struct):
 
 
 class ext4_group_descriptor (ext4_struct):
+    # bg_flags
+    EXT4_BG_INODE_UNINIT = 0x1 # Inode table and bitmap are not initialized
+    EXT4_BG_BLOCK_UNINIT = 0x2 # Block bitmap is not initialized
+    EXT4_BG_INODE_ZEROED = 0x4 # Inode table is zeroed
+
     _fields_ = [
         ("bg_block_bitmap_lo", ctypes.c_uint),        # 0x0000
         ("bg_inode_bitmap_lo", ctypes.c_uint),        # 0x0004
@@ -260,9 +606,26 @@ class ext4_superblock (ext4_struct):
     EXT2_MIN_DESC_SIZE = 0x20 # Default value for s_desc_size, if INCOMPAT_64BIT is not set (NEEDS CONFIRMATION)
     EXT2_MIN_DESC_SIZE_64BIT = 0x40 # Default value for s_desc_size, if INCOMPAT_64BIT is set
 
+    # s_feature_compat
+    COMPAT_HAS_JOURNAL = 0x4 # Has a journal (in the inode s_journal_inum)
+    COMPAT_SPARSE_SUPER2 = 0x200 # Superblock backups only in the (up to) two groups in s_backup_bgs
+
     # s_feature_incompat
     INCOMPAT_64BIT    = 0x80 # Uses 64-bit features (e.g. *_hi structure fields in ext4_group_descriptor)
     INCOMPAT_FILETYPE =  0x2 # Directory entries record file type (instead of inode flags)
+    INCOMPAT_META_BG  = 0x10 # Group descriptor table blocks are stored within the meta block groups they describe
+    INCOMPAT_MMP      = 0x100 # Multiple mount protection block
+    INCOMPAT_CSUM_SEED = 0x2000 # Metadata checksum seed is stored in s_checksum_seed
+
+    # s_feature_ro_compat
+    RO_COMPAT_SPARSE_SUPER = 0x1 # Superblock backups only in groups 0, 1 and powers of 3, 5 and 7
+    RO_COMPAT_GDT_CSUM     = 0x10 # Group descriptors have checksums, allows uninitialized groups (uninit_bg)
+    RO_COMPAT_BIGALLOC     = 0x200 # Blocks are allocated in clusters of 2^s_log_cluster_size KiB
+    RO_COMPAT_METADATA_CSUM = 0x400 # Metadata checksums, implies the semantics of RO_COMPAT_GDT_CSUM
+
+    # s_flags
+    FLAGS_SIGNED_HASH   = 0x1 # Directory hashes treat names as signed chars
+    FLAGS_UNSIGNED_HASH = 0x2 # Directory hashes treat names as unsigned chars
 
     _fields_ = [
         ("s_inodes_count", ctypes.c_uint),                 # 0x0000
@@ -456,6 +819,79 @@ class ext4_xattr_ibody_header (ext4_struct):
 
 
 
+class mbr_partition_entry (ext4_struct):
+    # type
+    TYPE_EMPTY          = 0x00
+    TYPE_EXTENDED       = (0x05, 0x0F, 0x85) # CHS, LBA and Linux extended partitions
+    TYPE_GPT_PROTECTIVE = 0xEE
+
+    _fields_ = [
+        ("status", ctypes.c_ubyte),          # 0x0
+        ("chs_first", ctypes.c_ubyte * 3),   # 0x1
+        ("type", ctypes.c_ubyte),            # 0x4
+        ("chs_last", ctypes.c_ubyte * 3),    # 0x5
+        ("lba_first", ctypes.c_uint),        # 0x8
+        ("sector_count", ctypes.c_uint)      # 0xC
+    ]
+
+
+
+class gpt_header (ext4_struct):
+    SIGNATURE = b"EFI PART"
+
+    _pack_ = 1 # 92 bytes, without trailing padding
+    _fields_ = [
+        ("signature", ctypes.c_char * 8),             # 0x00, Must be "EFI PART"
+        ("revision", ctypes.c_uint),                  # 0x08
+        ("header_size", ctypes.c_uint),               # 0x0C
+        ("header_crc32", ctypes.c_uint),              # 0x10
+        ("reserved", ctypes.c_uint),                  # 0x14
+        ("current_lba", ctypes.c_ulonglong),          # 0x18
+        ("backup_lba", ctypes.c_ulonglong),           # 0x20
+        ("first_usable_lba", ctypes.c_ulonglong),     # 0x28
+        ("last_usable_lba", ctypes.c_ulonglong),      # 0x30
+        ("disk_guid", ctypes.c_ubyte * 16),           # 0x38
+        ("partition_entries_lba", ctypes.c_ulonglong),# 0x48
+        ("num_partition_entries", ctypes.c_uint),     # 0x50
+        ("partition_entry_size", ctypes.c_uint),      # 0x54
+        ("partition_entries_crc32", ctypes.c_uint)    # 0x58
+    ]
+
+
+
+class gpt_partition_entry (ext4_struct):
+    _fields_ = [
+        ("type_guid", ctypes.c_ubyte * 16),  # 0x00, All zeros for unused entries
+        ("unique_guid", ctypes.c_ubyte * 16),# 0x10
+        ("first_lba", ctypes.c_ulonglong),   # 0x20
+        ("last_lba", ctypes.c_ulonglong),    # 0x28, Inclusive
+        ("attributes", ctypes.c_ulonglong),  # 0x30
+        ("name", ctypes.c_ubyte * 72)        # 0x38, UTF-16LE
+    ]
+
+
+
+class z_stream (ctypes.Structure):
+    # zlib's stream state (zlib.h), in native byte order and alignment
+    _fields_ = [
+        ("next_in", ctypes.c_void_p),
+        ("avail_in", ctypes.c_uint),
+        ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p),
+        ("avail_out", ctypes.c_uint),
+        ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p),
+        ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p),
+        ("zfree", ctypes.c_void_p),
+        ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int),
+        ("adler", ctypes.c_ulong),
+        ("reserved", ctypes.c_ulong)
+    ]
+
+
+
 class InodeType:
     UNKNOWN          =  0x0 # Unknown file type
     FILE             =  0x1 # Regular file
@@ -473,32 +909,228 @@ class InodeType:
 ####################################################   HIGH LEVEL   ####################################################
 ########################################################################################################################
 
+class ReadAhead:
+    """
+    Helper class: Adaptive read-ahead for a file descriptor. Once accesses are sequential, the kernel is asked to
+    prefetch a window ahead of the cursor (POSIX_FADV_WILLNEED), which doubles on every sequential access up to
+    MAX_WINDOW. Pages more than one window behind the cursor are dropped (POSIX_FADV_DONTNEED), so that sweeps do not
+    pollute the page cache. On platforms without posix_fadvise this class does nothing.
+    """
+    MIN_WINDOW = 128 * 1024
+    MAX_WINDOW = 8 * 1024 * 1024
+
+    def __init__ (self, fd, drop_behind = True):
+        """
+        Initialize a ReadAhead instance for fd (None disables read-ahead). If drop_behind is False, pages behind the
+        cursor are left in the page cache.
+        """
+        self.drop_behind = drop_behind
+        self.enabled = fd is not None and hasattr(os, "posix_fadvise")
+        self.fd = fd
+
+        self.cursor = None # End of the last access
+        self.dropped = 0 # End of the region dropped from the page cache
+        self.prefetched = 0 # End of the region requested from the kernel
+        self.window = 0 # 0 while the access pattern is not sequential
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(fd = {self.fd!r:s}, enabled = {self.enabled!r:s}, window = {self.window!r:s})"
+
+    def _advise (self, offset, byte_len, advice):
+        try:
+            os.posix_fadvise(self.fd, offset, byte_len, advice)
+        except OSError:
+            # E.g. the descriptor refers to a pipe
+            self.enabled = False
+
+    def access (self, offset, byte_len):
+        """
+        Registers a read of byte_len bytes at the absolute file offset and issues read-ahead and drop-behind advice.
+        """
+        if not self.enabled:
+            return
+
+        end = offset + byte_len
+
+        if self.cursor is not None and self.cursor - ReadAhead.MIN_WINDOW <= offset <= self.cursor + max(self.window, ReadAhead.MIN_WINDOW):
+            # Sequential access: grow the window
+            self.window = min(max(2 * self.window, ReadAhead.MIN_WINDOW), ReadAhead.MAX_WINDOW)
+            self.cursor = max(self.cursor, end)
+        else:
+            # Random access: reset
+            self.cursor = end
+            self.dropped = offset
+            self.prefetched = end
+            self.window = 0
+            return
+
+        # Prefetch, once less than half a window is left ahead of the cursor
+        if self.prefetched - self.cursor < self.window // 2:
+            start = max(self.prefetched, self.cursor)
+            self._advise(start, self.cursor + self.window - start, os.POSIX_FADV_WILLNEED)
+            self.prefetched = self.cursor + self.window
+
+        # Drop pages behind the cursor
+        if self.drop_behind and offset - self.window > self.dropped:
+            self._advise(self.dropped, offset - self.window - self.dropped, os.POSIX_FADV_DONTNEED)
+            self.dropped = offset - self.window
+
+
+
+class BlockCache:
+    """
+    Helper class: Block-granular LRU cache with a byte budget. Blocks are evicted least recently used first, as soon as
+    the cached bytes exceed byte_budget. hits and misses count block lookups.
+    """
+    def __init__ (self, byte_budget):
+        """
+        Initialize an empty BlockCache instance holding at most byte_budget bytes.
+        """
+        self.byte_budget = byte_budget
+        self.byte_size = 0
+        self.blocks = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__ (self):
+        return len(self.blocks)
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(byte_budget = {self.byte_budget!r:s}, byte_size = {self.byte_size!r:s}, hits = {self.hits!r:s}, misses = {self.misses!r:s})"
+
+    def get (self, block_idx):
+        """
+        Returns the cached block specified by block_idx or None, if it is not cached.
+        """
+        block = self.blocks.get(block_idx)
+
+        if block is None:
+            self.misses += 1
+            return None
+
+        self.blocks.move_to_end(block_idx)
+        self.hits += 1
+        return block
+
+    @property
+    def hit_ratio (self):
+        """
+        Returns the fraction of block lookups which were served from the cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups != 0 else 0.0
+
+    def invalidate (self):
+        """
+        Drops all cached blocks, e.g. after the underlying stream was written to.
+        """
+        self.blocks.clear()
+        self.byte_size = 0
+
+    def put (self, block_idx, block):
+        """
+        Caches block (bytes) as block_idx and evicts the least recently used blocks until the budget is met again.
+        """
+        if len(block) > self.byte_budget:
+            return
+
+        old_block = self.blocks.pop(block_idx, None)
+        if old_block is not None:
+            self.byte_size -= len(old_block)
+
+        self.blocks[block_idx] = block
+        self.byte_size += len(block)
+
+        while self.byte_size > self.byte_budget:
+            _, evicted_block = self.blocks.popitem(last = False)
+            self.byte_size -= len(evicted_block)
+
+
+
+class DentryCache:
+    """
+    Helper class: LRU cache of path lookups, mapping (parent inode index, name) to the directory entry tuple returned by
+    Inode.lookup. Failed lookups are cached as well (negative entries). hits and misses count lookups.
+    """
+    def __init__ (self, max_entries):
+        """
+        Initialize an empty DentryCache instance holding at most max_entries entries.
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__ (self):
+        return len(self.entries)
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(max_entries = {self.max_entries!r:s}, entries = {len(self)!r:s}, hits = {self.hits!r:s}, misses = {self.misses!r:s})"
+
+    def get (self, parent_inode_idx, name):
+        """
+        Returns the cached entry tuple of name in the directory specified by parent_inode_idx or None, if it is not cached.
+        A cached negative entry is returned as (None, None, None).
+        """
+        entry = self.entries.get((parent_inode_idx, name))
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end((parent_inode_idx, name))
+        self.hits += 1
+        return entry
+
+    def invalidate (self):
+        """
+        Drops all cached entries, e.g. after the underlying stream was written to.
+        """
+        self.entries.clear()
+
+    def put (self, parent_inode_idx, name, entry):
+        """
+        Caches entry (tuple) for name in the directory specified by parent_inode_idx and evicts the least recently used
+        entry, if the cache is full.
+        """
+        self.entries[(parent_inode_idx, name)] = entry
+        self.entries.move_to_end((parent_inode_idx, name))
+
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+
+
+
 class MappingEntry:
     """
     Helper class: This class maps block_count file blocks indexed by file_block_idx to the associated disk blocks indexed
-    by disk_block_idx.
+    by disk_block_idx. Blocks of an unwritten (uninitialized) extent are allocated, but read as zeros.
     """
-    def __init__ (self, file_block_idx, disk_block_idx, block_count = 1):
+    def __init__ (self, file_block_idx, disk_block_idx, block_count = 1, unwritten = False):
         """
-        Initialize a MappingEntry instance with given file_block_idx, disk_block_idx and block_count.
+        Initialize a MappingEntry instance with given file_block_idx, disk_block_idx, block_count and unwritten flag.
         """
         self.file_block_idx = file_block_idx
         self.disk_block_idx = disk_block_idx
         self.block_count = block_count
+        self.unwritten = unwritten
 
     def __iter__ (self):
         """
-        Can be used to convert an MappingEntry into a tuple (file_block_idx, disk_block_idx, block_count).
+        Can be used to convert an MappingEntry into a tuple (file_block_idx, disk_block_idx, block_count, unwritten).
         """
         yield self.file_block_idx
         yield self.disk_block_idx
         yield self.block_count
+        yield self.unwritten
 
     def __repr__ (self):
-        return f"{type(self).__name__:s}({self.file_block_idx!r:s}, {self.disk_block_idx!r:s}, {self.block_count!r:s})"
+        return f"{type(self).__name__:s}({self.file_block_idx!r:s}, {self.disk_block_idx!r:s}, {self.block_count!r:s}, unwritten = {self.unwritten!r:s})"
 
     def copy (self):
-        return MappingEntry(self.file_block_idx, self.disk_block_idx, self.block_count)
+        return MappingEntry(self.file_block_idx, self.disk_block_idx, self.block_count, self.unwritten)
 
     def create_mapping (*entries):
         """
@@ -516,7 +1148,7 @@ class MappingEntry:
 
     def optimize (entries):
         """
-        Sorts and stiches together a list of MappingEntry instances
+        Sorts and stiches together a list of MappingEntry instances. Written and unwritten entries are kept apart.
         """
         entries.sort(key = lambda entry: entry.file_block_idx)
 
@@ -524,7 +1156,8 @@ class MappingEntry:
         while idx < len(entries):
             while idx + 1 < len(entries) \
                     and entries[idx].file_block_idx + entries[idx].block_count == entries[idx + 1].file_block_idx \
-                    and entries[idx].disk_block_idx + entries[idx].block_count == entries[idx + 1].disk_block_idx:
+                    and entries[idx].disk_block_idx + entries[idx].block_count == entries[idx + 1].disk_block_idx \
+                    and entries[idx].unwritten == entries[idx + 1].unwritten:
                 tmp = entries.pop(idx + 1)
                 entries[idx].block_count += tmp.block_count
 
@@ -532,88 +1165,1671 @@ class MappingEntry:
 
 # None of the following classes preserve the underlying stream's current seek.
 
-class Volume:
+class GroupDescriptorTable:
     """
-    Provides functionality for reading ext4 volumes
+    List-like view of a volume's group descriptor table. Descriptors are parsed on first access, so opening a volume
+    does not need to read the whole table.
     """
 
-    ROOT_INODE = 2
+    def __init__ (self, volume, group_count):
+        """
+        Initializes a group descriptor table of group_count entries of volume. The table blocks are located with
+        Volume.gdt_block_location, so they do not need to be contiguous (meta_bg).
+        """
+        self.volume = volume
 
-    def __init__ (self, stream, offset = 0, ignore_flags = False, ignore_magic = False):
+        self._descriptors = [None] * group_count
+
+    def __getitem__ (self, group_idx):
         """
-        Initializes a new ext4 reader at a given offset in stream. If ignore_magic is True, no exception will be thrown,
-        when a structure with wrong magic number is found. Analogously passing True to ignore_flags suppresses Exception
-        caused by wrong flags.
+        Returns the ext4_group_descriptor of the group specified by group_idx (or a list of them, if a slice is passed).
         """
-        self.ignore_flags = ignore_flags
-        self.ignore_magic = ignore_magic
-        self.offset = offset
-        self.platform64 = True # Initial value needed for Volume.read_struct
-        self.stream = stream
+        if isinstance(group_idx, slice):
+            return [self[i] for i in range(*group_idx.indices(len(self)))]
 
-        # Superblock
-        self.superblock = self.read_struct(ext4_superblock, 0x400)
-        self.platform64 = (self.superblock.s_feature_incompat & ext4_superblock.INCOMPAT_64BIT) != 0
+        if group_idx < 0:
+            group_idx += len(self)
 
-        if not ignore_magic and self.superblock.s_magic != 0xEF53:
-            raise MagicError(f"Invalid magic value in superblock: 0x{self.superblock.s_magic:04X} (expected 0xEF53)")
+        if not 0 <= group_idx < len(self):
+            raise IndexError(f"Group descriptor index {group_idx:d} out of range.")
 
-        # Group descriptors
-        self.group_descriptors = [None] * (self.superblock.s_inodes_count // self.superblock.s_inodes_per_group)
+        descriptor = self._descriptors[group_idx]
+
+        if descriptor is None:
+            descriptor = self.volume.read_struct(ext4_group_descriptor, self.descriptor_offset(group_idx))
+            self._descriptors[group_idx] = descriptor
+
+        return descriptor
 
-        group_desc_table_offset = (0x400 // self.block_size + 1) * self.block_size # First block after superblock
-        for group_desc_idx in range(len(self.group_descriptors)):
-            group_desc_offset = group_desc_table_offset + group_desc_idx * self.superblock.s_desc_size
-            self.group_descriptors[group_desc_idx] = self.read_struct(ext4_group_descriptor, group_desc_offset)
+    def __iter__ (self):
+        for group_idx in range(len(self)):
+            yield self[group_idx]
+
+    def __len__ (self):
+        return len(self._descriptors)
 
     def __repr__ (self):
-        return f"{type(self).__name__:s}(volume_name = {self.superblock.s_volume_name!r:s}, uuid = {self.uuid!r:s}, last_mounted = {self.superblock.s_last_mounted!r:s})"
+        return f"{type(self).__name__:s}(offset = 0x{self.descriptor_offset(0):X}, group_count = {len(self):d})"
 
-    @property
-    def block_size (self):
+    def descriptor_offset (self, group_idx):
         """
-        Returns the volume's block size in bytes.
+        Returns the offset of the (primary) group descriptor of the group specified by group_idx within the volume.
         """
-        return 1 << (10 + self.superblock.s_log_block_size)
+        descriptors_per_block = self.volume.block_size // self.volume.superblock.s_desc_size
+        block_idx = self.volume.gdt_block_location(group_idx // descriptors_per_block)
+        return block_idx * self.volume.block_size + (group_idx % descriptors_per_block) * self.volume.superblock.s_desc_size
 
-    def get_inode (self, inode_idx):
+    def load (self):
         """
-        Returns an Inode instance representing the inode specified by its index inode_idx.
+        Parses all descriptors that have not been accessed yet. Runs of consecutive table blocks (the whole table
+        without meta_bg) are read with a single read.
         """
-        group_idx, inode_table_entry_idx = self.get_inode_group(inode_idx)
+        if None not in self._descriptors:
+            return
 
-        inode_table_offset = self.group_descriptors[group_idx].bg_inode_table * self.block_size
-        inode_offset = inode_table_offset + inode_table_entry_idx * self.superblock.s_inode_size
+        block_size = self.volume.block_size
+        desc_size = self.volume.superblock.s_desc_size
+        descriptors_per_block = block_size // desc_size
+        table_blocks = [self.volume.gdt_block_location(gdt_block_idx) for gdt_block_idx in range((len(self) + descriptors_per_block - 1) // descriptors_per_block)]
 
-        return Inode(self, inode_offset, inode_idx)
+        i = 0
+        while i < len(table_blocks):
+            j = i + 1
+            while j < len(table_blocks) and table_blocks[j] == table_blocks[j - 1] + 1:
+                j += 1
 
-    def get_inode_group (self, inode_idx):
-        """
-        Returns a tuple (group_idx, inode_table_entry_idx)
-        """
-        group_idx = (inode_idx - 1) // self.superblock.s_inodes_per_group
-        inode_table_entry_idx = (inode_idx - 1) % self.superblock.s_inodes_per_group
-        return (group_idx, inode_table_entry_idx)
+            # The last descriptor is parsed as a full structure, even if desc_size is smaller
+            first_group_idx = i * descriptors_per_block
+            group_count = min(len(self), j * descriptors_per_block) - first_group_idx
+            raw = self.volume.read(table_blocks[i] * block_size, (group_count - 1) * desc_size + ctypes.sizeof(ext4_group_descriptor))
 
-    def read (self, offset, byte_len):
-        """
-        Returns byte_len bytes at offset within this volume.
-        """
-        if self.offset + offset != self.stream.tell():
-            self.stream.seek(self.offset + offset, io.SEEK_SET)
+            for group_idx in range(first_group_idx, first_group_idx + group_count):
+                if self._descriptors[group_idx] is None:
+                    self._descriptors[group_idx] = ext4_group_descriptor._from_buffer_copy(raw, (group_idx - first_group_idx) * desc_size, platform64 = self.volume.platform64)
 
-        return self.stream.read(byte_len)
+            i = j
 
-    def read_struct (self, structure, offset, platform64 = None):
+
+class SegmentedStream (io.RawIOBase):
+    """
+    Provides the segments of a split raw image (e.g. image.001, image.002, ...) as one seekable stream, so that the image
+    does not need to be joined first. Besides the file interface, SegmentedStream.pread, SegmentedStream.preadv and
+    SegmentedStream.pwrite offer positional access, which does not move the stream position and thus is safe to use from
+    several threads. If use_mmap is True, the segments of read-only streams are memory mapped and reads are served from
+    the mappings.
+    """
+    def __init__ (self, paths, writable = False, use_mmap = False):
         """
-        Interprets the bytes at offset as structure and returns the interpreted instance
+        Initializes a stream over the segment files paths (in order). If writable is True, the segments are opened for
+        reading and writing. Writes beyond the end of the stream extend the last segment.
         """
-        raw = self.read(offset, ctypes.sizeof(structure))
+        super().__init__()
+        self.paths = list(paths)
+        self.files = [open(path, "r+b" if writable else "rb") for path in self.paths]
+        self.position = 0
+        self._writable = writable
 
-        if hasattr(structure, "_from_buffer_copy"):
-            return structure._from_buffer_copy(raw, platform64 = platform64 if platform64 != None else self.platform64)
-        else:
-            return structure.from_buffer_copy(raw)
+        # Start offsets of the segments within the stream, followed by the size of the stream
+        self.starts = [0]
+        for file in self.files:
+            self.starts.append(self.starts[-1] + os.fstat(file.fileno()).st_size)
+
+        self.maps = None # List of memoryview instances of the mapped segments (empty segments can not be mapped)
+        if use_mmap and not writable:
+            self.maps = [memoryview(mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)) if end > start else memoryview(b"") for file, start, end in zip(self.files, self.starts, self.starts[1:])]
+
+    def __len__ (self):
+        return self.starts[-1]
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(paths = {self.paths!r:s}, writable = {self._writable!r:s}, use_mmap = {self.maps is not None!r:s})"
+
+    def close (self):
+        if not self.closed:
+            if self.maps is not None:
+                for view in self.maps:
+                    view.release()
+                self.maps = None
+
+            for file in self.files:
+                file.close()
+
+        super().close()
+
+    def readable (self):
+        return True
+
+    def seekable (self):
+        return True
+
+    def writable (self):
+        return self._writable
+
+    def seek (self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self)
+
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset:d}")
+
+        self.position = offset
+        return self.position
+
+    def tell (self):
+        return self.position
+
+    def readinto (self, buffer):
+        byte_count = self.preadv([buffer], self.position)
+        self.position += byte_count
+        return byte_count
+
+    def write (self, data):
+        byte_count = self.pwrite(data, self.position)
+        self.position += byte_count
+        return byte_count
+
+    def pread (self, byte_len, offset):
+        """
+        Returns up to byte_len bytes at offset within the stream (less at the end of the stream), like os.pread.
+        """
+        buffer = bytearray(byte_len)
+        byte_count = self.preadv([buffer], offset)
+        return bytes(buffer) if byte_count == byte_len else bytes(buffer[:byte_count])
+
+    def preadv (self, buffers, offset):
+        """
+        Reads into buffers (writable bytes-like objects) one after another from offset within the stream and returns the
+        number of bytes read, like os.preadv. Reads crossing segment boundaries are split at them.
+        """
+        byte_count = 0
+
+        for buffer in buffers:
+            view = memoryview(buffer).cast("B")
+            done = 0
+
+            while done < len(view) and offset < len(self):
+                segment_idx = bisect.bisect_right(self.starts, offset) - 1
+                segment_offset = offset - self.starts[segment_idx]
+                chunk_len = min(len(view) - done, self.starts[segment_idx + 1] - offset)
+
+                if self.maps is not None:
+                    view[done : done + chunk_len] = self.maps[segment_idx][segment_offset : segment_offset + chunk_len]
+                else:
+                    chunk_len = os.preadv(self.files[segment_idx].fileno(), [view[done : done + chunk_len]], segment_offset)
+                    if chunk_len == 0:
+                        # The segment was truncated after opening
+                        return byte_count + done
+
+                done += chunk_len
+                offset += chunk_len
+
+            byte_count += done
+            if done < len(view):
+                break
+
+        return byte_count
+
+    def pwrite (self, data, offset):
+        """
+        Writes data at offset within the stream and returns the number of bytes written, like os.pwrite.
+        """
+        if not self._writable:
+            raise io.UnsupportedOperation("write")
+
+        view = memoryview(data).cast("B")
+        done = 0
+
+        while done < len(view):
+            # Offsets at or beyond the end of the stream belong to the last segment
+            segment_idx = min(bisect.bisect_right(self.starts, offset) - 1, len(self.files) - 1)
+            segment_offset = offset - self.starts[segment_idx]
+            chunk_len = len(view) - done if segment_idx == len(self.files) - 1 else min(len(view) - done, self.starts[segment_idx + 1] - offset)
+
+            chunk_len = os.pwrite(self.files[segment_idx].fileno(), view[done : done + chunk_len], segment_offset)
+            done += chunk_len
+            offset += chunk_len
+
+        self.starts[-1] = max(self.starts[-1], offset)
+        return done
+
+class CompressedStream (io.RawIOBase):
+    """
+    Base class: Read-only, seekable stream over a compressed image, which is decompressed on demand from the restart
+    point (checkpoint) preceding each read. Reads are served in windows of WINDOW_SIZE decompressed bytes, which are kept
+    in a BlockCache of cache_size bytes, so that repeated reads of the same region are not decompressed again. The
+    windows passed on the way from a checkpoint to the requested window are cached as well, so sequential sweeps
+    decompress every region once. Like SegmentedStream, the stream offers positional reads (pread and preadv), which
+    are safe to use from several threads. Subclasses set CompressedStream.checkpoint_offsets and the decompressed size
+    and implement CompressedStream._decompress.
+    """
+    DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+    WINDOW_SIZE = 1024 * 1024
+
+    def __init__ (self, file_name, cache_size = DEFAULT_CACHE_SIZE):
+        super().__init__()
+        self.file_name = file_name
+        self.file = open(file_name, "rb")
+        self.cache = BlockCache(cache_size)
+        self.lock = threading.Lock() # Guards the cache and the decompressor state
+        self.position = 0
+
+        self.checkpoint_offsets = [] # Sorted decompressed offsets of the checkpoints, the first one is 0
+        self.size = 0 # Decompressed size
+
+    def __len__ (self):
+        return self.size
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(file_name = {self.file_name!r:s}, size = {self.size!r:s}, checkpoints = {len(self.checkpoint_offsets)!r:s}, cache = {self.cache!r:s})"
+
+    def close (self):
+        if not self.closed:
+            self.file.close()
+
+        super().close()
+
+    def readable (self):
+        return True
+
+    def seekable (self):
+        return True
+
+    def seek (self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self)
+
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset:d}")
+
+        self.position = offset
+        return self.position
+
+    def tell (self):
+        return self.position
+
+    def readinto (self, buffer):
+        byte_count = self.preadv([buffer], self.position)
+        self.position += byte_count
+        return byte_count
+
+    def _read_compressed (self, byte_len, offset):
+        """
+        Returns up to byte_len bytes at offset within the compressed file.
+        """
+        return os.pread(self.file.fileno(), byte_len, offset)
+
+    def _decompress (self, checkpoint_idx):
+        """
+        Generator: Yields the decompressed data (bytes) in order, starting at the checkpoint specified by checkpoint_idx
+        and ending at the end of the stream. Must be implemented by subclasses.
+        """
+        raise NotImplementedError
+
+    def _read_window (self, window_idx):
+        """
+        Returns the decompressed window specified by window_idx (bytes, shorter at the end of the stream). Must be
+        called with the lock held.
+        """
+        window = self.cache.get(window_idx)
+        if window is not None:
+            return window
+
+        window_size = CompressedStream.WINDOW_SIZE
+        if window_idx * window_size >= self.size:
+            return b""
+
+        checkpoint_idx = bisect.bisect_right(self.checkpoint_offsets, window_idx * window_size) - 1
+        checkpoint_offset = self.checkpoint_offsets[checkpoint_idx]
+
+        # The data before the first window boundary behind the checkpoint is dropped, it belongs to a window that
+        # starts before the checkpoint
+        skip_len = -checkpoint_offset % window_size
+        pending_idx = (checkpoint_offset + skip_len) // window_size
+        pending = bytearray()
+
+        chunks = self._decompress(checkpoint_idx)
+        try:
+            for chunk in chunks:
+                if skip_len != 0:
+                    skipped_len = min(skip_len, len(chunk))
+                    chunk = chunk[skipped_len:]
+                    skip_len -= skipped_len
+
+                pending += chunk
+                while len(pending) >= window_size:
+                    window = bytes(pending[:window_size])
+                    del pending[:window_size]
+                    self.cache.put(pending_idx, window)
+
+                    if pending_idx == window_idx:
+                        return window
+                    pending_idx += 1
+        finally:
+            chunks.close()
+
+        # Last window of the stream
+        window = bytes(pending)
+        self.cache.put(pending_idx, window)
+        return window if pending_idx == window_idx else b""
+
+    def pread (self, byte_len, offset):
+        """
+        Returns up to byte_len decompressed bytes at offset within the stream (less at the end of the stream), like
+        os.pread.
+        """
+        buffer = bytearray(byte_len)
+        byte_count = self.preadv([buffer], offset)
+        return bytes(buffer) if byte_count == byte_len else bytes(buffer[:byte_count])
+
+    def preadv (self, buffers, offset):
+        """
+        Reads decompressed data into buffers (writable bytes-like objects) one after another from offset within the stream
+        and returns the number of bytes read, like os.preadv.
+        """
+        window_size = CompressedStream.WINDOW_SIZE
+        byte_count = 0
+
+        with self.lock:
+            for buffer in buffers:
+                view = memoryview(buffer).cast("B")
+                done = 0
+
+                while done < len(view) and offset < self.size:
+                    window = self._read_window(offset // window_size)
+                    window_offset = offset % window_size
+                    chunk_len = min(len(view) - done, len(window) - window_offset)
+                    if chunk_len <= 0:
+                        # The compressed file ended before its recorded size
+                        return byte_count + done
+
+                    view[done : done + chunk_len] = window[window_offset : window_offset + chunk_len]
+                    done += chunk_len
+                    offset += chunk_len
+
+                byte_count += done
+                if done < len(view):
+                    break
+
+        return byte_count
+
+class GzipStream (CompressedStream):
+    """
+    Provides random access to gzip compressed images through a checkpoint index as in zlib's zran example: at deflate
+    block boundaries about every spacing decompressed bytes, the compressed position (including the bit offset) and the
+    preceding 32 KiB of decompressed data (the deflate window) are recorded, so that decompression can be resumed there.
+    Building the index takes a single pass over the image, which is why it is stored next to the image (index_name,
+    default: the image's name followed by ".idx") and reused as long as the image's size and modification time match.
+    Multi-member gzip files are supported. The system's zlib is used through ctypes, as the zlib module can not resume
+    decompression in the middle of a byte.
+    """
+    DEFAULT_SPACING = 16 * 1024 * 1024
+    INDEX_MAGIC = b"EXT4GZIX"
+    WINDOW_BITS = 15
+    DEFLATE_WINDOW_SIZE = 1 << WINDOW_BITS
+    CHUNK_SIZE = 256 * 1024
+
+    # zlib return codes and flush values
+    Z_OK = 0
+    Z_STREAM_END = 1
+    Z_BUF_ERROR = -5
+    Z_NO_FLUSH = 0
+    Z_BLOCK = 5
+
+    _libz = None # Loaded on first use, see GzipStream._load_libz
+
+    def __init__ (self, file_name, spacing = DEFAULT_SPACING, index_name = None, persist = True, cache_size = CompressedStream.DEFAULT_CACHE_SIZE):
+        """
+        Opens the gzip compressed image file_name. spacing is the minimum distance of the checkpoints in decompressed
+        bytes. If persist is False, the index is neither read from nor written to index_name.
+        """
+        super().__init__(file_name, cache_size = cache_size)
+        self.libz = GzipStream._load_libz()
+        self.spacing = spacing
+        self.index_name = index_name if index_name is not None else file_name + ".idx"
+
+        self.checkpoints = None # List of tuples (compressed offset, bit count, zlib compressed deflate window)
+        if persist:
+            self._load_index()
+
+        if self.checkpoints is None:
+            self._build_index()
+            if persist:
+                self._save_index()
+
+    def _load_libz ():
+        """
+        Returns the system's zlib (ctypes.CDLL instance), loaded on first use.
+        """
+        if GzipStream._libz is None:
+            import ctypes.util
+
+            libz_name = ctypes.util.find_library("z") or ctypes.util.find_library("zlib1")
+            if libz_name is None:
+                raise Ext4Error("Random access to gzip compressed images requires the zlib library.")
+
+            libz = ctypes.CDLL(libz_name)
+            libz.zlibVersion.restype = ctypes.c_char_p
+            for function in (libz.inflateInit2_, libz.inflate, libz.inflateEnd, libz.inflateReset2, libz.inflatePrime, libz.inflateSetDictionary):
+                function.restype = ctypes.c_int
+
+            GzipStream._libz = libz
+
+        return GzipStream._libz
+
+    def _inflate_init (self, window_bits):
+        """
+        Returns a new z_stream initialized for inflating with window_bits (see zlib's inflateInit2).
+        """
+        stream = z_stream()
+        version = self.libz.zlibVersion()
+        if self.libz.inflateInit2_(ctypes.byref(stream), window_bits, version, ctypes.sizeof(z_stream)) != GzipStream.Z_OK:
+            raise Ext4Error(f"Could not initialize zlib {version!r:s}.")
+
+        return stream
+
+    def _index_key (self):
+        """
+        Returns the tuple (compressed size, modification time in ns) identifying the image an index was built for.
+        """
+        stat = os.fstat(self.file.fileno())
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _build_index (self):
+        """
+        Decompresses the image once and records a checkpoint at the first deflate block boundary of every member and
+        whenever at least spacing bytes were decompressed since the last checkpoint.
+        """
+        libz = self.libz
+        stream = self._inflate_init(32 + GzipStream.WINDOW_BITS) # Detect the gzip header
+        in_buffer = ctypes.create_string_buffer(GzipStream.CHUNK_SIZE)
+        out_buffer = ctypes.create_string_buffer(GzipStream.CHUNK_SIZE)
+
+        checkpoints = []
+        window = b"" # The last DEFLATE_WINDOW_SIZE decompressed bytes
+        in_offset = 0 # Compressed offset of in_buffer
+        out_offset = 0
+        last_offset = None
+
+        try:
+            while True:
+                chunk = self._read_compressed(GzipStream.CHUNK_SIZE, in_offset)
+                if not chunk:
+                    raise Ext4Error(f"Gzip compressed image {self.file_name!r:s} is truncated.")
+
+                ctypes.memmove(in_buffer, chunk, len(chunk))
+                stream.next_in = ctypes.cast(in_buffer, ctypes.c_void_p)
+                stream.avail_in = len(chunk)
+                member_end = False
+
+                while stream.avail_in != 0:
+                    stream.next_out = ctypes.cast(out_buffer, ctypes.c_void_p)
+                    stream.avail_out = GzipStream.CHUNK_SIZE
+                    result = libz.inflate(ctypes.byref(stream), GzipStream.Z_BLOCK)
+                    out_len = GzipStream.CHUNK_SIZE - stream.avail_out
+
+                    if out_len != 0:
+                        window = (window + ctypes.string_at(out_buffer, out_len))[-GzipStream.DEFLATE_WINDOW_SIZE:]
+                        out_offset += out_len
+
+                    if result == GzipStream.Z_STREAM_END:
+                        member_end = True
+                        break
+                    if result not in (GzipStream.Z_OK, GzipStream.Z_BUF_ERROR):
+                        raise Ext4Error(f"Invalid deflate data in {self.file_name!r:s} at offset {in_offset + len(chunk) - stream.avail_in:d}: {stream.msg!r:s}")
+
+                    # Bit 128 of data_type: at the end of a block, bit 64: after the last block
+                    at_boundary = (stream.data_type & 128) != 0 and (stream.data_type & 64) == 0
+                    if at_boundary and (last_offset is None or out_offset - last_offset >= self.spacing):
+                        checkpoints.append((out_offset, in_offset + len(chunk) - stream.avail_in, stream.data_type & 7, zlib.compress(window)))
+                        last_offset = out_offset
+
+                    if stream.avail_out != 0 and result == GzipStream.Z_BUF_ERROR:
+                        break
+
+                in_offset += len(chunk) - stream.avail_in
+
+                if member_end:
+                    # Another member may follow the 8 byte trailer (already consumed by zlib in gzip mode)
+                    if self._read_compressed(2, in_offset) != b"\x1F\x8B":
+                        break
+
+                    libz.inflateReset2(ctypes.byref(stream), 32 + GzipStream.WINDOW_BITS)
+                    last_offset = None
+        finally:
+            libz.inflateEnd(ctypes.byref(stream))
+
+        self.size = out_offset
+        self.checkpoint_offsets = [checkpoint[0] for checkpoint in checkpoints]
+        self.checkpoints = [checkpoint[1:] for checkpoint in checkpoints]
+
+    def _load_index (self):
+        """
+        Reads the index from index_name, if it exists and was built for this image.
+        """
+        try:
+            with open(self.index_name, "rb") as index_file:
+                raw = index_file.read()
+        except OSError:
+            return
+
+        header = struct.Struct("<8sQQQQ")
+        if len(raw) < header.size:
+            return
+
+        magic, compressed_size, mtime_ns, size, checkpoint_count = header.unpack_from(raw)
+        if magic != GzipStream.INDEX_MAGIC or (compressed_size, mtime_ns) != self._index_key():
+            return
+
+        offsets = []
+        checkpoints = []
+        position = header.size
+        try:
+            for _ in range(checkpoint_count):
+                out_offset, in_offset, bits, window_len = struct.unpack_from("<QQBI", raw, position)
+                position += struct.calcsize("<QQBI")
+                offsets.append(out_offset)
+                checkpoints.append((in_offset, bits, raw[position : position + window_len]))
+                position += window_len
+        except struct.error:
+            return
+
+        self.size = size
+        self.checkpoint_offsets = offsets
+        self.checkpoints = checkpoints
+
+    def _save_index (self):
+        """
+        Writes the index to index_name. Failures (e.g. a read-only directory) are ignored, the index is then built again
+        next time.
+        """
+        parts = [struct.pack("<8sQQQQ", GzipStream.INDEX_MAGIC, *self._index_key(), self.size, len(self.checkpoints))]
+        for out_offset, (in_offset, bits, window) in zip(self.checkpoint_offsets, self.checkpoints):
+            parts.append(struct.pack("<QQBI", out_offset, in_offset, bits, len(window)))
+            parts.append(window)
+
+        try:
+            with open(self.index_name + ".tmp", "wb") as index_file:
+                index_file.write(b"".join(parts))
+            os.replace(self.index_name + ".tmp", self.index_name)
+        except OSError:
+            pass
+
+    def _decompress (self, checkpoint_idx):
+        libz = self.libz
+        in_offset, bits, window = self.checkpoints[checkpoint_idx]
+        stream = self._inflate_init(-GzipStream.WINDOW_BITS) # Raw deflate
+        in_buffer = ctypes.create_string_buffer(GzipStream.CHUNK_SIZE)
+        out_buffer = ctypes.create_string_buffer(GzipStream.CHUNK_SIZE)
+
+        try:
+            # The checkpoint may lie in the middle of a byte, its remaining bits are fed first
+            if bits != 0:
+                in_offset -= 1
+                libz.inflatePrime(ctypes.byref(stream), bits, self._read_compressed(1, in_offset)[0] >> (8 - bits))
+                in_offset += 1
+
+            window = zlib.decompress(window)
+            if window:
+                libz.inflateSetDictionary(ctypes.byref(stream), window, len(window))
+
+            raw_deflate = True
+            while True:
+                chunk = self._read_compressed(GzipStream.CHUNK_SIZE, in_offset)
+                if not chunk:
+                    return
+
+                ctypes.memmove(in_buffer, chunk, len(chunk))
+                stream.next_in = ctypes.cast(in_buffer, ctypes.c_void_p)
+                stream.avail_in = len(chunk)
+                member_end = False
+
+                while stream.avail_in != 0 or stream.avail_out == 0:
+                    stream.next_out = ctypes.cast(out_buffer, ctypes.c_void_p)
+                    stream.avail_out = GzipStream.CHUNK_SIZE
+                    result = libz.inflate(ctypes.byref(stream), GzipStream.Z_NO_FLUSH)
+                    out_len = GzipStream.CHUNK_SIZE - stream.avail_out
+
+                    if out_len != 0:
+                        yield ctypes.string_at(out_buffer, out_len)
+
+                    if result == GzipStream.Z_STREAM_END:
+                        member_end = True
+                        break
+                    if result not in (GzipStream.Z_OK, GzipStream.Z_BUF_ERROR):
+                        raise Ext4Error(f"Invalid deflate data in {self.file_name!r:s} at offset {in_offset + len(chunk) - stream.avail_in:d}: {stream.msg!r:s}")
+                    if result == GzipStream.Z_BUF_ERROR:
+                        break
+
+                in_offset += len(chunk) - stream.avail_in
+
+                if member_end:
+                    # Raw deflate leaves the 8 byte trailer of the member unconsumed, the next member (if any) starts
+                    # with a gzip header
+                    if raw_deflate:
+                        in_offset += 8
+                    if self._read_compressed(2, in_offset) != b"\x1F\x8B":
+                        return
+
+                    libz.inflateReset2(ctypes.byref(stream), 16 + GzipStream.WINDOW_BITS)
+                    raw_deflate = False
+        finally:
+            libz.inflateEnd(ctypes.byref(stream))
+
+class XzStream (CompressedStream):
+    """
+    Provides random access to xz compressed images through the block index stored at the end of every xz stream: each
+    block can be decompressed on its own, so decompression starts at the block holding the requested data. Random access
+    therefore requires images compressed in blocks (e.g. xz -T0 or --block-size), a single-block image is decompressed from
+    its start. Concatenated streams and stream padding are supported.
+    """
+    HEADER_MAGIC = b"\xFD7zXZ\x00"
+    FOOTER_MAGIC = b"YZ"
+    HEADER_SIZE = 12
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__ (self, file_name, cache_size = CompressedStream.DEFAULT_CACHE_SIZE):
+        """
+        Opens the xz compressed image file_name and reads the indexes of its streams.
+        """
+        super().__init__(file_name, cache_size = cache_size)
+        self.blocks = [] # List of tuples (compressed offset, compressed size, decompressed size, offset of the stream header)
+
+        streams = []
+        end = os.fstat(self.file.fileno()).st_size
+        while end > 0:
+            # Stream padding (multiples of 4 null bytes) may follow a stream
+            while end >= 4 and self._read_compressed(4, end - 4) == bytes(4):
+                end -= 4
+
+            stream_start, blocks = self._read_stream_index(end)
+            streams.append(blocks)
+            end = stream_start
+
+        offset = 0
+        for blocks in reversed(streams):
+            for block in blocks:
+                self.checkpoint_offsets.append(offset)
+                self.blocks.append(block)
+                offset += block[2]
+
+        self.size = offset
+
+    def _read_varint (raw, position):
+        """
+        Returns the tuple (value, position after the value) of the xz multibyte integer at position of raw.
+        """
+        value = 0
+        for i in range(9):
+            value |= (raw[position + i] & 0x7F) << (7 * i)
+            if raw[position + i] & 0x80 == 0:
+                return (value, position + i + 1)
+
+        raise Ext4Error("Invalid multibyte integer in xz index.")
+
+    def _read_stream_index (self, end):
+        """
+        Reads the index of the xz stream ending at the compressed offset end and returns the tuple (stream start, list of
+        blocks as in XzStream.blocks).
+        """
+        footer = self._read_compressed(XzStream.HEADER_SIZE, end - XzStream.HEADER_SIZE)
+        if len(footer) != XzStream.HEADER_SIZE or footer[10:12] != XzStream.FOOTER_MAGIC:
+            raise Ext4Error(f"Invalid xz stream footer in {self.file_name!r:s} at offset {end - XzStream.HEADER_SIZE:d}.")
+
+        index_size = (struct.unpack_from("<I", footer, 4)[0] + 1) * 4
+        index_start = end - XzStream.HEADER_SIZE - index_size
+        index = self._read_compressed(index_size, index_start)
+        if len(index) != index_size or index[0] != 0 or zlib.crc32(index[:-4]) != struct.unpack_from("<I", index, index_size - 4)[0]:
+            raise Ext4Error(f"Invalid xz index in {self.file_name!r:s} at offset {index_start:d}.")
+
+        record_count, position = XzStream._read_varint(index, 1)
+        records = []
+        for _ in range(record_count):
+            unpadded_size, position = XzStream._read_varint(index, position)
+            uncompressed_size, position = XzStream._read_varint(index, position)
+            records.append((unpadded_size, uncompressed_size))
+
+        # Blocks are padded to multiples of 4 bytes
+        stream_start = index_start - sum((unpadded_size + 3) & ~3 for unpadded_size, _ in records) - XzStream.HEADER_SIZE
+        if stream_start < 0 or self._read_compressed(6, stream_start) != XzStream.HEADER_MAGIC:
+            raise Ext4Error(f"Invalid xz stream header in {self.file_name!r:s} at offset {stream_start:d}.")
+
+        blocks = []
+        block_offset = stream_start + XzStream.HEADER_SIZE
+        for unpadded_size, uncompressed_size in records:
+            blocks.append((block_offset, (unpadded_size + 3) & ~3, uncompressed_size, stream_start))
+            block_offset += (unpadded_size + 3) & ~3
+
+        return (stream_start, blocks)
+
+    def _decompress (self, checkpoint_idx):
+        for block_offset, block_size, uncompressed_size, stream_start in self.blocks[checkpoint_idx:]:
+            # A block is decompressed as the start of a stream: its stream header followed by the block
+            decompressor = lzma.LZMADecompressor(format = lzma.FORMAT_XZ)
+            remaining = uncompressed_size
+            data = decompressor.decompress(self._read_compressed(XzStream.HEADER_SIZE, stream_start))
+
+            position = block_offset
+            while remaining > 0 and position < block_offset + block_size:
+                chunk = self._read_compressed(min(XzStream.CHUNK_SIZE, block_offset + block_size - position), position)
+                if not chunk:
+                    return
+                position += len(chunk)
+
+                data = decompressor.decompress(chunk)
+                if data:
+                    data = data[:remaining]
+                    remaining -= len(data)
+                    yield data
+
+def split_image_paths (file_name):
+    """
+    Returns the paths of the segments of a split raw image as a list, i.e. file_name (a file with a numeric extension,
+    e.g. "image.001") followed by all consecutively numbered files next to it, or None if file_name does not have a
+    numeric extension.
+    """
+    match = re.fullmatch(r"(.*\.)(\d{3,})", file_name)
+    if match is None:
+        return None
+
+    prefix, number = match.groups()
+    paths = []
+    segment_idx = int(number)
+
+    while os.path.isfile(f"{prefix:s}{segment_idx:0{len(number)}d}"):
+        paths.append(f"{prefix:s}{segment_idx:0{len(number)}d}")
+        segment_idx += 1
+
+    return paths
+
+def open_image (file_name, writable = False, use_mmap = False):
+    """
+    Opens the image file_name as binary stream which can be passed to Volume. Split raw images (file_name is the first
+    segment, e.g. "image.001", and the next one exists) are opened as a SegmentedStream, see SegmentedStream for use_mmap.
+    gzip and xz compressed images are recognized by their magic number and opened read-only as GzipStream or XzStream.
+    If writable is True, the image is opened for reading and writing.
+    """
+    with open(file_name, "rb") as image:
+        magic = image.read(6)
+
+    for magic_prefix, stream_type in ((b"\x1F\x8B", GzipStream), (XzStream.HEADER_MAGIC, XzStream)):
+        if magic.startswith(magic_prefix):
+            if writable:
+                raise io.UnsupportedOperation(f"Compressed image {file_name!r:s} can not be written.")
+            return stream_type(file_name)
+
+    paths = split_image_paths(file_name)
+    if paths is not None and len(paths) > 1:
+        return SegmentedStream(paths, writable = writable, use_mmap = use_mmap)
+
+    return open(file_name, "r+b" if writable else "rb")
+
+class Partition:
+    """
+    Helper class: A partition of an image's partition table, which starts at the byte offset offset within the image and
+    spans byte_len bytes. scheme is "mbr" or "gpt", partition_idx the partition number as assigned by Linux (starting at 1,
+    logical partitions of MBR extended partitions start at 5) and type_id the MBR partition type (int) or the GPT partition
+    type GUID (str).
+    """
+    def __init__ (self, scheme, partition_idx, offset, byte_len, type_id):
+        self.scheme = scheme
+        self.partition_idx = partition_idx
+        self.offset = offset
+        self.byte_len = byte_len
+        self.type_id = type_id
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(scheme = {self.scheme!r:s}, partition_idx = {self.partition_idx!r:s}, offset = 0x{self.offset:X}, byte_len = {self.byte_len!r:s}, type_id = {self.type_id!r:s})"
+
+class PartitionTable:
+    """
+    Reads the partition table of a whole-disk image: a GPT (the backup GPT header is used if the primary one is damaged)
+    or an MBR, including the logical partitions of its extended partitions. Images without partition table (e.g. a bare
+    filesystem) have no partitions.
+    """
+    MAX_LOGICAL_PARTITIONS = 128 # Bounds the chain of extended boot records, which may loop in damaged images
+
+    def __init__ (self, stream, sector_size = None):
+        """
+        Reads the partition table of stream. sector_size is the logical sector size in bytes, if None, a GPT is looked for
+        with 512 and 4096 byte sectors and an MBR is read with 512 byte sectors.
+        """
+        self.stream = stream
+
+        try:
+            self.fd = stream.fileno()
+        except (AttributeError, OSError):
+            self.fd = None
+
+        self.scheme = None # "mbr", "gpt" or None
+        self.sector_size = sector_size if sector_size is not None else 512
+        self.partitions = [] # List of Partition instances, in the order of the partition table
+
+        for candidate in ((sector_size,) if sector_size is not None else (512, 4096)):
+            partitions = self._read_gpt(candidate)
+            if partitions is not None:
+                self.scheme, self.sector_size, self.partitions = "gpt", candidate, partitions
+                return
+
+        partitions = self._read_mbr()
+        if partitions is not None:
+            self.scheme, self.partitions = "mbr", partitions
+
+    def __len__ (self):
+        return len(self.partitions)
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(scheme = {self.scheme!r:s}, sector_size = {self.sector_size!r:s}, partitions = {self.partitions!r:s})"
+
+    def _read (self, offset, byte_len):
+        """
+        Returns up to byte_len bytes at offset within the image.
+        """
+        if self.fd is not None:
+            return os.pread(self.fd, byte_len, offset)
+        elif hasattr(self.stream, "pread"):
+            return self.stream.pread(byte_len, offset)
+
+        self.stream.seek(offset, io.SEEK_SET)
+        return self.stream.read(byte_len)
+
+    def _image_size (self):
+        """
+        Returns the size of the image in bytes.
+        """
+        if self.fd is None:
+            return self.stream.seek(0, io.SEEK_END)
+
+        return os.fstat(self.fd).st_size
+
+    def _read_gpt_header (self, lba, sector_size):
+        """
+        Returns the GPT header and its partition entries (bytes) at lba as a tuple (header, entries) or None if there is no
+        GPT header or one of the checksums does not match.
+        """
+        raw = self._read(lba * sector_size, sector_size)
+        if len(raw) < ctypes.sizeof(gpt_header) or raw[:8] != gpt_header.SIGNATURE:
+            return None
+
+        header = gpt_header.from_buffer_copy(raw)
+        if not ctypes.sizeof(gpt_header) <= header.header_size <= sector_size or header.partition_entry_size < ctypes.sizeof(gpt_partition_entry):
+            return None
+
+        raw_header = bytearray(raw[:header.header_size])
+        raw_header[gpt_header.header_crc32.offset : gpt_header.header_crc32.offset + 4] = bytes(4)
+        if zlib.crc32(raw_header) != header.header_crc32:
+            return None
+
+        entries = self._read(header.partition_entries_lba * sector_size, header.num_partition_entries * header.partition_entry_size)
+        if zlib.crc32(entries) != header.partition_entries_crc32:
+            return None
+
+        return (header, entries)
+
+    def _read_gpt (self, sector_size):
+        """
+        Returns the partitions of the GPT of the image as a list of Partition instances or None if the image has no valid
+        GPT for sector_size. GPTs are only accepted behind a protective MBR.
+        """
+        mbr = self._read(0, 512)
+        if len(mbr) < 512 or mbr[510:512] != b"\x55\xAA":
+            return None
+
+        entries = [mbr_partition_entry.from_buffer_copy(mbr, 446 + 16 * i) for i in range(4)]
+        if not any(entry.type == mbr_partition_entry.TYPE_GPT_PROTECTIVE for entry in entries):
+            return None
+
+        gpt = self._read_gpt_header(1, sector_size)
+        if gpt is None:
+            # The backup header is stored in the last sector of the disk
+            gpt = self._read_gpt_header(self._image_size() // sector_size - 1, sector_size)
+            if gpt is None:
+                return None
+
+        header, raw_entries = gpt
+        partitions = []
+
+        for i in range(header.num_partition_entries):
+            entry = gpt_partition_entry.from_buffer_copy(raw_entries, i * header.partition_entry_size)
+            if not any(entry.type_guid) or entry.last_lba < entry.first_lba:
+                continue
+
+            # GUIDs are stored with their first three fields in little endian byte order
+            raw_guid = bytes(entry.type_guid)
+            type_guid = "-".join((raw_guid[3::-1].hex(), raw_guid[5:3:-1].hex(), raw_guid[7:5:-1].hex(), raw_guid[8:10].hex(), raw_guid[10:].hex())).upper()
+            partitions.append(Partition("gpt", i + 1, entry.first_lba * sector_size, (entry.last_lba - entry.first_lba + 1) * sector_size, type_guid))
+
+        return partitions
+
+    def _read_mbr (self):
+        """
+        Returns the partitions of the MBR of the image as a list of Partition instances or None if the image has no MBR.
+        Extended partitions are followed through their chain of extended boot records and are not returned themselves.
+        """
+        sector_size = self.sector_size
+        mbr = self._read(0, 512)
+        if len(mbr) < 512 or mbr[510:512] != b"\x55\xAA":
+            return None
+
+        entries = [mbr_partition_entry.from_buffer_copy(mbr, 446 + 16 * i) for i in range(4)]
+        # The status byte is 0x00 or 0x80 in partition tables, boot code of filesystems (e.g. FAT) usually does not match
+        if any(entry.status not in (0x00, 0x80) for entry in entries):
+            return None
+
+        partitions = []
+        extended = None
+
+        for i, entry in enumerate(entries):
+            if entry.type == mbr_partition_entry.TYPE_EMPTY or entry.sector_count == 0:
+                continue
+
+            if entry.type in mbr_partition_entry.TYPE_EXTENDED:
+                extended = extended if extended is not None else entry.lba_first
+                continue
+
+            partitions.append(Partition("mbr", i + 1, entry.lba_first * sector_size, entry.sector_count * sector_size, entry.type))
+
+        # Logical partitions: every extended boot record holds one partition relative to itself and the link to the next
+        # extended boot record relative to the extended partition
+        ebr_lba = extended
+        visited = set()
+        partition_idx = 5
+
+        while ebr_lba is not None and ebr_lba not in visited and len(visited) < PartitionTable.MAX_LOGICAL_PARTITIONS:
+            visited.add(ebr_lba)
+            ebr = self._read(ebr_lba * sector_size, 512)
+            if len(ebr) < 512 or ebr[510:512] != b"\x55\xAA":
+                break
+
+            logical = mbr_partition_entry.from_buffer_copy(ebr, 446)
+            link = mbr_partition_entry.from_buffer_copy(ebr, 446 + 16)
+
+            if logical.type != mbr_partition_entry.TYPE_EMPTY and logical.sector_count != 0:
+                partitions.append(Partition("mbr", partition_idx, (ebr_lba + logical.lba_first) * sector_size, logical.sector_count * sector_size, logical.type))
+                partition_idx += 1
+
+            ebr_lba = extended + link.lba_first if link.type in mbr_partition_entry.TYPE_EXTENDED and link.lba_first != 0 else None
+
+        return partitions
+
+    def is_ext4 (self, offset):
+        """
+        Indicates whether there is an ext2/3/4 superblock (magic 0xEF53) at the byte offset offset within the image.
+        """
+        raw = self._read(offset + 0x400 + ext4_superblock.s_magic.offset, 2)
+        return raw == b"\x53\xEF"
+
+    def ext4_offsets (self):
+        """
+        Returns the byte offsets of all ext4 volumes of the image, i.e. [0] for a bare filesystem image or the offsets of
+        the partitions holding an ext4 volume, each of which can be passed to Volume as offset. Partitions are recognized by
+        their superblock, as partition types are not reliable.
+        """
+        if self.is_ext4(0):
+            return [0]
+
+        return [partition.offset for partition in self.partitions if self.is_ext4(partition.offset)]
+
+class Volume:
+    """
+    Provides functionality for reading ext4 volumes
+    """
+
+    ROOT_INODE = 2
+    DEFAULT_CACHE_SIZE = 32 * 1024 * 1024 # Byte budget of the block cache
+    DEFAULT_DENTRY_CACHE_SIZE = 64 * 1024 # Maximum number of entries in the dentry cache
+    DEFAULT_XATTR_CACHE_SIZE = 1024 # Maximum number of parsed xattr blocks kept per volume
+
+    def __init__ (self, stream, offset = 0, ignore_flags = False, ignore_magic = False, lazy = False, cache_size = DEFAULT_CACHE_SIZE, read_ahead = True, dentry_cache_size = DEFAULT_DENTRY_CACHE_SIZE, xattr_cache_size = DEFAULT_XATTR_CACHE_SIZE):
+        """
+        Initializes a new ext4 reader at a given offset in stream. If ignore_magic is True, no exception will be thrown,
+        when a structure with wrong magic number is found. Analogously passing True to ignore_flags suppresses Exception
+        caused by wrong flags. If lazy is True, only the superblock is parsed up front and group descriptors are read
+        on first access (see GroupDescriptorTable). cache_size is the byte budget of the volume's block cache, passing
+        0 or None disables caching. If read_ahead is True and stream is backed by a file descriptor, sequential reads
+        are prefetched (see ReadAhead). dentry_cache_size is the maximum number of path lookups kept in the volume's
+        dentry cache, passing 0 or None disables it. xattr_cache_size is the maximum number of parsed external xattr blocks
+        kept by the volume (see Inode.xattrs), passing 0 or None disables it.
+        """
+        self.cache = None # Initial value needed for Volume.read, the block size is not known yet
+        self.dentry_cache = DentryCache(dentry_cache_size) if dentry_cache_size else None
+        self.xattr_cache = collections.OrderedDict() if xattr_cache_size else None
+        self.xattr_cache_size = xattr_cache_size
+        self.ignore_flags = ignore_flags
+        self.ignore_magic = ignore_magic
+        self.offset = offset
+        self.platform64 = True # Initial value needed for Volume.read_struct
+        self.stream = stream
+
+        # Streams backed by a file descriptor are read with os.pread, which does not move a shared seek position and
+        # thus is safe to use from several threads. Streams with positional reads of their own (e.g. SegmentedStream) are
+        # read with their pread and preadv. Other streams are read with seek and read under the lock.
+        try:
+            self.fd = stream.fileno()
+        except (AttributeError, OSError):
+            # io.UnsupportedOperation is an OSError
+            self.fd = None
+        self.positional = self.fd is None and hasattr(stream, "preadv")
+        self.lock = threading.Lock() # Guards the caches, the read-ahead state and the stream position
+        self.read_ahead = ReadAhead(self.fd if read_ahead else None)
+
+        # Superblock
+        self.superblock = self.read_struct(ext4_superblock, 0x400)
+        self.platform64 = (self.superblock.s_feature_incompat & ext4_superblock.INCOMPAT_64BIT) != 0
+
+        if not ignore_magic and self.superblock.s_magic != 0xEF53:
+            raise MagicError(f"Invalid magic value in superblock: 0x{self.superblock.s_magic:04X} (expected 0xEF53)")
+
+        if cache_size:
+            self.cache = BlockCache(cache_size)
+
+        # Group descriptors
+        group_count = self.superblock.s_inodes_count // self.superblock.s_inodes_per_group
+        self.group_descriptors = GroupDescriptorTable(self, group_count)
+
+        if not lazy:
+            self.group_descriptors.load()
+
+        # Seed of the metadata checksums, which is derived from the UUID unless it is stored in the superblock
+        if (self.superblock.s_feature_incompat & ext4_superblock.INCOMPAT_CSUM_SEED) != 0:
+            self.csum_seed = self.superblock.s_checksum_seed
+        else:
+            self.csum_seed = crc32c(bytes(self.superblock.s_uuid))
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(volume_name = {self.superblock.s_volume_name!r:s}, uuid = {self.uuid!r:s}, last_mounted = {self.superblock.s_last_mounted!r:s})"
+
+    @property
+    def block_size (self):
+        """
+        Returns the volume's block size in bytes.
+        """
+        return 1 << (10 + self.superblock.s_log_block_size)
+
+    @property
+    def cluster_size (self):
+        """
+        Returns the volume's allocation unit in bytes, which is larger than the block size with bigalloc.
+        """
+        if (self.superblock.s_feature_ro_compat & ext4_superblock.RO_COMPAT_BIGALLOC) == 0:
+            return self.block_size
+
+        return 1 << (10 + self.superblock.s_log_cluster_size)
+
+    @property
+    def cluster_ratio (self):
+        """
+        Returns the number of blocks per cluster (1 without bigalloc).
+        """
+        return self.cluster_size // self.block_size
+
+    def cluster_runs (self, runs):
+        """
+        Generator: Takes an iterable of tuples (disk_block_idx, block_count) and yields them extended to whole clusters,
+        e.g. to compare owned blocks with the block bitmaps, which track clusters. Without bigalloc, runs are yielded
+        unchanged.
+        """
+        ratio = self.cluster_ratio
+
+        for start, count in runs:
+            end = start + count
+            start -= start % ratio
+            end += -end % ratio
+            yield (start, end - start)
+
+    def group_cluster_count (self, group_idx):
+        """
+        Returns the number of clusters (bits of the block bitmap) of the group specified by group_idx.
+        """
+        return (self.group_range(group_idx)[1] + self.cluster_ratio - 1) // self.cluster_ratio
+
+    def get_inode (self, inode_idx):
+        """
+        Returns an Inode instance representing the inode specified by its index inode_idx.
+        """
+        group_idx, inode_table_entry_idx = self.get_inode_group(inode_idx)
+
+        inode_table_offset = self.group_descriptors[group_idx].bg_inode_table * self.block_size
+        inode_offset = inode_table_offset + inode_table_entry_idx * self.superblock.s_inode_size
+
+        return Inode(self, inode_offset, inode_idx)
+
+    def allocated_block_runs (self, group_idx = None):
+        """
+        Generator: Yields the blocks marked as allocated in the block bitmaps as sorted tuples (disk_block_idx,
+        block_count). If group_idx is passed, only that group is considered. Groups flagged BLOCK_UNINIT have no
+        initialized bitmap and are skipped. With bigalloc, every bit marks a whole cluster.
+        """
+        group_indices = range(len(self.group_descriptors)) if group_idx is None else [group_idx]
+        ratio = self.cluster_ratio
+
+        for group_idx in group_indices:
+            descriptor = self.group_descriptors[group_idx]
+            if (descriptor.bg_flags & ext4_group_descriptor.EXT4_BG_BLOCK_UNINIT) != 0:
+                continue
+
+            group_start, group_blocks = self.group_range(group_idx)
+            group_clusters = self.group_cluster_count(group_idx)
+            bitmap = self.read(descriptor.bg_block_bitmap * self.block_size, (group_clusters + 7) // 8)
+
+            for bit_idx, bit_count in bitmap_runs(bitmap, group_clusters):
+                start = group_start + bit_idx * ratio
+                yield (start, min(bit_count * ratio, group_start + group_blocks - start))
+
+    def group_block_runs (self, field, chunk_blocks = 256):
+        """
+        Generator: Reads the block referenced by the group descriptor field (e.g. "bg_block_bitmap") of every group in
+        on-disk order and yields tuples (group_indices, data), where data (bytes) holds the blocks of the groups in
+        group_indices (list) one after another. Runs of consecutive blocks, as laid out by flex_bg, are read at once,
+        chunk_blocks blocks at most, bypassing the block cache.
+        """
+        blocks = sorted((getattr(descriptor, field), group_idx) for group_idx, descriptor in enumerate(self.group_descriptors))
+
+        i = 0
+        while i < len(blocks):
+            j = i + 1
+            while j < len(blocks) and j - i < chunk_blocks and blocks[j][0] == blocks[j - 1][0] + 1:
+                j += 1
+
+            yield ([group_idx for _, group_idx in blocks[i:j]], self._read_stream(blocks[i][0] * self.block_size, (j - i) * self.block_size))
+            i = j
+
+    def iter_group_blocks (self, field, chunk_blocks = 256):
+        """
+        Generator: Yields tuples (group_idx, data) with the block referenced by the group descriptor field of every
+        group, read as described for Volume.group_block_runs.
+        """
+        for group_indices, data in self.group_block_runs(field, chunk_blocks):
+            for i, group_idx in enumerate(group_indices):
+                yield (group_idx, data[i * self.block_size : (i + 1) * self.block_size])
+
+    def free_block_runs (self, group_idx, metadata = None):
+        """
+        Returns the blocks of the group specified by group_idx, which are neither marked as allocated in its block bitmap
+        nor part of the filesystem metadata, as a list of sorted tuples (disk_block_idx, block_count). metadata is a
+        merged list as returned by merge_runs(Volume.metadata_runs()), it is computed if None is passed.
+        """
+        if metadata is None:
+            metadata = merge_runs(self.metadata_runs())
+
+        group_start, group_blocks = self.group_range(group_idx)
+        free = subtract_runs([(group_start, group_blocks)], self.allocated_block_runs(group_idx))
+
+        # Metadata of the group's range, BLOCK_UNINIT groups do not mark it in their bitmap
+        i = max(0, bisect.bisect_right(metadata, (group_start,)) - 1)
+        group_metadata = []
+        while i < len(metadata) and metadata[i][0] < group_start + group_blocks:
+            group_metadata.append(metadata[i])
+            i += 1
+
+        return list(subtract_runs(free, group_metadata))
+
+    def superblock_checksum (self):
+        """
+        Returns the checksum of the superblock as it should be stored in s_checksum, or None if metadata_csum is not
+        enabled.
+        """
+        if (self.superblock.s_feature_ro_compat & ext4_superblock.RO_COMPAT_METADATA_CSUM) == 0:
+            return None
+
+        return crc32c(self.read(0x400, ext4_superblock.s_checksum.offset))
+
+    def checksum_errors (self, group_idx):
+        """
+        Generator: Verifies the metadata checksums of the group specified by group_idx and yields tuples
+        (structure, idx, raw, stored, computed) for every mismatch, where structure is "group_descriptor",
+        "block_bitmap", "inode_bitmap" or "inode", idx the group or inode index and raw (bytes) the checksummed data.
+        Group descriptors are verified if uninit_bg or metadata_csum is enabled, the others only with metadata_csum.
+        The bitmaps and the initialized part of the inode table are read at once, unused inodes which are all zeros
+        are skipped.
+        """
+        ro_compat = self.superblock.s_feature_ro_compat
+        metadata_csum = (ro_compat & ext4_superblock.RO_COMPAT_METADATA_CSUM) != 0
+        if not metadata_csum and (ro_compat & ext4_superblock.RO_COMPAT_GDT_CSUM) == 0:
+            return
+
+        desc_size = self.superblock.s_desc_size if self.platform64 else ext4_superblock.EXT2_MIN_DESC_SIZE
+        checksum_offset = ext4_group_descriptor.bg_checksum.offset
+        group = group_idx.to_bytes(4, "little")
+
+        # Group descriptor: the checksum field is left out (which equals zeroing it for crc16, not for crc32c)
+        descriptor = self.group_descriptors[group_idx]
+        raw = self.read(self.group_descriptors.descriptor_offset(group_idx), desc_size)
+        if metadata_csum:
+            computed = crc32c(raw[:checksum_offset] + b"\0\0" + raw[checksum_offset + 2:], crc32c(group, self.csum_seed)) & 0xFFFF
+        else:
+            computed = crc16(raw[checksum_offset + 2:], crc16(raw[:checksum_offset], crc16(group, crc16(bytes(self.superblock.s_uuid)))))
+        if computed != descriptor.bg_checksum:
+            yield ("group_descriptor", group_idx, raw, descriptor.bg_checksum, computed)
+
+        if not metadata_csum:
+            return
+
+        # Bitmaps: only the bits of the group are checksummed, the upper 16 bits are only stored in large descriptors
+        bitmaps = []
+        if (descriptor.bg_flags & ext4_group_descriptor.EXT4_BG_BLOCK_UNINIT) == 0:
+            hi_end = ext4_group_descriptor.bg_block_bitmap_csum_hi.offset + 2
+            stored = descriptor.bg_block_bitmap_csum_lo | (descriptor.bg_block_bitmap_csum_hi << 16 if desc_size >= hi_end else 0)
+            bitmaps.append(("block_bitmap", descriptor.bg_block_bitmap, self.superblock.s_clusters_per_group, stored, desc_size >= hi_end))
+        if (descriptor.bg_flags & ext4_group_descriptor.EXT4_BG_INODE_UNINIT) == 0:
+            hi_end = ext4_group_descriptor.bg_inode_bitmap_csum_hi.offset + 2
+            stored = descriptor.bg_inode_bitmap_csum_lo | (descriptor.bg_inode_bitmap_csum_hi << 16 if desc_size >= hi_end else 0)
+            bitmaps.append(("inode_bitmap", descriptor.bg_inode_bitmap, self.superblock.s_inodes_per_group, stored, desc_size >= hi_end))
+
+        for structure, block_idx, bit_count, stored, full in bitmaps:
+            raw = self.read(block_idx * self.block_size, bit_count // 8)
+            computed = crc32c(raw, self.csum_seed) & (0xFFFFFFFF if full else 0xFFFF)
+            if computed != stored:
+                yield (structure, group_idx, raw, stored, computed)
+
+        # Inodes: seeded with the inode number and generation, the upper 16 bits exist if i_extra_isize covers them
+        inode_size = self.superblock.s_inode_size
+        inodes_per_group = self.superblock.s_inodes_per_group
+        table_entries = inodes_per_group - self.inode_table_unused(group_idx)
+        table = self.read(descriptor.bg_inode_table * self.block_size, table_entries * inode_size)
+        lo_offset = ext4_inode.i_osd2_checksum_lo.offset
+        hi_offset = ext4_inode.i_checksum_hi.offset
+        generation_offset = ext4_inode.i_generation.offset
+        extra_isize_offset = ext4_inode.i_extra_isize.offset
+        empty = bytes(inode_size)
+
+        for table_entry_idx in range(table_entries):
+            raw = table[table_entry_idx * inode_size : (table_entry_idx + 1) * inode_size]
+            if raw == empty:
+                continue
+
+            inode_idx = group_idx * inodes_per_group + table_entry_idx + 1
+            has_hi = inode_size > ext4_inode.EXT2_GOOD_OLD_INODE_SIZE and ext4_inode.EXT2_GOOD_OLD_INODE_SIZE + int.from_bytes(raw[extra_isize_offset : extra_isize_offset + 2], "little") >= hi_offset + 2
+            stored = int.from_bytes(raw[lo_offset : lo_offset + 2], "little")
+
+            if has_hi:
+                stored |= int.from_bytes(raw[hi_offset : hi_offset + 2], "little") << 16
+                data = raw[:lo_offset] + b"\0\0" + raw[lo_offset + 2 : hi_offset] + b"\0\0" + raw[hi_offset + 2:]
+            else:
+                data = raw[:lo_offset] + b"\0\0" + raw[lo_offset + 2:]
+
+            seed = inode_idx.to_bytes(4, "little") + raw[generation_offset : generation_offset + 4]
+            computed = crc32c(seed + data, self.csum_seed) & (0xFFFFFFFF if has_hi else 0xFFFF)
+            if computed != stored:
+                yield ("inode", inode_idx, raw, stored, computed)
+
+    def inode_table_unused (self, group_idx):
+        """
+        Returns the number of entries at the end of the inode table of the group specified by group_idx which were never
+        initialized (bg_itable_unused). This is only tracked if uninit_bg or metadata_csum is enabled, otherwise 0 is
+        returned.
+        """
+        if (self.superblock.s_feature_ro_compat & (ext4_superblock.RO_COMPAT_GDT_CSUM | ext4_superblock.RO_COMPAT_METADATA_CSUM)) == 0:
+            return 0
+
+        descriptor = self.group_descriptors[group_idx]
+        if (descriptor.bg_flags & ext4_group_descriptor.EXT4_BG_INODE_UNINIT) != 0:
+            return self.superblock.s_inodes_per_group
+
+        return min(descriptor.bg_itable_unused, self.superblock.s_inodes_per_group)
+
+    def group_range (self, group_idx):
+        """
+        Returns a tuple (first disk block, block count) of the group specified by group_idx.
+        """
+        group_start = self.superblock.s_first_data_block + group_idx * self.superblock.s_blocks_per_group
+        return (group_start, min(self.superblock.s_blocks_per_group, self.superblock.s_blocks_count - group_start))
+
+    def group_superblock_location (self, group_idx):
+        """
+        Returns the disk block of the superblock (backup) in the group specified by group_idx. The primary superblock is
+        always stored at byte 0x400, which is block 1 with 1 KiB blocks even if s_first_data_block is 0 (bigalloc).
+        """
+        if group_idx == 0:
+            return 0x400 // self.block_size
+
+        return self.group_range(group_idx)[0]
+
+    def group_has_superblock (self, group_idx):
+        """
+        Indicates whether the group specified by group_idx holds a superblock (backup). With sparse_super2, backups are
+        only stored in the groups listed in s_backup_bgs, with sparse_super in groups 1 and powers of 3, 5 and 7. Groups
+        beyond the end of the volume hold none.
+        """
+        if group_idx < 0 or group_idx >= len(self.group_descriptors):
+            return False
+
+        if group_idx == 0:
+            return True
+
+        if (self.superblock.s_feature_compat & ext4_superblock.COMPAT_SPARSE_SUPER2) != 0:
+            return group_idx in self.superblock.s_backup_bgs
+
+        if (self.superblock.s_feature_ro_compat & ext4_superblock.RO_COMPAT_SPARSE_SUPER) == 0:
+            return True
+
+        if group_idx == 1:
+            return True
+
+        for base in (3, 5, 7):
+            power = group_idx
+            while power % base == 0:
+                power //= base
+            if power == 1:
+                return True
+
+        return False
+
+    def _gdt_layout (self):
+        """
+        Returns a tuple (descriptors per block, number of table blocks, number of table blocks stored after the
+        superblocks, first group of the meta block groups) describing the group descriptor table layout. Without meta_bg,
+        the whole table is stored after the superblocks and there are no meta block groups.
+        """
+        descriptors_per_block = self.block_size // self.superblock.s_desc_size
+        gdt_blocks = (len(self.group_descriptors) + descriptors_per_block - 1) // descriptors_per_block
+
+        if (self.superblock.s_feature_incompat & ext4_superblock.INCOMPAT_META_BG) == 0:
+            return (descriptors_per_block, gdt_blocks, gdt_blocks, len(self.group_descriptors))
+
+        first_meta_bg = min(self.superblock.s_first_meta_bg, gdt_blocks)
+        return (descriptors_per_block, gdt_blocks, first_meta_bg, first_meta_bg * descriptors_per_block)
+
+    def gdt_block_location (self, gdt_block_idx):
+        """
+        Returns the disk block of the primary copy of the group descriptor table block specified by gdt_block_idx. With
+        meta_bg, table blocks from s_first_meta_bg on are stored in the first group of the meta block group they
+        describe, after its superblock backup (if any).
+        """
+        descriptors_per_block, _, classic_blocks, _ = self._gdt_layout()
+
+        if gdt_block_idx < classic_blocks:
+            return self.group_superblock_location(0) + 1 + gdt_block_idx
+
+        group_idx = gdt_block_idx * descriptors_per_block
+        if self.group_has_superblock(group_idx):
+            return self.group_superblock_location(group_idx) + 1
+        return self.group_range(group_idx)[0]
+
+    def group_gdt_blocks (self, group_idx):
+        """
+        Returns the copies of group descriptor table blocks stored in the group specified by group_idx as a list of
+        tuples (disk_block_idx, gdt_block_idx), where gdt_block_idx is the index of the table block. Groups with a
+        superblock hold the table (or its first s_first_meta_bg blocks) after it. With meta_bg, the first, second and
+        last group of a meta block group hold the table block describing it.
+        """
+        if group_idx < 0 or group_idx >= len(self.group_descriptors):
+            return []
+
+        descriptors_per_block, _, classic_blocks, first_meta_group = self._gdt_layout()
+        has_superblock = self.group_has_superblock(group_idx)
+        group_start = self.group_superblock_location(group_idx) + 1 if has_superblock else self.group_range(group_idx)[0]
+
+        if group_idx < first_meta_group:
+            if not has_superblock:
+                return []
+            return [(group_start + gdt_block_idx, gdt_block_idx) for gdt_block_idx in range(classic_blocks)]
+
+        if group_idx % descriptors_per_block in (0, 1, descriptors_per_block - 1):
+            return [(group_start, group_idx // descriptors_per_block)]
+
+        return []
+
+    def group_reserved_gdt_blocks (self, group_idx):
+        """
+        Returns the reserved group descriptor table blocks (for online growth) stored in the group specified by group_idx
+        as a tuple (disk_block_idx, block_count). They follow the table copy after each superblock, block_count is 0 if
+        the group has none.
+        """
+        _, _, classic_blocks, first_meta_group = self._gdt_layout()
+
+        if group_idx >= first_meta_group or not self.group_has_superblock(group_idx):
+            return (self.group_range(group_idx)[0], 0)
+
+        return (self.group_superblock_location(group_idx) + 1 + classic_blocks, self.superblock.s_reserved_gdt_blocks)
+
+    def metadata_runs (self):
+        """
+        Generator: Yields the blocks of the static filesystem metadata (superblocks, group descriptor tables, reserved
+        GDT blocks, bitmaps, inode tables and the MMP block) as tuples (disk_block_idx, block_count), not sorted.
+        """
+        inode_table_blocks = (self.superblock.s_inodes_per_group * self.superblock.s_inode_size + self.block_size - 1) // self.block_size
+
+        for group_idx, descriptor in enumerate(self.group_descriptors):
+            if self.group_has_superblock(group_idx):
+                yield (self.group_superblock_location(group_idx), 1)
+
+            for disk_block_idx, _ in self.group_gdt_blocks(group_idx):
+                yield (disk_block_idx, 1)
+
+            reserved_block_idx, reserved_count = self.group_reserved_gdt_blocks(group_idx)
+            if reserved_count != 0:
+                yield (reserved_block_idx, reserved_count)
+
+            yield (descriptor.bg_block_bitmap, 1)
+            yield (descriptor.bg_inode_bitmap, 1)
+            yield (descriptor.bg_inode_table, inode_table_blocks)
+
+        if (self.superblock.s_feature_incompat & ext4_superblock.INCOMPAT_MMP) != 0 and self.superblock.s_mmp_block != 0:
+            yield (self.superblock.s_mmp_block, 1)
+
+    def iter_inodes (self, used_only = True):
+        """
+        Generator: Yields Inode instances for all inodes in the order of their indices. Every group's inode bitmap and
+        inode table are read at once. If used_only is True, inodes whose bit in the inode bitmap is not set and groups
+        flagged INODE_UNINIT are skipped, as well as the never initialized end of inode tables (see
+        Volume.inode_table_unused).
+        """
+        inode_size = self.superblock.s_inode_size
+        inodes_per_group = self.superblock.s_inodes_per_group
+
+        for group_idx, descriptor in enumerate(self.group_descriptors):
+            table_entries = inodes_per_group - self.inode_table_unused(group_idx) if used_only else inodes_per_group
+            if table_entries == 0:
+                continue
+
+            if used_only:
+                bitmap = self.read(descriptor.bg_inode_bitmap * self.block_size, (inodes_per_group + 7) // 8)
+
+            table_offset = descriptor.bg_inode_table * self.block_size
+            table = self.read(table_offset, table_entries * inode_size)
+
+            for table_entry_idx in range(table_entries):
+                if used_only and ((bitmap[table_entry_idx // 8] >> (table_entry_idx % 8)) & 1) == 0:
+                    continue
+
+                raw = table[table_entry_idx * inode_size : (table_entry_idx + 1) * inode_size]
+                yield Inode(self, table_offset + table_entry_idx * inode_size, group_idx * inodes_per_group + table_entry_idx + 1, raw = raw)
+
+    def get_inode_group (self, inode_idx):
+        """
+        Returns a tuple (group_idx, inode_table_entry_idx)
+        """
+        group_idx = (inode_idx - 1) // self.superblock.s_inodes_per_group
+        inode_table_entry_idx = (inode_idx - 1) % self.superblock.s_inodes_per_group
+        return (group_idx, inode_table_entry_idx)
+
+    def read (self, offset, byte_len):
+        """
+        Returns byte_len bytes at offset within this volume. Small reads are served block-wise from the volume's block
+        cache, runs of missing blocks are read from the stream at once. Reads larger than an eighth of the cache budget
+        bypass the cache, so that bulk reads do not evict the metadata blocks.
+        """
+        if self.cache is None or byte_len <= 0 or byte_len > self.cache.byte_budget // 8:
+            return self._read_stream(offset, byte_len)
+
+        block_size = self.block_size
+        first_block_idx = offset // block_size
+        last_block_idx = (offset + byte_len - 1) // block_size
+
+        with self.lock:
+            blocks = [self.cache.get(block_idx) for block_idx in range(first_block_idx, last_block_idx + 1)]
+
+        # Read runs of missing blocks
+        i = 0
+        while i < len(blocks):
+            if blocks[i] is not None:
+                i += 1
+                continue
+
+            j = i
+            while j < len(blocks) and blocks[j] is None:
+                j += 1
+
+            raw = self._read_stream((first_block_idx + i) * block_size, (j - i) * block_size)
+            with self.lock:
+                for k in range(i, j):
+                    block = raw[(k - i) * block_size : (k - i + 1) * block_size]
+                    blocks[k] = block
+
+                    # Blocks cut off by the end of the stream are not cached
+                    if len(block) == block_size:
+                        self.cache.put(first_block_idx + k, block)
+
+            i = j
+
+        start = offset - first_block_idx * block_size
+        raw = blocks[0] if len(blocks) == 1 else b"".join(blocks)
+        return raw[start : start + byte_len]
+
+    def _read_stream (self, offset, byte_len):
+        """
+        Returns byte_len bytes at offset within this volume, read directly from the underlying stream.
+        """
+        with self.lock:
+            self.read_ahead.access(self.offset + offset, byte_len)
+
+            if self.fd is None and not self.positional:
+                if self.offset + offset != self.stream.tell():
+                    self.stream.seek(self.offset + offset, io.SEEK_SET)
+
+                return self.stream.read(byte_len)
+
+        if self.positional:
+            return self.stream.pread(byte_len, self.offset + offset)
+
+        return os.pread(self.fd, byte_len, self.offset + offset)
+
+    def readinto (self, offset, buffer):
+        """
+        Reads up to len(buffer) bytes at offset within this volume into buffer (a writable bytes-like object) and returns
+        the number of bytes read. Reads too large for the block cache are read from the stream directly into buffer.
+        """
+        view = memoryview(buffer).cast("B")
+
+        if self.cache is not None and len(view) <= self.cache.byte_budget // 8:
+            raw = self.read(offset, len(view))
+            view[:len(raw)] = raw
+            return len(raw)
+
+        with self.lock:
+            self.read_ahead.access(self.offset + offset, len(view))
+
+            if self.fd is None and not self.positional:
+                if self.offset + offset != self.stream.tell():
+                    self.stream.seek(self.offset + offset, io.SEEK_SET)
+
+                byte_count = 0
+                while byte_count < len(view):
+                    chunk_len = self.stream.readinto(view[byte_count:])
+                    if not chunk_len:
+                        break
+                    byte_count += chunk_len
+
+                return byte_count
+
+        byte_count = 0
+        while byte_count < len(view):
+            if self.positional:
+                chunk_len = self.stream.preadv([view[byte_count:]], self.offset + offset + byte_count)
+            else:
+                chunk_len = os.preadv(self.fd, [view[byte_count:]], self.offset + offset + byte_count)
+            if not chunk_len:
+                break
+            byte_count += chunk_len
+
+        return byte_count
+
+    def read_struct (self, structure, offset, platform64 = None):
+        """
+        Interprets the bytes at offset as structure and returns the interpreted instance
+        """
+        raw = self.read(offset, ctypes.sizeof(structure))
+
+        if hasattr(structure, "_from_buffer_copy"):
+            return structure._from_buffer_copy(raw, platform64 = platform64 if platform64 != None else self.platform64)
+        else:
+            return structure.from_buffer_copy(raw)
+
+    def walk (self, root = None, jobs = None, decode_name = None):
+        """
+        Generator: Yields tuples (path, inode) for every entry below the directory root (an Inode instance, default is
+        the volume's root), where path (str) consists of the entry names joined by "/" and starts with "/". "." and ".."
+        are skipped, directories are yielded before their contents. Directories are listed by a pool of jobs worker
+        threads (default: number of CPUs, at most 8). Pending directories are kept in a work queue ordered by their first
+        disk block, so that directory blocks are fetched in physical order and memory does not depend on the tree's
+        depth. decode_name is used as in Inode.open_dir.
+        """
+        if root is None:
+            root = self.root
+
+        if decode_name is None:
+            decode_name = lambda raw: raw.decode("utf8")
+
+        if jobs is None:
+            jobs = min(8, os.cpu_count() or 1)
+
+        # Heap of tuples (first disk block, path, inode index)
+        pending = [(0, "", root.inode_idx)]
+        visited = {root.inode_idx}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as executor:
+            while pending:
+                batch = [heapq.heappop(pending) for _ in range(min(len(pending), 4 * jobs))]
+                listings = executor.map(lambda item: self._walk_list(item[2], decode_name), batch)
+
+                for (_, path, _), entries in zip(batch, listings):
+                    for file_name, inode, file_type, first_block in entries:
+                        entry_path = f"{path:s}/{file_name:s}"
+                        yield (entry_path, inode)
+
+                        # Skip loops in corrupted volumes
+                        if file_type == InodeType.DIRECTORY and inode.is_dir and inode.inode_idx not in visited:
+                            visited.add(inode.inode_idx)
+                            heapq.heappush(pending, (first_block, entry_path, inode.inode_idx))
+
+    def _walk_list (self, inode_idx, decode_name):
+        """
+        Lists the directory specified by inode_idx for Volume.walk and returns a list of tuples (decode_name(name), inode,
+        file_type, first disk block of the inode). The directory's blocks are read in physical order.
+        """
+        block_size = self.block_size
+        max_run = 256 # Maximum number of blocks per read
+        directory = self.get_inode(inode_idx)
+
+        if (directory.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0:
+            dirents = []
+            for entry in sorted(directory.block_map, key = lambda entry: entry.disk_block_idx):
+                for run_start in range(0, entry.block_count, max_run):
+                    run_len = min(max_run, entry.block_count - run_start)
+                    raw = self.read((entry.disk_block_idx + run_start) * block_size, run_len * block_size)
+                    for block_offset in range(0, len(raw), block_size):
+                        dirents.extend((dirent.name, dirent.inode, dirent.file_type) for dirent in directory._parse_dir_block(raw[block_offset : block_offset + block_size]))
+        else:
+            dirents = list(directory.open_dir(lambda raw: raw))
+
+        entries = []
+        for name, child_idx, file_type in dirents:
+            if name == b"." or name == b"..":
+                continue
+
+            child = self.get_inode(child_idx)
+
+            first_block = 0
+            if file_type == InodeType.DIRECTORY and (child.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0 and child.block_map:
+                first_block = child.block_map[0].disk_block_idx
+
+            entries.append((decode_name(name), child, file_type, first_block))
+
+        return entries
 
     @property
     def root (self):
@@ -638,16 +2854,25 @@ class Inode:
     Provides functionality for parsing inodes and accessing their raw data
     """
 
-    def __init__ (self, volume, offset, inode_idx):
+    def __init__ (self, volume, offset, inode_idx, raw = None):
         """
         Initializes a new inode parser at the specified offset within the specified volume. file_type is the file type
-        of the inode as given by the directory entry referring to this inode.
+        of the inode as given by the directory entry referring to this inode. If raw (bytes) is passed, the inode is
+        parsed from it instead of being read from the volume.
         """
         self.inode_idx = inode_idx
         self.offset = offset
         self.volume = volume
 
-        self.inode = volume.read_struct(ext4_inode, offset)
+        if raw is None:
+            self.inode = volume.read_struct(ext4_inode, offset)
+        else:
+            # Inodes smaller than the structure (e.g. 128 bytes) are padded with zeros
+            self.inode = ext4_inode.from_buffer_copy(raw.ljust(ctypes.sizeof(ext4_inode), b"\0"))
+
+        self._raw = raw # Raw on-disk inode, see Inode._raw_inode
+        self._block_map = None # Memoized by Inode.block_map
+        self._mapping_blocks = None # Set by Inode.block_map, see Inode.mapping_blocks
 
     def __len__ (self):
         """
@@ -681,7 +2906,7 @@ class Inode:
             7: "system.",
             8: "system.richacl"
         }
-        prefixes.update(prefixes)
+        prefixes.update(prefix_override)
 
         # Iterator over ext4_xattr_entry structures
         i = 0
@@ -699,9 +2924,9 @@ class Inode:
 
             if xattr_entry.e_value_inum != 0:
                 # external xattr
-                xattr_inode = self.volume.get_inode(xattr.e_value_inum)
+                xattr_inode = self.volume.get_inode(xattr_entry.e_value_inum)
 
-                if not self.volume.ignore_flags and (xattr_inode.inode.i_flags & ext4_inode.EXT4_EA_INODE_FL) != 0:
+                if not self.volume.ignore_flags and (xattr_inode.inode.i_flags & ext4_inode.EXT4_EA_INODE_FL) == 0:
                     raise Ext4Error(f"Inode {xattr_inode.inode_idx:d} associated with the extended attribute {xattr_name!r:s} of inode {self.inode_idx:d} is not marked as large extended attribute value.")
 
                 # TODO Use xattr_entry.e_value_size or xattr_inode.inode.i_size?
@@ -753,7 +2978,7 @@ class Inode:
                 current_path = "/".join(relative_path[:i])
                 raise Ext4Error(f"{current_path!r:s} (Inode {inode_idx:d}) is not a directory.")
 
-            file_name, inode_idx, file_type = next(filter(lambda entry: entry[0] == part, current_inode.open_dir(decode_name)), (None, None, None))
+            file_name, inode_idx, file_type = current_inode.lookup(part, decode_name)
 
             if inode_idx == None:
                 current_path = "/".join(relative_path[:i])
@@ -764,6 +2989,144 @@ class Inode:
 
         return current_inode
 
+    def lookup (self, name, decode_name = None):
+        """
+        Returns the directory entry named name as a tuple (decode_name(name), inode, file_type) or (None, None, None), if
+        there is no such entry. In hash tree directories only the leaf blocks the name hashes to are searched, unless a
+        custom decode_name is passed (the raw name can not be inferred then). decode_name is directly passed to open_dir.
+        Results of lookups without a custom decode_name are kept in the volume's dentry cache.
+        """
+        dentry_cache = self.volume.dentry_cache if decode_name is None else None
+
+        if dentry_cache is not None:
+            entry = dentry_cache.get(self.inode_idx, name)
+            if entry is None:
+                entry = self._lookup(name, decode_name)
+                dentry_cache.put(self.inode_idx, name, entry)
+
+            return entry
+
+        return self._lookup(name, decode_name)
+
+    def _lookup (self, name, decode_name):
+        """
+        Uncached implementation of Inode.lookup
+        """
+        if decode_name is None and (self.inode.i_flags & ext4_inode.EXT4_INDEX_FL) != 0:
+            raw_name = name if isinstance(name, bytes) else name.encode("utf8")
+            leaf_blocks = self._htree_leaf_blocks(raw_name)
+
+            if leaf_blocks is not None:
+                reader = self.open_read()
+                for file_block_idx in leaf_blocks:
+                    for dirent in self._parse_dir_block(reader.read_block(file_block_idx)):
+                        if dirent.name == raw_name:
+                            return (dirent.name.decode("utf8") if isinstance(name, str) else dirent.name, dirent.inode, dirent.file_type)
+
+                return (None, None, None)
+
+        return next(filter(lambda entry: entry[0] == name, self.open_dir(decode_name)), (None, None, None))
+
+    def htree_node_blocks (self):
+        """
+        Returns the set of file block indices holding the hash tree's root and interior nodes. It is empty, if the
+        directory is not indexed.
+        """
+        if (self.inode.i_flags & ext4_inode.EXT4_INDEX_FL) == 0:
+            return set()
+
+        reader = self.open_read()
+        root = reader.read_block(0)
+        dx_info = ext4_dx_root_info.from_buffer_copy(root, 0x18)
+        nodes = {0}
+
+        if dx_info.info_length != ctypes.sizeof(ext4_dx_root_info):
+            return nodes
+
+        # Tuples (raw node, offset of its entries)
+        level = [(root, 0x18 + dx_info.info_length)]
+        for _ in range(dx_info.indirect_levels):
+            next_level = []
+            for block, entries_offset in level:
+                count = ext4_dx_countlimit.from_buffer_copy(block, entries_offset).count
+                for entry in (ext4_dx_entry * count).from_buffer_copy(block, entries_offset):
+                    child = entry.block & 0x0FFFFFFF
+                    if child not in nodes:
+                        nodes.add(child)
+                        next_level.append((reader.read_block(child), ctypes.sizeof(ext4_dir_entry_2)))
+            level = next_level
+
+        return nodes
+
+    def _htree_leaf_blocks (self, raw_name):
+        """
+        Walks the hash tree from its root to the leaf blocks that may contain the entry named raw_name (bytes) and returns
+        their file block indices. Returns None, if the tree can not be used (unknown hash version or broken root), so
+        that the caller falls back to a linear search.
+        """
+        # "." and ".." are stored in the first block, which is not a leaf (see __ext4_find_entry)
+        if raw_name in (b".", b".."):
+            return [0]
+
+        reader = self.open_read()
+        block = reader.read_block(0)
+
+        # The root info follows the "." and ".." entries
+        dx_info_offset = 0x18
+        dx_info = ext4_dx_root_info.from_buffer_copy(block, dx_info_offset)
+
+        if dx_info.reserved_zero != 0 or dx_info.info_length != ctypes.sizeof(ext4_dx_root_info):
+            return None
+
+        hash_version = dx_info.hash_version
+        if hash_version <= ext4_dx_root_info.DX_HASH_TEA and (self.volume.superblock.s_flags & ext4_superblock.FLAGS_UNSIGNED_HASH) != 0:
+            hash_version += ext4_dx_root_info.DX_HASH_LEGACY_UNSIGNED
+
+        if hash_version > ext4_dx_root_info.DX_HASH_TEA_UNSIGNED:
+            return None
+
+        name_hash = dx_hash(raw_name, hash_version, self.volume.superblock.s_hash_seed)
+        entries_offset = dx_info_offset + dx_info.info_length
+
+        # Lists [entries, index of the followed entry] of the nodes from the root to the bottom index node
+        path = []
+        for level in range(dx_info.indirect_levels + 1):
+            count = ext4_dx_countlimit.from_buffer_copy(block, entries_offset).count
+            entries = (ext4_dx_entry * count).from_buffer_copy(block, entries_offset)
+
+            # The first entry's hash field holds limit and count, its hash is implicitly 0
+            i = bisect.bisect_right(entries, name_hash, lo = 1, key = lambda entry: entry.hash) - 1
+            path.append([entries, i])
+
+            if level < dx_info.indirect_levels:
+                # Interior nodes start with a fake directory entry spanning the whole block
+                block = reader.read_block(entries[i].block & 0x0FFFFFFF)
+                entries_offset = ctypes.sizeof(ext4_dir_entry_2)
+
+        # Entries with colliding hashes may continue in the following blocks, marked by the lowest hash bit. Like
+        # ext4_htree_next_block, the run is followed into the next bottom index node through the parent nodes.
+        leaf_blocks = [entries[i].block & 0x0FFFFFFF]
+        while True:
+            level = len(path) - 1
+            while level >= 0 and path[level][1] + 1 >= len(path[level][0]):
+                level -= 1
+
+            if level < 0:
+                return leaf_blocks
+
+            entries, i = path[level]
+            if (entries[i + 1].hash & ~1) != name_hash:
+                return leaf_blocks
+
+            path[level][1] = i + 1
+            for child_level in range(level + 1, len(path)):
+                block = reader.read_block(path[child_level - 1][0][path[child_level - 1][1]].block & 0x0FFFFFFF)
+                count = ext4_dx_countlimit.from_buffer_copy(block, ctypes.sizeof(ext4_dir_entry_2)).count
+                path[child_level] = [(ext4_dx_entry * count).from_buffer_copy(block, ctypes.sizeof(ext4_dir_entry_2)), 0]
+
+            entries, i = path[-1]
+            leaf_blocks.append(entries[i].block & 0x0FFFFFFF)
+
     @property
     def is_dir (self):
         """
@@ -788,7 +3151,7 @@ class Inode:
         inode_usage_bitmap_offset = self.volume.group_descriptors[group_idx].bg_inode_bitmap * self.volume.block_size
         inode_usage_byte = self.volume.read(inode_usage_bitmap_offset + bitmap_bit // 8, 1)[0]
 
-        return ((inode_usage_byte >> (7 - bitmap_bit % 8)) & 1) != 0
+        return ((inode_usage_byte >> (bitmap_bit % 8)) & 1) != 0
 
     @property
     def mode_str (self):
@@ -846,54 +3209,258 @@ class Inode:
         if not self.volume.ignore_flags and not self.is_dir:
             raise Ext4Error(f"Inode ({self.inode_idx:d}) is not a directory.")
 
-        # # Hash trees are compatible with linear arrays
-        if (self.inode.i_flags & ext4_inode.EXT4_INDEX_FL) != 0:
-            raise NotImplementedError("Hash trees are not implemented yet.")
+        if self.has_inline_data:
+            # Inline directories store their parent's inode number in the first 4 bytes of i_block instead of "." and ".."
+            # entries, followed by the entries in the rest of i_block and in the system.data extended attribute
+            i_block, continuation = self._inline_data_parts()
+            yield (decode_name(b"."), self.inode_idx, InodeType.DIRECTORY)
+            yield (decode_name(b".."), struct.unpack_from("<I", i_block)[0], InodeType.DIRECTORY)
 
-        # Read raw directory content
-        raw_data = self.open_read().read()
+            for raw_data in (i_block[4:], continuation):
+                for dirent in self._parse_dir_block(raw_data):
+                    yield (decode_name(dirent.name), dirent.inode, dirent.file_type)
+
+            return
+
+        # Hash trees are compatible with linear arrays: their nodes look like unused entries spanning whole blocks.
+        # The directory is streamed block by block, as directory entries never cross block boundaries.
+        reader = self.open_read()
+
+        while True:
+            raw_data = reader.read(self.volume.block_size)
+            if not raw_data:
+                break
+
+            for dirent in self._parse_dir_block(raw_data):
+                yield (decode_name(dirent.name), dirent.inode, dirent.file_type)
+
+    def _parse_dir_block (self, raw_data):
+        """
+        Generator: Yields the used ext4_dir_entry_2 structures of one directory block in their on-disk order. Unused
+        entries (inode 0, e.g. hash tree nodes) and checksum entries are skipped.
+        """
         offset = 0
 
-        while offset < len(raw_data):
+        while offset + ctypes.sizeof(ext4_dir_entry_2) <= len(raw_data):
             dirent = ext4_dir_entry_2._from_buffer_copy(raw_data, offset, platform64 = self.volume.platform64)
 
-            if dirent.file_type != InodeType.CHECKSUM:
-                yield (decode_name(dirent.name), dirent.inode, dirent.file_type)
+            if dirent.rec_len < ctypes.sizeof(ext4_dir_entry_2):
+                raise Ext4Error(f"Invalid directory entry length {dirent.rec_len:d} at offset 0x{offset:X} in a directory block of inode {self.inode_idx:d}.")
+
+            if dirent.inode != 0 and dirent.file_type != InodeType.CHECKSUM:
+                yield dirent
 
             offset += dirent.rec_len
 
-    def open_read (self):
+    @property
+    def block_map (self):
+        """
+        Returns the inode's block mapping as a sorted and stitched list of MappingEntry instances, read from its extent
+        tree or, for inodes without extents, from its indirect blocks. Inodes without blocks (e.g. devices and inline
+        data) have an empty mapping. The mapping is read on first access only. Must not be modified by the caller.
+        """
+        if self._block_map is None:
+            if self.has_inline_data or self.is_fast_symlink:
+                self._block_map = []
+                self._mapping_blocks = []
+            elif (self.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0:
+                self._block_map = self._read_extent_tree()
+            elif self.has_indirect_blocks:
+                self._block_map = self._read_indirect_map()
+            else:
+                self._block_map = []
+                self._mapping_blocks = []
+
+        return self._block_map
+
+    @property
+    def has_indirect_blocks (self):
+        """
+        Indicates whether i_block holds direct and indirect block pointers (ext2/ext3 style), i.e. the inode is a regular
+        file, directory or symbolic link without extents, inline data or fast symbolic link target.
+        """
+        if (self.inode.i_flags & (ext4_inode.EXT4_EXTENTS_FL | ext4_inode.EXT4_INLINE_DATA_FL)) != 0:
+            return False
+
+        file_type = self.inode.i_mode & 0xF000
+        if file_type == ext4_inode.S_IFLNK:
+            return not self.is_fast_symlink
+
+        return file_type in (ext4_inode.S_IFREG, ext4_inode.S_IFDIR)
+
+    @property
+    def has_inline_data (self):
+        """
+        Indicates whether the inode stores its content inline (INLINE_DATA), i.e. in i_block continued by the value of the
+        system.data extended attribute in the inode body.
         """
-        Returns an BlockReader instance for reading this inode's raw content.
+        return (self.inode.i_flags & ext4_inode.EXT4_INLINE_DATA_FL) != 0
+
+    @property
+    def is_fast_symlink (self):
+        """
+        Indicates whether the inode is a fast symbolic link, i.e. a symbolic link without inline data whose target is
+        shorter than i_block and stored there instead of in a data block (same rule as the kernel and e2fsprogs).
+        """
+        return (self.inode.i_mode & 0xF000) == ext4_inode.S_IFLNK and not self.has_inline_data and 0 < len(self) < ext4_inode.i_block.size
+
+    def _raw_inode (self):
+        """
+        Returns the raw on-disk inode (bytes). The buffer the inode was parsed from is used if it was passed on
+        construction, otherwise the inode is read once and kept.
+        """
+        if self._raw is None:
+            self._raw = self.volume.read(self.offset, self.volume.superblock.s_inode_size)
+
+        return self._raw
+
+    def _inline_data_parts (self):
+        """
+        Returns the two parts of the inline content as a tuple (i_block, continuation), where i_block (bytes) are the 60
+        bytes of i_block and continuation (bytes) is the value of the system.data extended attribute in the inode body (empty
+        if there is none). Both are taken from the raw inode, so no blocks are read.
         """
-        if (self.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0:
-            # Obtain mapping from extents
-            mapping = [] # List of MappingEntry instances
+        i_block = self._raw_inode()[ext4_inode.i_block.offset : ext4_inode.i_block.offset + ext4_inode.i_block.size]
+        continuation = next((value for name, value in self.xattrs(check_block = False) if name == "system.data"), b"")
 
-            nodes = queue.Queue()
-            nodes.put_nowait(self.offset + ext4_inode.i_block.offset)
+        return (i_block, continuation)
+
+    @property
+    def inline_data (self):
+        """
+        Returns the content (bytes) stored in the inode itself, i.e. the target of a fast symbolic link or the content of
+        an inode with inline data, truncated to the inode's size.
+        """
+        if self.has_inline_data:
+            i_block, continuation = self._inline_data_parts()
+            return (i_block + continuation)[:len(self)]
+        elif self.is_fast_symlink:
+            return bytes(self.inode.i_block)[:len(self)]
 
-            while nodes.qsize() != 0:
-                header_offset = nodes.get_nowait()
-                header = self.volume.read_struct(ext4_extent_header, header_offset)
+        return b""
 
-                if not self.volume.ignore_magic and header.eh_magic != 0xF30A:
-                    raise MagicError(f"Invalid magic value in extent header at offset 0x{header_offset:X} of inode {self.inode_idx:d}: 0x{header.eh_magic:04X} (expected 0xF30A)")
+    def _read_indirect_map (self):
+        """
+        Reads the direct and (double, triple) indirect block pointers and returns them as a list of MappingEntry
+        instances. Consecutive pointers are stitched while reading.
+        """
+        block_size = self.volume.block_size
+        blocks_count = self.volume.superblock.s_blocks_count
+        pointers_per_block = block_size // 4
+        mapping = [] # List of MappingEntry instances
+        self._mapping_blocks = []
 
-                if header.eh_depth != 0:
-                    indices = self.volume.read_struct(ext4_extent_idx * header.eh_entries, header_offset + ctypes.sizeof(ext4_extent_header))
-                    for idx in indices: nodes.put_nowait(idx.ei_leaf * self.volume.block_size)
+        def add (file_block_idx, disk_block_idx):
+            last = mapping[-1] if mapping else None
+            if last is not None and last.file_block_idx + last.block_count == file_block_idx and last.disk_block_idx + last.block_count == disk_block_idx:
+                last.block_count += 1
+            else:
+                mapping.append(MappingEntry(file_block_idx, disk_block_idx))
+
+        def walk (disk_block_idx, level, file_block_idx):
+            self._mapping_blocks.append(disk_block_idx)
+            pointers = struct.unpack(f"<{pointers_per_block:d}I", self.volume.read(disk_block_idx * block_size, block_size))
+            span = pointers_per_block ** (level - 1) # File blocks per pointer
+
+            for i, pointer in enumerate(pointers):
+                # Pointers beyond the end of the volume are corrupted
+                if pointer == 0 or pointer >= blocks_count:
+                    continue
+                if level == 1:
+                    add(file_block_idx + i, pointer)
                 else:
-                    extents = self.volume.read_struct(ext4_extent * header.eh_entries, header_offset + ctypes.sizeof(ext4_extent_header))
-                    for extent in extents:
-                        mapping.append(MappingEntry(extent.ee_block, extent.ee_start, extent.ee_len))
+                    walk(pointer, level - 1, file_block_idx + i * span)
+
+        i_block = list(self.inode.i_block)
+        for i in range(12):
+            if i_block[i] != 0:
+                add(i, i_block[i])
+
+        file_block_idx = 12
+        for level in range(1, 4):
+            if 0 < i_block[11 + level] < blocks_count:
+                walk(i_block[11 + level], level, file_block_idx)
+            file_block_idx += pointers_per_block ** level
+
+        return mapping
+
+    @property
+    def mapping_blocks (self):
+        """
+        Returns the disk block indices of the blocks holding the inode's mapping outside the inode, i.e. the extent
+        tree's index and leaf nodes or the indirect blocks.
+        """
+        if self._mapping_blocks is None:
+            self._block_map = None
+            self.block_map
+
+        return self._mapping_blocks
+
+    def _read_extent_tree (self):
+        """
+        Walks the inode's extent tree breadth-first and returns its leaves as a list of MappingEntry instances. The root
+        node is taken from the inode already in memory, and child nodes of an index node that are stored in consecutive
+        disk blocks are fetched with a single read.
+        """
+        block_size = self.volume.block_size
+        header_size = ctypes.sizeof(ext4_extent_header)
+        mapping = [] # List of MappingEntry instances
+        self._mapping_blocks = []
+
+        # Tuples (raw node, disk offset of the node)
+        nodes = collections.deque([(bytes(self.inode.i_block), self.offset + ext4_inode.i_block.offset)])
+
+        while nodes:
+            raw, node_offset = nodes.popleft()
+            header = ext4_extent_header.from_buffer_copy(raw)
+
+            if not self.volume.ignore_magic and header.eh_magic != 0xF30A:
+                raise MagicError(f"Invalid magic value in extent header at offset 0x{node_offset:X} of inode {self.inode_idx:d}: 0x{header.eh_magic:04X} (expected 0xF30A)")
+
+            if header_size + header.eh_entries * ctypes.sizeof(ext4_extent) > len(raw):
+                raise Ext4Error(f"Extent node at offset 0x{node_offset:X} of inode {self.inode_idx:d} has too many entries: {header.eh_entries:d}")
 
-            MappingEntry.optimize(mapping)
-            return BlockReader(self.volume, len(self), mapping)
+            if header.eh_depth != 0:
+                indices = (ext4_extent_idx * header.eh_entries).from_buffer_copy(raw, header_size)
+                leaves = sorted(idx.ei_leaf for idx in indices)
+                self._mapping_blocks.extend(leaves)
+
+                # Read runs of consecutive child nodes at once
+                i = 0
+                while i < len(leaves):
+                    j = i + 1
+                    while j < len(leaves) and leaves[j] == leaves[j - 1] + 1:
+                        j += 1
+
+                    raw_run = self.volume.read(leaves[i] * block_size, (j - i) * block_size)
+                    for k in range(i, j):
+                        nodes.append((raw_run[(k - i) * block_size : (k - i + 1) * block_size], leaves[k] * block_size))
+
+                    i = j
+            else:
+                extents = (ext4_extent * header.eh_entries).from_buffer_copy(raw, header_size)
+                for extent in extents:
+                    # ee_len > 32768 marks an uninitialized extent of ee_len - 32768 blocks
+                    unwritten = extent.ee_len > 32768
+                    block_count = extent.ee_len - 32768 if unwritten else extent.ee_len
+                    mapping.append(MappingEntry(extent.ee_block, extent.ee_start, block_count, unwritten))
+
+        MappingEntry.optimize(mapping)
+        return mapping
+
+    def open_read (self):
+        """
+        Returns an BlockReader instance for reading this inode's raw content. Inline data and fast symbolic link targets
+        are served from the inode itself as an io.BytesIO instance, as are inodes without content (e.g. devices).
+        """
+        if self.has_inline_data or self.is_fast_symlink:
+            return io.BytesIO(self.inline_data)
+        elif (self.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0:
+            return BlockReader(self.volume, len(self), self.block_map)
+        elif self.has_indirect_blocks:
+            return BlockReader(self.volume, len(self), self.block_map)
         else:
-            # Inode uses inline data
-            i_block = self.volume.read(self.offset + ext4_inode.i_block.offset, ext4_inode.i_block.size)
-            return io.BytesIO(i_block[:self.inode.i_size])
+            return io.BytesIO(b"")
 
     @property
     def size_readable (self):
@@ -918,12 +3485,12 @@ class Inode:
         will not be verified to contain actual extended attributes and instead is just interpreted as such. prefix_overrides
         is directly passed to Inode._parse_xattrs.
         """
-        # Inline xattrs
-        inline_data_offset = self.offset + ext4_inode.EXT2_GOOD_OLD_INODE_SIZE + self.inode.i_extra_isize
-        inline_data_length = self.offset + self.volume.superblock.s_inode_size - inline_data_offset
+        # Inline xattrs, taken from the raw inode
+        inline_data_offset = ext4_inode.EXT2_GOOD_OLD_INODE_SIZE + self.inode.i_extra_isize
+        inline_data_length = self.volume.superblock.s_inode_size - inline_data_offset
 
         if check_inline and inline_data_length > ctypes.sizeof(ext4_xattr_ibody_header):
-            inline_data = self.volume.read(inline_data_offset, inline_data_length)
+            inline_data = self._raw_inode()[inline_data_offset : inline_data_offset + inline_data_length]
             xattrs_header = ext4_xattr_ibody_header.from_buffer_copy(inline_data)
 
             # TODO Find way to detect inline xattrs without checking the h_magic field to enable error detection with the h_magic field.
@@ -934,26 +3501,48 @@ class Inode:
 
         # xattr block(s)
         if check_block and self.inode.i_file_acl != 0:
-            xattrs_block_start = self.inode.i_file_acl * self.volume.block_size
-            xattrs_block = self.volume.read(xattrs_block_start, self.volume.block_size)
+            # xattr blocks are commonly shared by many inodes (h_refcount), so their parsed contents are cached per volume
+            cache_key = (self.inode.i_file_acl, tuple(sorted(prefix_override.items())))
+            xattrs = self.volume.xattr_cache.get(cache_key) if self.volume.xattr_cache is not None else None
 
-            xattrs_header = ext4_xattr_header.from_buffer_copy(xattrs_block)
-            if not self.volume.ignore_magic and xattrs_header.h_magic != 0xEA020000:
-                raise MagicError(f"Invalid magic value in xattrs block header at offset 0x{xattrs_block_start:X} of inode {self.inode_idx:d}: 0x{xattrs_header.h_magic} (expected 0xEA020000)")
+            if xattrs is None:
+                xattrs = list(self._read_xattr_block(prefix_override))
 
-            if xattrs_header.h_blocks != 1:
-                raise Ext4Error(f"Invalid number of xattr blocks at offset 0x{xattrs_block_start:X} of inode {self.inode_idx:d}: {xattrs_header.h_blocks:d} (expected 1)")
+                if self.volume.xattr_cache is not None:
+                    self.volume.xattr_cache[cache_key] = xattrs
+                    if len(self.volume.xattr_cache) > self.volume.xattr_cache_size:
+                        self.volume.xattr_cache.popitem(last = False)
+            else:
+                self.volume.xattr_cache.move_to_end(cache_key)
 
-            offset = 4 * ((ctypes.sizeof(ext4_xattr_header) + 3) // 4) # The ext4_xattr_entry following the header is aligned on a 4-byte boundary
-            for xattr_name, xattr_value in self._parse_xattrs(xattrs_block[offset:], -offset, prefix_override = prefix_override):
+            for xattr_name, xattr_value in xattrs:
                 yield (xattr_name, xattr_value)
 
+    def _read_xattr_block (self, prefix_override = {}):
+        """
+        Generator: Reads and parses the external xattr block pointed to by i_file_acl and yields the same tuples as
+        Inode.xattrs.
+        """
+        xattrs_block_start = self.inode.i_file_acl * self.volume.block_size
+        xattrs_block = self.volume.read(xattrs_block_start, self.volume.block_size)
+
+        xattrs_header = ext4_xattr_header.from_buffer_copy(xattrs_block)
+        if not self.volume.ignore_magic and xattrs_header.h_magic != 0xEA020000:
+            raise MagicError(f"Invalid magic value in xattrs block header at offset 0x{xattrs_block_start:X} of inode {self.inode_idx:d}: 0x{xattrs_header.h_magic} (expected 0xEA020000)")
+
+        if xattrs_header.h_blocks != 1:
+            raise Ext4Error(f"Invalid number of xattr blocks at offset 0x{xattrs_block_start:X} of inode {self.inode_idx:d}: {xattrs_header.h_blocks:d} (expected 1)")
+
+        offset = 4 * ((ctypes.sizeof(ext4_xattr_header) + 3) // 4) # The ext4_xattr_entry following the header is aligned on a 4-byte boundary
+        for xattr_name, xattr_value in self._parse_xattrs(xattrs_block[offset:], -offset, prefix_override = prefix_override):
+            yield (xattr_name, xattr_value)
+
 
 
 class BlockReader:
     """
     Maps disk blocks into a linear byte stream.
-    NOTE: This class does not implement buffering or caching.
+    NOTE: This class does not implement buffering itself, blocks are cached by the volume's block cache.
     """
 
     # OSError
@@ -976,6 +3565,9 @@ class BlockReader:
         MappingEntry.optimize(block_map)
         self.block_map = block_map
 
+        # Sorted first file blocks of block_map, used for bisecting
+        self._file_block_starts = [entry.file_block_idx for entry in block_map]
+
     def __repr__ (self):
         return f"{type(self).__name__:s}(byte_size = {self.byte_size!r:s}, block_map = {self.block_map!r:s}, volume_uuid = {self.volume.uuid!r:s})"
 
@@ -983,16 +3575,19 @@ class BlockReader:
         """
         Returns the disk block index of the file block specified by file_block_idx.
         """
-        disk_block_idx = None
+        entry = self._find_entry(file_block_idx)
+        return entry.disk_block_idx + (file_block_idx - entry.file_block_idx) if entry is not None else None
 
-        # Find disk block
-        for entry in self.block_map:
-            if entry.file_block_idx <= file_block_idx < entry.file_block_idx + entry.block_count:
-                block_diff = file_block_idx - entry.file_block_idx
-                disk_block_idx = entry.disk_block_idx + block_diff
-                break
+    def _find_entry (self, file_block_idx):
+        """
+        Returns the MappingEntry mapping the file block specified by file_block_idx or None, if it is not mapped.
+        """
+        i = bisect.bisect_right(self._file_block_starts, file_block_idx) - 1
+
+        if i >= 0 and file_block_idx < self.block_map[i].file_block_idx + self.block_map[i].block_count:
+            return self.block_map[i]
 
-        return disk_block_idx
+        return None
 
     def read (self, byte_len = -1):
         """
@@ -1007,34 +3602,58 @@ class BlockReader:
 
         if byte_len == 0: return b""
 
-        # Reading blocks
-        start_block_idx = self.cursor // self.volume.block_size
-        end_block_idx = (self.cursor + byte_len - 1) // self.volume.block_size
-        end_of_stream_check = byte_len
+        result = bytearray(byte_len)
+        self.readinto(result)
+        return bytes(result)
+
+    def readinto (self, buffer):
+        """
+        Reads up to len(buffer) bytes beginning at the cursor's current position into buffer (a writable bytes-like
+        object) and returns the number of bytes read. This operation will not exceed the inode's size. Every physically
+        contiguous run of blocks is read at once, unmapped blocks and blocks of unwritten extents are filled with zeros.
+        """
+        view = memoryview(buffer).cast("B")
+        block_size = self.volume.block_size
+
+        byte_len = max(0, min(len(view), self.byte_size - self.cursor))
+        start = self.cursor
+        end = start + byte_len
+        position = start
 
-        blocks = [self.read_block(i) for i in range(start_block_idx, end_block_idx - start_block_idx + 1)]
+        while position < end:
+            file_block_idx = position // block_size
+            entry = self._find_entry(file_block_idx)
 
-        start_offset = self.cursor % self.volume.block_size
-        if start_offset != 0: blocks[0] = blocks[0][start_offset:]
-        byte_len = (byte_len + start_offset - self.volume.block_size - 1) % self.volume.block_size + 1
-        blocks[-1] = blocks[-1][:byte_len]
+            if entry is not None and entry.unwritten:
+                # Allocated, but never written
+                run_end = min(end, (entry.file_block_idx + entry.block_count) * block_size)
+                view[position - start : run_end - start] = bytes(run_end - position)
+            elif entry is not None:
+                run_end = min(end, (entry.file_block_idx + entry.block_count) * block_size)
+                disk_offset = (entry.disk_block_idx - entry.file_block_idx) * block_size + position
 
-        result = b"".join(blocks)
+                read_len = self.volume.readinto(disk_offset, view[position - start : run_end - start])
+                if read_len != run_end - position:
+                    raise EndOfStreamError(f"The volume's underlying stream ended {run_end - position - read_len:d} bytes before EOF.")
+            else:
+                # Hole up to the next mapped block
+                i = bisect.bisect_right(self._file_block_starts, file_block_idx)
+                run_end = min(end, self.block_map[i].file_block_idx * block_size) if i < len(self.block_map) else end
+                view[position - start : run_end - start] = bytes(run_end - position)
 
-        # Check read
-        if len(result) != end_of_stream_check:
-            raise EndOfStreamError(f"The volume's underlying stream ended {byte_len - len(result):d} bytes before EOF.")
+            position = run_end
 
-        self.cursor += len(result)
-        return result
+        self.cursor = end
+        return byte_len
 
     def read_block (self, file_block_idx):
         """
-        Reads one block from disk (return a zero-block if the file block is not mapped)
+        Reads one block from disk (return a zero-block if the file block is not mapped or unwritten)
         """
-        disk_block_idx = self.get_block_mapping(file_block_idx)
+        entry = self._find_entry(file_block_idx)
 
-        if disk_block_idx != None:
+        if entry != None and not entry.unwritten:
+            disk_block_idx = entry.disk_block_idx + (file_block_idx - entry.file_block_idx)
             return self.volume.read(disk_block_idx * self.volume.block_size, self.volume.block_size)
         else:
             return bytes([0] * self.volume.block_size)
@@ -1064,11 +3683,268 @@ class BlockReader:
 
 
 
+class BlockOwnershipIndex:
+    """
+    Reverse mapping of disk blocks to the inodes owning them. It is built from the extent trees of all used inodes
+    (data blocks, extent tree nodes and xattr blocks) and stored as sorted interval arrays, so that lookups are
+    O(log n). Blocks that do not hold file data (extent tree nodes, xattr blocks) are reported with file block index -1.
+    """
+
+    def __init__ (self, volume):
+        """
+        Builds the index of volume by walking the extent trees of all used inodes.
+        """
+        self.volume = volume
+
+        # Tuples (disk_block_idx, block_count, inode_idx, file_block_idx)
+        intervals = []
+        for inode in volume.iter_inodes():
+            if inode.inode.i_links_count == 0 and inode.inode.i_dtime != 0:
+                continue
+
+            if (inode.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0 or inode.has_indirect_blocks:
+                try:
+                    for entry in inode.block_map:
+                        intervals.append((entry.disk_block_idx, entry.block_count, inode.inode_idx, entry.file_block_idx))
+                    for block_idx in inode.mapping_blocks:
+                        intervals.append((block_idx, 1, inode.inode_idx, -1))
+                except Ext4Error:
+                    # Corrupted extent trees do not own any blocks
+                    pass
+
+            if inode.inode.i_file_acl != 0:
+                intervals.append((inode.inode.i_file_acl, 1, inode.inode_idx, -1))
+
+        intervals.sort()
+
+        self.starts = array.array("Q", (interval[0] for interval in intervals))
+        self.lengths = array.array("Q", (interval[1] for interval in intervals))
+        self.inodes = array.array("L", (interval[2] for interval in intervals))
+        self.file_blocks = array.array("q", (interval[3] for interval in intervals))
+
+    def __len__ (self):
+        """
+        Returns the number of intervals in the index.
+        """
+        return len(self.starts)
+
+    def __repr__ (self):
+        return f"{type(self).__name__:s}(intervals = {len(self)!r:s}, volume_uuid = {self.volume.uuid!r:s})"
+
+    def covered_runs (self):
+        """
+        Generator: Yields the owned disk blocks as sorted, merged tuples (disk_block_idx, block_count).
+        """
+        run_start, run_end = None, None
+
+        for start, length in zip(self.starts, self.lengths):
+            if run_end is not None and start <= run_end:
+                run_end = max(run_end, start + length)
+                continue
+
+            if run_start is not None:
+                yield (run_start, run_end - run_start)
+            run_start, run_end = start, start + length
+
+        if run_start is not None:
+            yield (run_start, run_end - run_start)
+
+    def owner (self, disk_block_idx):
+        """
+        Returns a tuple (inode_idx, file_block_idx) of the inode owning the disk block specified by disk_block_idx or
+        None, if no inode owns it.
+        """
+        i = bisect.bisect_right(self.starts, disk_block_idx) - 1
+
+        if i < 0 or disk_block_idx >= self.starts[i] + self.lengths[i]:
+            return None
+
+        file_block_idx = self.file_blocks[i]
+        return (self.inodes[i], file_block_idx + (disk_block_idx - self.starts[i]) if file_block_idx >= 0 else -1)
+
+    def owners (self, disk_block_indices):
+        """
+        Returns a list with the result of BlockOwnershipIndex.owner for every disk block in disk_block_indices. The
+        queries are answered in one sweep over the sorted index.
+        """
+        result = [None] * len(disk_block_indices)
+        order = sorted(range(len(disk_block_indices)), key = disk_block_indices.__getitem__)
+
+        i = 0
+        for query_idx in order:
+            disk_block_idx = disk_block_indices[query_idx]
+
+            while i + 1 < len(self.starts) and self.starts[i + 1] <= disk_block_idx:
+                i += 1
+
+            if i < len(self.starts) and self.starts[i] <= disk_block_idx < self.starts[i] + self.lengths[i]:
+                file_block_idx = self.file_blocks[i]
+                result[query_idx] = (self.inodes[i], file_block_idx + (disk_block_idx - self.starts[i]) if file_block_idx >= 0 else -1)
+
+        return result
+
+    def unowned_runs (self, runs):
+        """
+        Generator: Takes an iterable of sorted, non-overlapping tuples (disk_block_idx, block_count), e.g. the allocated
+        blocks, and yields the parts of them not owned by any inode as tuples (disk_block_idx, block_count). With
+        bigalloc, an inode owns the whole clusters of its blocks.
+        """
+        if self.volume.cluster_ratio == 1:
+            return subtract_runs(runs, self.covered_runs())
+
+        return subtract_runs(runs, merge_runs(self.volume.cluster_runs(self.covered_runs())))
+
+
+
+# Image mapped by each worker process of Tools.hash_files
+_hash_worker_image = None
+
+def _hash_worker_init (file_name):
+    """
+    Maps the image file_name into the worker process. The mapping is read-only and file-backed, so all workers share the
+    same page cache pages.
+    """
+    global _hash_worker_image
+
+    with open(file_name, "rb") as image:
+        _hash_worker_image = memoryview(mmap.mmap(image.fileno(), 0, access = mmap.ACCESS_READ))
+
+def _hash_worker (task):
+    """
+    Hashes one file from the mapped image. task is a tuple (byte offset of the volume, block size, file size, list of
+    tuples (file_block_idx, disk_block_idx, block_count, unwritten), algorithms). Unwritten extents are hashed as holes.
+    Returns a dictionary {algorithm: hex digest}.
+    """
+    volume_offset, block_size, byte_size, mapping, algorithms = task
+    hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+
+    position = 0
+    for file_block_idx, disk_block_idx, block_count, unwritten in mapping:
+        start = file_block_idx * block_size
+        if start >= byte_size:
+            break
+
+        # Unwritten extents read as zeros, like holes
+        if unwritten:
+            continue
+
+        # Hole before this extent
+        while position < start:
+            zeros = bytes(min(start - position, 1024 * 1024))
+            for hasher in hashers: hasher.update(zeros)
+            position += len(zeros)
+
+        end = min(byte_size, start + block_count * block_size)
+        disk_offset = volume_offset + disk_block_idx * block_size
+        chunk = _hash_worker_image[disk_offset : disk_offset + end - start]
+        if len(chunk) != end - start:
+            raise EndOfStreamError(f"The volume's underlying stream ended {end - start - len(chunk):d} bytes before EOF.")
+
+        for hasher in hashers: hasher.update(chunk)
+        position = end
+
+    # Hole at the end of the file
+    while position < byte_size:
+        zeros = bytes(min(byte_size - position, 1024 * 1024))
+        for hasher in hashers: hasher.update(zeros)
+        position += len(zeros)
+
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(algorithms, hashers)}
+
+
+
 class Tools:
     """
     Provides helpful utility functions
     """
 
+    def hash_files (volume, output = None, algorithms = ("sha256",), jobs = None, root = None):
+        """
+        Computes digests of every regular file below the directory root (default: the volume's root) and writes one JSON
+        object per line (NDJSON) to output (default: sys.stdout):
+
+            {"path": "/dir/file", "inode": 12, "size": 1234, "sha256": "..."}
+
+        algorithms is a sequence of hashlib algorithm names (e.g. "sha256", "md5", "blake2b"). Files are hashed straight
+        from their extent mappings in order of their first disk block, fanned out over a pool of jobs worker processes
+        (default: number of CPUs) that share a read-only mmap of the image. Hard links are hashed once. If the volume's
+        stream is not a named file or jobs is 1, files are hashed in this process through Inode.open_read. Returns the
+        number of lines written.
+        """
+        if output is None:
+            output = sys.stdout
+
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        file_name = getattr(volume.stream, "name", None)
+        use_pool = jobs > 1 and isinstance(file_name, str) and os.path.isfile(file_name)
+
+        # Collect regular files as tuples (first disk block, inode index, inode) and their paths
+        files = {}
+        paths = collections.defaultdict(list)
+        for path, inode in volume.walk(root = root):
+            if (inode.inode.i_mode & 0xF000) != ext4_inode.S_IFREG:
+                continue
+
+            if inode.inode_idx not in files:
+                extents = (inode.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0
+                first_block = inode.block_map[0].disk_block_idx if extents and inode.block_map else 0
+                files[inode.inode_idx] = (first_block, inode.inode_idx, inode)
+
+            paths[inode.inode_idx].append(path)
+
+        schedule = sorted(files.values(), key = lambda item: item[:2])
+
+        def write_lines (inode, digests):
+            count = 0
+            for path in paths[inode.inode_idx]:
+                line = {"path": path, "inode": inode.inode_idx, "size": len(inode)}
+                line.update(digests)
+                output.write(json.dumps(line) + "\n")
+                count += 1
+            return count
+
+        def hash_local (inode):
+            hashers = [hashlib.new(algorithm) for algorithm in algorithms]
+            reader = inode.open_read()
+            buffer = bytearray(4 * 1024 * 1024)
+
+            while True:
+                if isinstance(reader, BlockReader):
+                    chunk_len = reader.readinto(buffer)
+                    chunk = memoryview(buffer)[:chunk_len]
+                else:
+                    chunk = reader.read(len(buffer))
+                    chunk_len = len(chunk)
+
+                if chunk_len == 0:
+                    break
+                for hasher in hashers: hasher.update(chunk)
+
+            return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(algorithms, hashers)}
+
+        count = 0
+
+        if not use_pool:
+            for _, _, inode in schedule:
+                count += write_lines(inode, hash_local(inode))
+            return count
+
+        # Files without extents (e.g. inline data) are hashed locally, they do not map to disk blocks
+        mapped = [inode for _, _, inode in schedule if (inode.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) != 0]
+        for _, _, inode in schedule:
+            if (inode.inode.i_flags & ext4_inode.EXT4_EXTENTS_FL) == 0:
+                count += write_lines(inode, hash_local(inode))
+
+        tasks = ((volume.offset, volume.block_size, len(inode), [tuple(entry) for entry in inode.block_map], tuple(algorithms)) for inode in mapped)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers = jobs, initializer = _hash_worker_init, initargs = (file_name,)) as executor:
+            for inode, digests in zip(mapped, executor.map(_hash_worker, tasks, chunksize = 16)):
+                count += write_lines(inode, digests)
+
+        return count
+
     def list_dir (
         volume,
         identifier,
@@ -0,0 +1,219 @@
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Detect"))
+import Detect
+import ext4
+
+CSUM_SIZE = 12
+
+
+def make_image(path: str, block_size: int, source: str):
+    """
+    Creates a 32 MiB image with metadata_csum, populated from the directory source.
+    """
+    subprocess.run(["mkfs.ext4", "-q", "-F", "-b", str(block_size), "-d", source, path, "32M"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def debugfs(path: str, *commands: str):
+    subprocess.run(["debugfs", "-w", "-f", "-", path], input="\n".join(commands).encode(),
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def rec_len_of(name_len: int):
+    return (8 + name_len + 3) & ~3
+
+
+def chain(block: bytes, end: int):
+    """
+    Returns the directory entries of a block as tuples (offset, inode, rec_len, name_len).
+    """
+    position = 0
+    entries = []
+    while position < end:
+        inode, rec_len, name_len, _ = struct.unpack_from("<IHBB", block, position)
+        entries.append((position, inode, rec_len, name_len))
+        position += rec_len
+    return entries
+
+
+def new_leaf(block_size: int):
+    """
+    An empty leaf block, as ext4_append zeroes new directory blocks.
+    """
+    block = bytearray(block_size)
+    struct.pack_into("<IHBB", block, 0, 0, block_size - CSUM_SIZE, 0, 0)
+    struct.pack_into("<IHBB", block, block_size - CSUM_SIZE, 0, CSUM_SIZE, 0, 0xDE)
+    return block
+
+
+def add_entry(block: bytearray, name: bytes, inode: int):
+    """
+    Inserts an entry like ext4_find_dest_de and ext4_insert_dentry: the first entry with enough
+    space is split, and the padding of the name is not cleared.
+    Returns:
+        False if the block is full
+    """
+    needed = rec_len_of(len(name))
+    for offset, entry_inode, rec_len, name_len in chain(block, len(block) - CSUM_SIZE):
+        used = rec_len_of(name_len) if entry_inode else 0
+        if rec_len - used < needed:
+            continue
+        if entry_inode:
+            struct.pack_into("<H", block, offset + 4, used)
+            offset += used
+            rec_len -= used
+        struct.pack_into("<IHBB", block, offset, inode, rec_len, len(name), 1)
+        block[offset + 8:offset + 8 + len(name)] = name
+        return True
+    return False
+
+
+def split_leaf(data1: bytearray, name_hash, wipe: bool):
+    """
+    Splits a full leaf like do_split: the map of (hash, offset / 4, rec_len) is built at the end of
+    the new block, the upper half of the entries is moved there and the rest is packed.
+    Returns:
+        Tuple (new block, lowest hash of the new block)
+    """
+    block_size = len(data1)
+    data2 = new_leaf(block_size)
+    data2[:block_size - CSUM_SIZE] = bytes(block_size - CSUM_SIZE)
+    count = 0
+    for offset, inode, rec_len, name_len in chain(data1, block_size - CSUM_SIZE):
+        if inode and name_len:
+            count += 1
+            struct.pack_into("<IHH", data2, block_size - 8 * count,
+                             name_hash(bytes(data1[offset + 8:offset + 8 + name_len])), offset >> 2, rec_len)
+    base = block_size - 8 * count
+    sorted_map = sorted(struct.unpack_from("<IHH", data2, base + 8 * i) for i in range(count))
+    for i, entry in enumerate(sorted_map):
+        struct.pack_into("<IHH", data2, base + 8 * i, *entry)
+
+    size = 0
+    move = 0
+    for i in range(count - 1, -1, -1):
+        if size + sorted_map[i][2] // 2 > block_size // 2:
+            break
+        size += sorted_map[i][2]
+        move += 1
+    split = count - move
+    hash2 = sorted_map[split][0]
+
+    # dx_move_dirents reads the map while the moved entries are written over it
+    to = 0
+    last = 0
+    for i in range(split, count):
+        _, offs, _ = struct.unpack_from("<IHH", data2, base + 8 * i)
+        offset = offs << 2
+        rec_len = rec_len_of(data1[offset + 6])
+        data2[to:to + rec_len] = data1[offset:offset + rec_len]
+        struct.pack_into("<H", data2, to + 4, rec_len)
+        struct.pack_into("<I", data1, offset, 0)
+        if wipe:
+            old_rec_len = struct.unpack_from("<H", data1, offset + 4)[0]
+            data1[offset + 6:offset + old_rec_len] = bytes(old_rec_len - 6)
+        last = to
+        to += rec_len
+    struct.pack_into("<H", data2, last + 4, block_size - CSUM_SIZE - last)
+
+    # dx_pack_dirents
+    to = 0
+    last = 0
+    for offset, inode, rec_len, name_len in chain(bytes(data1), block_size - CSUM_SIZE):
+        if inode and name_len:
+            rec_len = rec_len_of(name_len)
+            data1[to:to + rec_len] = data1[offset:offset + rec_len]
+            struct.pack_into("<H", data1, to + 4, rec_len)
+            last = to
+            to += rec_len
+    struct.pack_into("<H", data1, last + 4, block_size - CSUM_SIZE - last)
+
+    for block in (data1, data2):
+        struct.pack_into("<IHBB", block, block_size - CSUM_SIZE, 0, CSUM_SIZE, 0, 0xDE)
+    return data2, hash2
+
+
+def htree_leaves(count: int, block_size: int, name_hash, wipe: bool):
+    """
+    Adds count names to a hash tree directory, splitting full leaves like the kernel.
+    Returns:
+        List of the leaf blocks
+    """
+    # Tuples (lowest hash, leaf block), sorted
+    leaves = [(0, new_leaf(block_size))]
+    for i in range(count):
+        name = ("file_%d" % i).encode()
+        hash_value = name_hash(name)
+        index = max(j for j, (low, _) in enumerate(leaves) if low <= hash_value)
+        if add_entry(leaves[index][1], name, 100 + i):
+            continue
+        new_block, hash2 = split_leaf(leaves[index][1], name_hash, wipe)
+        leaves.insert(index + 1, (hash2, new_block))
+        if hash_value >= hash2:
+            index += 1
+        assert add_entry(leaves[index][1], name, 100 + i)
+    return [block for _, block in leaves]
+
+
+@unittest.skipUnless(shutil.which("mkfs.ext4") and shutil.which("debugfs"), "e2fsprogs is not installed")
+class DirectorySlackTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source")
+        os.makedirs(os.path.join(self.source, "d"))
+        for i in range(40):
+            open(os.path.join(self.source, "d", "file_number_%d" % i), "w").close()
+        self.image = os.path.join(self.directory.name, "image.dd")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def directory_block(self, detect: Detect.Detect):
+        block_idx = detect.volume.root.get_inode("d").block_map[0].disk_block_idx
+        return block_idx * detect.block_size
+
+    def test_kernel_split_htree(self):
+        # 600 names in one directory, as created on a mounted image
+        for block_size in (1024, 4096):
+            make_image(self.image, block_size, self.source)
+            detect = Detect.Detect(self.image, None, False)
+            seed = detect.superblock.s_hash_seed
+            name_hash = lambda name: ext4.dx_hash(name, ext4.ext4_dx_root_info.DX_HASH_HALF_MD4, seed)
+            for wipe in (False, True):
+                leaves = htree_leaves(600, block_size, name_hash, wipe)
+                self.assertGreater(len(leaves), 1)
+                for block in leaves:
+                    self.assertEqual(detect.directory_block_slack(bytes(block), 0), b"")
+
+    def test_deleted_entries(self):
+        make_image(self.image, 1024, self.source)
+        # The first and a middle entry of the block, and a deleted entry reused by a shorter name
+        debugfs(self.image, "rm d/file_number_0", "rm d/file_number_17", "rm d/file_number_39",
+                "rm d/file_number_25", "mknod d/x p")
+        self.assertEqual(Detect.Detect(self.image, None, False).check_directory_slack(), 0)
+
+    def test_hidden_data(self):
+        make_image(self.image, 1024, self.source)
+        debugfs(self.image, "rm d/file_number_17")
+        detect = Detect.Detect(self.image, None, False)
+        offset = self.directory_block(detect)
+        block = detect.pread(detect.block_size, offset)
+        last = chain(block, detect.block_size - CSUM_SIZE)[-1]
+        # Behind the name of the last entry
+        with open(self.image, "r+b") as image:
+            image.seek(offset + last[0] + rec_len_of(last[3]) + 8)
+            image.write(b"secret")
+        detect = Detect.Detect(self.image, ["secret"], False)
+        self.assertEqual(detect.check_directory_slack(), 1)
+        self.assertEqual(detect.techniques, ["directory_slack"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import ctypes
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ext4
+
+
+@unittest.skipUnless(shutil.which("mkfs.ext4") and shutil.which("e2fsck"), "e2fsprogs is not installed")
+class HtreeLookupTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A directory with two levels of index nodes, indexed by e2fsck -D
+        cls.directory = tempfile.TemporaryDirectory()
+        source = os.path.join(cls.directory.name, "source")
+        os.makedirs(os.path.join(source, "d"))
+        first = os.path.join(source, "d", "f")
+        open(first, "w").close()
+        for i in range(6000):
+            os.link(first, os.path.join(source, "d", "entry_with_a_longish_name_%d" % i))
+        cls.image = os.path.join(cls.directory.name, "image.dd")
+        subprocess.run(["mkfs.ext4", "-q", "-F", "-b", "1024", "-O", "^metadata_csum", "-d", source, cls.image, "32M"],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run(["e2fsck", "-fyD", cls.image], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def open_directory(self, image):
+        volume = ext4.Volume(image)
+        return volume, volume.root.get_inode("d")
+
+    def test_lookup(self):
+        with open(self.image, "rb") as image:
+            _, directory = self.open_directory(image)
+            names = [name for name, _, _ in directory.open_dir()]
+            self.assertEqual(len(names), 6003)
+            for name in names:
+                self.assertIsNotNone(directory.lookup(name)[1], name)
+            self.assertEqual(directory.lookup("missing"), (None, None, None))
+
+    def test_collision_across_index_blocks(self):
+        patched = os.path.join(self.directory.name, "collision.dd")
+        shutil.copyfile(self.image, patched)
+        with open(patched, "r+b") as image:
+            volume, directory = self.open_directory(image)
+            reader = directory.open_read()
+            root = reader.read_block(0)
+            dx_info = ext4.ext4_dx_root_info.from_buffer_copy(root, 0x18)
+            self.assertEqual(dx_info.indirect_levels, 1)
+
+            # The root entry of the second index node, and the name with the lowest hash in its first leaf
+            entry_offset = 0x18 + dx_info.info_length + ctypes.sizeof(ext4.ext4_dx_entry)
+            node_idx = ext4.ext4_dx_entry.from_buffer_copy(root, entry_offset).block
+            node = reader.read_block(node_idx)
+            leaf_idx = ext4.ext4_dx_entry.from_buffer_copy(node, ctypes.sizeof(ext4.ext4_dir_entry_2)).block
+            seed = volume.superblock.s_hash_seed
+            name_hash = lambda dirent: ext4.dx_hash(dirent.name, dx_info.hash_version, seed)
+            first = min(directory._parse_dir_block(reader.read_block(leaf_idx)), key=name_hash)
+
+            # Mark the second index node as continuing the hash run of the last leaf of the first one
+            image.seek(reader.get_block_mapping(0) * volume.block_size + entry_offset)
+            image.write(struct.pack("<I", name_hash(first) | 1))
+            image.flush()
+
+            _, directory = self.open_directory(image)
+            self.assertEqual(directory.lookup(first.name.decode())[1], first.inode)
+            self.assertIsNotNone(directory.lookup("..")[1])
+
+
+if __name__ == "__main__":
+    unittest.main()